@@ -5,13 +5,13 @@ Entry point: orchestrates auth, sidebar, and page routing.
 
 import datetime
 import time
-import pandas as pd
 import streamlit as st
 
 from constants import THEMES, CURRENCY_SYMBOLS
 from database import (
-    _gs_read, _gs_update, _gs_invalidate,
-    load_user_settings, apply_dauerauftraege,
+    _gs_read, append_rows, patch_rows, write_batch,
+    load_user_settings, apply_dauerauftraege, maybe_compact, prefetch, refresh,
+    revalidate_stale, remote_version, session_sheets, watched_sheets, sheet, assign_shard, TTL, BackendUnavailable,
 )
 from styling import inject_base_css, inject_theme
 from utils import make_hashes, check_password_strength, is_valid_email, generate_code, send_email, email_html, is_verified
@@ -42,7 +42,7 @@ _DEFAULTS = {
     'email_verify_code': "", 'email_verify_expiry': None, 'email_verify_new': "",
     'theme': 'Ocean Blue',
     'confirm_reset': False, 'confirm_delete_account': False,
-    'tx_page': 0, 'tx_search': "",
+    'tx_page': 0, 'tx_search': "", 'tx_years_back': 0,
     # Onboarding
     'show_onboarding': False, 'onboarding_step': 1,
     'onboarding_theme': 'Ocean Blue', 'onboarding_currency': 'EUR',
@@ -53,11 +53,25 @@ for k, v in _DEFAULTS.items():
 
 inject_base_css()
 
+_BUSY_MSG = "⏳ Google Sheets ist gerade ausgelastet – bitte in ein paar Sekunden neu laden."
+
 # ── Authenticated app ─────────────────────────────────────────
 if st.session_state['logged_in']:
+    # Alle Worksheets der Session parallel vorladen (no-op, wenn schon im Cache; Zeiten im Server-Log)
+    try:
+        _session_sheets = session_sheets(st.session_state['user_name'])
+    except BackendUnavailable:
+        st.warning(_BUSY_MSG)
+        st.stop()
+    prefetch(_session_sheets)
+
     _theme_name    = st.session_state.get('theme', 'Ocean Blue')
     _t             = THEMES.get(_theme_name, THEMES['Ocean Blue'])
-    _user_settings = load_user_settings(st.session_state['user_name'])
+    try:
+        _user_settings = load_user_settings(st.session_state['user_name'])
+    except BackendUnavailable:
+        st.warning(_BUSY_MSG)
+        st.stop()
     _currency_sym  = CURRENCY_SYMBOLS.get(_user_settings.get('currency', 'EUR'), '€')
 
     inject_theme(_t)
@@ -68,9 +82,30 @@ if st.session_state['logged_in']:
     if datetime.date.today().day == 1:
         booked = apply_dauerauftraege(st.session_state['user_name'])
         if booked > 0:
-            _gs_invalidate("transactions")
+            refresh(sheet("transactions", st.session_state['user_name']))
             st.toast(f"✅ {booked} Dauerauftrag/-aufträge gebucht", icon="⚙️")
 
+    # Alte Tombstones ins Archiv verschieben (läuft im Hintergrund, höchstens einmal pro Tag)
+    maybe_compact()
+
+    # ── Hintergrund-Abgleich ──────────────────────────────────
+    # Seiten lesen immer sofort aus dem Cache; dieses Fragment stößt den Abgleich
+    # abgelaufener Worksheets an und rerunt, sobald dabei neue Daten angekommen sind.
+    if st.session_state.pop('_remote_toast', False):
+        st.toast("Neue Daten geladen", icon="🔄")
+
+    @st.fragment(run_every=max(TTL, 5) if TTL > 0 else None)
+    def _watch_remote():
+        # Geladene Jahres-Partitionen gehören dazu – Änderungen anderer Prozesse kommen sonst nie an
+        revalidate_stale(watched_sheets(st.session_state['user_name']))
+        seen = st.session_state.setdefault('_remote_seen', remote_version())
+        if remote_version() > seen:
+            st.session_state['_remote_seen']  = remote_version()
+            st.session_state['_remote_toast'] = True
+            st.rerun()
+
+    _watch_remote()
+
     # ── Onboarding-Dialog (nur beim ersten Login) ─────────────
     if st.session_state.get('show_onboarding'):
         onboarding_dialog(st.session_state['user_name'])
@@ -112,8 +147,6 @@ if st.session_state['logged_in']:
         )
         st.markdown("<div style='height:28vh;'></div>", unsafe_allow_html=True)
         if st.button("Logout ➜", use_container_width=True, type="secondary"):
-            for k in [k for k in st.session_state if k.startswith("_gs_cache_")]:
-                del st.session_state[k]
             st.session_state['logged_in'] = False
             st.rerun()
 
@@ -127,17 +160,22 @@ if st.session_state['logged_in']:
     st.session_state['_last_menu'] = menu
 
     # ── Page routing ──────────────────────────────────────────
+    # Alle Schreibzugriffe eines Durchlaufs werden gesammelt und vor dem Rerun gebündelt geschrieben
     user_name = st.session_state['user_name']
-    if menu == "📈 Dashboard":
-        page_dashboard.render(user_name, _user_settings, _t, _currency_sym)
-    elif menu == "💸 Transaktionen":
-        page_transactions.render(user_name, _currency_sym)
-    elif menu == "📂 Analysen":
-        page_analytics.render(user_name, _currency_sym)
-    elif menu == "🪣 Spartöpfe":
-        page_savings_pots.render(user_name, _currency_sym)
-    elif menu == "⚙️ Einstellungen":
-        page_settings.render(user_name, _user_settings, _theme_name, _t, _currency_sym)
+    try:
+        with write_batch():
+            if menu == "📈 Dashboard":
+                page_dashboard.render(user_name, _user_settings, _t, _currency_sym)
+            elif menu == "💸 Transaktionen":
+                page_transactions.render(user_name, _currency_sym)
+            elif menu == "📂 Analysen":
+                page_analytics.render(user_name, _currency_sym)
+            elif menu == "🪣 Spartöpfe":
+                page_savings_pots.render(user_name, _currency_sym)
+            elif menu == "⚙️ Einstellungen":
+                page_settings.render(user_name, _user_settings, _theme_name, _t, _currency_sym)
+    except BackendUnavailable:
+        st.warning(_BUSY_MSG)
 
 # ── Auth ──────────────────────────────────────────────────────
 else:
@@ -234,15 +272,16 @@ else:
                     elif code_input.strip() != st.session_state['verify_code']:
                         st.error("❌ Falscher Code.")
                     else:
-                        df_u  = _gs_read("users")
-                        new_u = pd.DataFrame([{
+                        # Neue Accounts landen im Shard mit den wenigsten Usern ('' = primär, ohne Spalte)
+                        shard = assign_shard()
+                        append_rows("users", [{
                             **st.session_state['pending_user'],
                             "verified": "True",
                             "token": "",
                             "token_expiry": "",
                             "onboarding_done": "",   # leer = noch nicht abgeschlossen
+                            **({"shard": shard} if shard else {}),
                         }])
-                        _gs_update("users", pd.concat([df_u, new_u], ignore_index=True))
                         st.session_state.update({'pending_user': {}, 'verify_code': "", 'verify_expiry': None, 'auth_mode': 'login'})
                         st.success("✅ E-Mail verifiziert! Du kannst dich jetzt einloggen.")
             if st.button("Zum Login", use_container_width=True, type="primary"):
@@ -294,8 +333,7 @@ else:
                             df_u = _gs_read("users")
                             idx  = df_u[df_u['email'] == st.session_state['reset_email']].index
                             if not idx.empty:
-                                df_u.loc[idx[0], 'password'] = make_hashes(pw_neu)
-                                _gs_update("users", df_u)
+                                patch_rows("users", [idx[0]], {'password': make_hashes(pw_neu)})
                             st.session_state.update({'reset_email': "", 'reset_code': "", 'reset_expiry': None, 'auth_mode': 'login'})
                             st.success("✅ Passwort geändert! Du kannst dich jetzt einloggen.")
                             st.rerun()
@@ -0,0 +1,178 @@
+"""
+Rechenkern der Analysen-Seite – ohne Streamlit, damit testbar und messbar.
+
+daily() gruppiert die typisierten Buchungen eines Users einmal nach (Tag, Typ, Kategorie).
+Alle Ansichten der Seite (Zeitraum, Ø 12 Monate, Wochentage, Heatmap, Spar-Potenzial)
+werden danach aus diesem kleinen, nach Tag sortierten Aggregat per date_slice() geschnitten.
+Prognose und Sparziel rechnen auf den Monatssummen aus database.month_summary().
+
+Benchmark:  python analytics_engine.py --rows 20000 --repeat 20
+"""
+import calendar
+import datetime
+import pandas as pd
+
+from schema import by_date, date_slice, month_range, normalize
+
+DAILY_COLUMNS = ['tag', 'typ', 'kategorie', 'betrag', 'betrag_abs', 'anzahl']
+WEEKDAYS      = ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
+
+
+# ── Tagesaggregat ────────────────────────────────────────────
+
+def daily(df):
+    """Ein Durchlauf über die Rohzeilen: Summe, Betragssumme und Anzahl je (Tag, Typ, Kategorie)."""
+    if df.empty or 'datum_dt' not in df.columns:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+    betrag = df['betrag']
+    keys   = [df['datum_dt'].dt.normalize().rename('tag'), df['typ'].astype(str), df['kategorie']]
+    g = (pd.DataFrame({'betrag': betrag, 'betrag_abs': betrag.abs()})
+         .groupby(keys, dropna=False, sort=False)
+         .agg(betrag=('betrag', 'sum'), betrag_abs=('betrag_abs', 'sum'), anzahl=('betrag', 'count'))
+         .reset_index())
+    return by_date(g[g['tag'].notna()], 'tag').reset_index(drop=True)
+
+
+def _ausgaben(dk, start=None, end=None):
+    d = date_slice(dk, start, end, 'tag')
+    return d[d['typ'] == 'Ausgabe']
+
+
+def _months(dk):
+    return max(dk['tag'].dt.to_period('M').nunique(), 1)
+
+
+def period(dk, start, end):
+    """Summen je (Typ, Kategorie) zwischen start und end (jeweils inklusive) – Spalten wie month_summary."""
+    d = date_slice(dk, start, pd.Timestamp(end) + pd.Timedelta(days=1), 'tag')
+    return d.groupby(['typ', 'kategorie'], as_index=False)[['betrag', 'betrag_abs']].sum()
+
+
+def kategorie_avg(dk, now, days=365):
+    """Ø Ausgaben je Kategorie und Monat der letzten `days` Tage, aufsteigend sortiert."""
+    d = _ausgaben(dk, now - datetime.timedelta(days=days))
+    s = d.groupby('kategorie')['betrag_abs'].sum() / _months(d)
+    return s.rename('betrag').reset_index().sort_values('betrag', ascending=True)
+
+
+def weekdays(dk, now, days=365):
+    """Ø Betrag einer Ausgabe je Wochentag (Mo–So), None ohne Ausgaben im Zeitraum."""
+    d = _ausgaben(dk, now - datetime.timedelta(days=days))
+    if d.empty:
+        return None
+    g = d.groupby(d['tag'].dt.weekday)[['betrag_abs', 'anzahl']].sum()
+    s = (g['betrag_abs'] / g['anzahl']).reindex(range(7)).fillna(0)
+    s.index = WEEKDAYS
+    return s
+
+
+def heatmap(dk, year, month):
+    """Ausgaben je Tag des Monats {tag: summe}."""
+    d = _ausgaben(dk, *month_range(year, month))
+    return d.groupby(d['tag'].dt.day)['betrag_abs'].sum()
+
+
+def hist_avg(dk, now, days=90):
+    """Ø Ausgaben je Kategorie und Monat der letzten `days` Tage ohne den laufenden Monat, None ohne Daten."""
+    start, end = month_range(now.year, now.month)
+    d = pd.concat([_ausgaben(dk, now - datetime.timedelta(days=days), start), _ausgaben(dk, end)])
+    if d.empty:
+        return None
+    return d.groupby('kategorie')['betrag_abs'].sum() / _months(d)
+
+
+# ── Monatssummen ─────────────────────────────────────────────
+
+def typ_sum(summ, typ, col='betrag'):
+    # Summe eines Typs aus den Monatssummen
+    return float(summ.loc[summ['typ'] == typ, col].sum())
+
+
+def by_kategorie(summ, typ, col='betrag'):
+    return (summ[summ['typ'] == typ][['kategorie', col]].rename(columns={col: 'betrag'})
+            .sort_values('betrag', ascending=False))
+
+
+def forecast(curr, now):
+    """Hochrechnung der Ausgaben des laufenden Monats auf das Monatsende."""
+    day   = now.day
+    days  = calendar.monthrange(now.year, now.month)[1]
+    ein   = typ_sum(curr, 'Einnahme')
+    aus   = typ_sum(curr, 'Ausgabe', 'betrag_abs')
+    dep   = typ_sum(curr, 'Depot')
+    sp    = typ_sum(curr, 'Spartopf')
+    rate  = aus / day if day > 0 else 0
+    return {
+        'tag': day, 'tage': days, 'rest_tage': days - day, 'tagesrate': rate,
+        'rest': rate * (days - day), 'bank': ein - aus - dep + sp, 'prognose': ein - rate * days - dep + sp,
+        'fortschritt': day / days * 100,
+    }
+
+
+def potenzial(curr, avg, schwelle=1.1):
+    """Kategorien, in denen der laufende Monat mehr als schwelle × Ø liegt, nach Mehrausgabe sortiert."""
+    now_kat = by_kategorie(curr, 'Ausgabe', 'betrag_abs').set_index('kategorie')['betrag']
+    rows = []
+    for kat, akt in now_kat.items():
+        ref = avg.get(kat, 0)
+        if ref > 0 and akt > ref * schwelle:
+            rows.append({'kategorie': kat, 'aktuell': akt, 'durchschn': ref,
+                         'diff_pct': (akt - ref) / ref * 100, 'diff_eur': akt - ref})
+    return sorted(rows, key=lambda x: x['diff_eur'], reverse=True)
+
+
+def savings(curr):
+    """Monatsbilanz fürs Sparziel – gespart zählt Spartopf-Einzahlungen und Depot mit."""
+    ein     = typ_sum(curr, 'Einnahme')
+    aus     = typ_sum(curr, 'Ausgabe', 'betrag_abs')
+    dep     = typ_sum(curr, 'Depot')
+    einzahl = abs(typ_sum(curr, 'Spartopf', 'betrag_neg'))
+    bank    = ein - aus - dep + typ_sum(curr, 'Spartopf')
+    return {'einnahmen': ein, 'ausgaben': aus, 'depot': dep, 'toepfe': einzahl, 'gespart': bank + einzahl + abs(dep)}
+
+
+# ── Benchmark ────────────────────────────────────────────────
+
+def _frame(rows, seed=0):
+    import random
+    rng   = random.Random(seed)
+    today = pd.Timestamp.today().normalize()
+    return normalize('transactions', pd.DataFrame({
+        'user':      'user1',
+        'datum':     [str((today - pd.Timedelta(days=rng.randrange(730))).date()) for _ in range(rows)],
+        'typ':       [rng.choice(['Einnahme', 'Ausgabe', 'Ausgabe', 'Depot', 'Spartopf']) for _ in range(rows)],
+        'kategorie': [rng.choice(['🍔 Essen', '🏠 Miete', '💼 Gehalt', '📦 ETF', '🚗 Auto']) for _ in range(rows)],
+        'betrag':    [round(rng.uniform(-200, 200), 2) for _ in range(rows)],
+    }))
+
+
+def _bench():
+    import argparse
+    import time
+    p = argparse.ArgumentParser(description="Analysen-Rechenkern messen")
+    p.add_argument('--rows', type=int, default=20000)
+    p.add_argument('--repeat', type=int, default=20)
+    a = p.parse_args()
+
+    df  = _frame(a.rows)
+    now = datetime.datetime.now()
+    dk  = daily(df)
+    print(f"{a.rows} Zeilen → {len(dk)} Tagesaggregate")
+
+    def timed(label, fn):
+        t0 = time.perf_counter()
+        for _ in range(a.repeat):
+            fn()
+        print(f"{label:<28} {(time.perf_counter() - t0) / a.repeat * 1000:10.2f} ms")
+
+    week = now.date() - datetime.timedelta(days=now.weekday())
+    timed("daily (ein Durchlauf)", lambda: daily(df))
+    timed("period (Woche)", lambda: period(dk, week, week + datetime.timedelta(days=6)))
+    timed("kategorie_avg", lambda: kategorie_avg(dk, now))
+    timed("weekdays", lambda: weekdays(dk, now))
+    timed("heatmap", lambda: heatmap(dk, now.year, now.month))
+    timed("hist_avg", lambda: hist_avg(dk, now))
+
+
+if __name__ == "__main__":
+    _bench()
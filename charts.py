@@ -0,0 +1,168 @@
+"""
+Plotly-Diagramme der Seiten mit Figure-Cache.
+
+Die Builder sind reine Funktionen ihrer Aggregate (plus Währung/Farben). cached() hasht
+die Argumente und liefert bei einem Treffer die fertige Figure aus einem LRU-Cache – ein
+Rerun wegen Suchfeld oder Popover baut dann kein go.Figure neu auf.
+Gespeichert wird die Figure selbst, nicht ihr JSON: st.plotly_chart validiert übergebene
+dicts komplett neu und wäre damit langsamer als ein erneuter Aufbau.
+"""
+import collections
+import hashlib
+import threading
+import pandas as pd
+import plotly.graph_objects as go
+
+FIGURE_CACHE_SIZE = 128
+
+_figures = collections.OrderedDict()   # (builder, fingerprint) → go.Figure
+_lock    = threading.Lock()
+_stats   = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+# ── Cache ────────────────────────────────────────────────────
+
+def _feed(h, v):
+    if isinstance(v, (pd.DataFrame, pd.Series)):
+        h.update(repr(list(v.columns) if isinstance(v, pd.DataFrame) else v.name).encode())
+        h.update(pd.util.hash_pandas_object(v, index=True).values.tobytes())
+    elif isinstance(v, (list, tuple)):
+        h.update(f"[{len(v)}".encode())
+        for x in v:
+            _feed(h, x)
+    elif isinstance(v, dict):
+        _feed(h, sorted(v.items(), key=repr))
+    else:
+        h.update(repr(v).encode())
+    h.update(b"|")
+
+
+def fingerprint(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        _feed(h, p)
+    return h.hexdigest()
+
+
+def cached(build, *args):
+    """build(*args) aus dem Cache oder neu bauen und ablegen."""
+    key = (build.__name__, fingerprint(*args))
+    with _lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            _figures.move_to_end(key)
+            _stats['hits'] += 1
+            return fig
+        _stats['misses'] += 1
+    fig = build(*args)
+    with _lock:
+        _figures[key] = fig
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+            _stats['evictions'] += 1
+    return fig
+
+
+def stats():
+    with _lock:
+        return dict(_stats, size=len(_figures))
+
+
+# ── Builder ──────────────────────────────────────────────────
+
+def donut(cats, vals, colors, center, center_color):
+    fig = go.Figure(go.Pie(
+        labels=cats, values=vals, hole=0.60,
+        marker=dict(colors=colors, line=dict(color="rgba(5,10,20,0.9)", width=2)),
+        textinfo="none", hoverinfo="none", direction="clockwise", sort=False, rotation=90,
+    ))
+    fig.update_traces(hovertemplate=None)
+    fig.update_layout(
+        paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", showlegend=False,
+        margin=dict(t=10, b=10, l=10, r=10), height=240, autosize=True, dragmode=False,
+        annotations=[dict(
+            text=f"<b>{center}</b>", x=0.5, y=0.5, showarrow=False,
+            font=dict(size=15, color=center_color, family="DM Sans, sans-serif"), xref="paper", yref="paper",
+        )],
+    )
+    return fig
+
+
+def bank_donut(cats, vals, colors, bank_str, bank_color, sub):
+    fig = go.Figure(go.Pie(
+        labels=cats, values=vals, hole=0.62,
+        marker=dict(colors=colors, line=dict(color="rgba(5,10,20,0.8)", width=2)),
+        textinfo="none", hoverinfo="none", direction="clockwise", sort=False, rotation=90,
+    ))
+    fig.update_layout(
+        paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", showlegend=False,
+        margin=dict(t=20, b=20, l=20, r=20), height=380, autosize=True,
+        annotations=[
+            dict(text="BANK", x=0.5, y=0.62, showarrow=False,
+                 font=dict(size=10, color="#334155", family="DM Mono, monospace"), xref="paper", yref="paper"),
+            dict(text=f"<b>{bank_str}</b>", x=0.5, y=0.50, showarrow=False,
+                 font=dict(size=22, color=bank_color, family="DM Sans, sans-serif"), xref="paper", yref="paper"),
+            dict(text=sub, x=0.5, y=0.38, showarrow=False,
+                 font=dict(size=11, color="#334155", family="DM Sans, sans-serif"), xref="paper", yref="paper"),
+        ],
+    )
+    return fig
+
+
+def kategorie_bars(kat_grp, colors, currency_sym):
+    fig = go.Figure(go.Bar(
+        x=kat_grp['betrag'], y=kat_grp['kategorie'], orientation='h',
+        marker=dict(color=colors, cornerradius=6),
+        text=[f"Ø {v:,.0f} {currency_sym}" for v in kat_grp['betrag']],
+        textposition='inside', insidetextanchor='middle',
+        textfont=dict(size=11, color='rgba(255,255,255,0.85)', family='DM Mono, monospace'),
+        hovertemplate=None,
+    ))
+    fig.update_traces(hovertemplate=None)
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+        height=280, margin=dict(t=0, b=0, l=0, r=10), dragmode=False,
+        xaxis=dict(showgrid=False, showticklabels=False, showline=False, fixedrange=True),
+        yaxis=dict(tickfont=dict(size=12, color='#94a3b8', family='DM Sans, sans-serif'), showgrid=False, showline=False, fixedrange=True, automargin=True),
+    )
+    return fig
+
+
+def weekday_bars(heat, currency_sym):
+    fig = go.Figure(go.Bar(
+        x=list(heat.index), y=heat.values,
+        marker=dict(color=heat.values, colorscale=[[0, '#1a0505'], [0.5, '#dc2626'], [1, '#ff5232']], showscale=False, cornerradius=6),
+        text=[f"{v:,.0f} {currency_sym}" if v > 0 else "" for v in heat.values],
+        textposition='inside', insidetextanchor='middle',
+        textfont=dict(size=10, color='rgba(255,255,255,0.7)', family='DM Mono, monospace'),
+        hovertemplate=None,
+    ))
+    fig.update_traces(hovertemplate=None)
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+        height=280, margin=dict(t=0, b=0, l=0, r=0), dragmode=False,
+        xaxis=dict(tickfont=dict(size=13, color='#94a3b8', family='DM Sans, sans-serif'), showgrid=False, showline=False, fixedrange=True),
+        yaxis=dict(showgrid=False, showticklabels=False, showline=False, fixedrange=True),
+    )
+    return fig
+
+
+def networth(verlauf, currency_sym):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=verlauf["datum"], y=verlauf["gesamt"], name="Gesamt", mode="lines",
+        line=dict(color="#4ade80", width=2), fill="tozeroy", fillcolor="rgba(74,222,128,0.08)",
+    ))
+    fig.add_trace(go.Scatter(x=verlauf["datum"], y=verlauf["depot"], name="Depot", mode="lines",
+                             line=dict(color="#38bdf8", width=1.5)))
+    fig.add_trace(go.Scatter(x=verlauf["datum"], y=verlauf["toepfe"], name="Spartöpfe", mode="lines",
+                             line=dict(color="#a78bfa", width=1.5)))
+    fig.update_layout(
+        paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", height=280,
+        margin=dict(t=10, b=10, l=10, r=10), hovermode="x unified",
+        legend=dict(orientation="h", y=1.08, font=dict(size=11, color="#94a3b8", family="DM Sans, sans-serif")),
+        xaxis=dict(showgrid=False, tickfont=dict(size=11, color="#475569", family="DM Mono, monospace")),
+        yaxis=dict(gridcolor="rgba(148,163,184,0.06)", ticksuffix=f" {currency_sym}",
+                   tickfont=dict(size=11, color="#475569", family="DM Mono, monospace")),
+    )
+    return fig
@@ -1,70 +1,1786 @@
+import collections
+import contextlib
 import datetime
+import logging
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
 
+import ledger
+import schema
 from constants import TOPF_PALETTE
+from scheduler import BackendUnavailable, ScheduledBackend, create_scheduler
+from snapshot import create_store
+from storage import create_backend
+from wal import create_wal
 
-conn = st.connection("gsheets", type=GSheetsConnection)
+
+log = logging.getLogger(__name__)
+
+
+def _storage_config():
+    try:
+        return dict(st.secrets.get("storage", {}))
+    except Exception:
+        return {}
+
+
+# Jeder Backend-Call läuft über den Scheduler (Singleflight, Token-Bucket, Retries)
+_backend  = create_backend(_storage_config())
+scheduler = create_scheduler(_storage_config(), default_rate=0 if _backend.name == 'sqlite' else 60)
+backend   = ScheduledBackend(_backend, scheduler)
+
+# Fehler in den Daten selbst (fehlende Spalten, kaputte Werte) – Backend-Fehler wie
+# BackendUnavailable gehen dagegen bis zur Seite durch, statt leere Daten vorzutäuschen
+DATA_ERRORS = (KeyError, ValueError, TypeError, IndexError, AttributeError)
+
+# Copy-on-Write: _gs_read gibt flache Sichten auf den Cache aus; kopiert wird
+# erst, wenn ein Aufrufer tatsächlich schreibt (ab pandas 3 immer aktiv).
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 
 # ── GSheet Cache ─────────────────────────────────────────────
+# Prozessweit geteilt: alle Sessions lesen dieselbe Kopie je Worksheet.
+# Jeder Schreibzugriff erhöht die Datenversion, damit andere Sessions
+# die Änderung sofort sehen.
+
+_cache_lock = threading.RLock()
+_write_lock = threading.RLock()
+_cache      = {}   # ws → (version, DataFrame)
+_index      = {}   # ws → {spalte: {wert: [Zeilenpositionen]}}
+_cube       = {}   # ws → (version, Monats-Aggregate), siehe month_summary()
+_balances   = {}   # ws → (version, Kontostand-Index), siehe balance_at()
+_version    = 0
+_PART_COL   = {'users': 'username'}
+ID_SHEETS   = ('transactions', 'toepfe', 'dauerauftraege')
+# Eindeutiger Schlüssel je Zeile (Default: id) – daran erkennt ein wiederholtes Append angekommene Zeilen.
+# Ledger-Zeilen teilen sich die id der betroffenen Zeile, eindeutig ist dort nur der Event-key;
+# users, categories, goals und settings haben keine id, aber je User bzw. Kategorie nur eine Zeile.
+ROW_KEYS    = {'ledger': ('key',), 'users': ('username',), 'categories': ('user', 'typ', 'kategorie'),
+               'goals': ('user',), 'settings': ('user',)}
+
+
+def new_id():
+    """Kollisionsfreie ID (UUID4 mit Bindestrichen – Sheets liest sie nie als Zahl)."""
+    return str(uuid.uuid4())
+
+
+# ── Shards ───────────────────────────────────────────────────
+# Mit storage.shards verteilen sich die User auf mehrere Spreadsheets. Alle Daten eines
+# Users liegen in seinem Shard (Worksheet-Namen wie 'transactions@s1', siehe ShardedBackend);
+# users bleibt im primären Spreadsheet und führt die Zuordnung in der Spalte shard
+# ('' = primär). Ohne Shards ist jeder Name der alte – am Verhalten ändert sich nichts.
+
+SHARDS      = list(getattr(_backend, 'shards', ['']))
+USER_SHEETS = ('transactions', 'toepfe', 'goals', 'settings', 'dauerauftraege', 'categories')
+
+
+def _base(ws):
+    return ws.partition('@')[0]
+
+
+def _shard(ws):
+    return ws.partition('@')[2]
+
+
+def _on(ws, shard):
+    return f"{_base(ws)}@{shard}" if shard else _base(ws)
+
+
+def shard_of(user):
+    """Shard eines Users laut users-Sheet ('' = primäres Spreadsheet)."""
+    if len(SHARDS) == 1:
+        return ''
+    row = user_rows("users", user)
+    if row.empty or 'shard' not in row.columns or pd.isna(row['shard'].iloc[-1]):
+        return ''
+    shard = str(row['shard'].iloc[-1]).strip()
+    if shard not in SHARDS:
+        raise BackendUnavailable(f"Shard '{shard}' von {user} ist nicht konfiguriert")
+    return shard
+
+
+def sheet(ws, user):
+    """Worksheet ws im Shard des Users."""
+    return _on(ws, shard_of(user))
+
+
+def _user_shards():
+    # Aktive User → Shard
+    df = _gs_read("users")
+    if df.empty or 'username' not in df.columns:
+        return pd.Series(dtype=object)
+    if 'deleted' in df.columns:
+        df = df[~schema.is_flag(df['deleted'])]
+    shard = df['shard'].fillna('').astype(str).str.strip() if 'shard' in df.columns else pd.Series('', index=df.index)
+    return pd.Series(shard.values, index=df['username'].astype(str).values)
+
+
+def shard_load():
+    """Aktive User je Shard."""
+    counts = _user_shards().value_counts()
+    return {s: int(counts.get(s, 0)) for s in SHARDS}
+
+
+def assign_shard():
+    """Shard für einen neuen Account – der mit den wenigsten aktiven Usern."""
+    if len(SHARDS) == 1:
+        return ''
+    load = shard_load()
+    return min(SHARDS, key=lambda s: load[s])
+
+
+# Typisierte Snapshots auf der Platte – Kaltstarts lesen diese statt des ganzen Sheets
+def _snapshot_entry(ws):
+    # Cache-Stand plus Abgleich-Stand – damit gleicht ein Kaltstart aus dem Snapshot korrekt ab
+    entry = _cache.get(ws)
+    if entry is None:
+        return None
+    return entry + ({'marker': _markers.get(ws), 'full_at': _full_at.get(ws)},)
+
+
+_snapshots  = create_store(_storage_config(), _snapshot_entry, default_on=backend.name != 'sqlite')
+_load_locks = {}
+
+
+def _store(ws, df, index=None, persist=True):
+    # Ohne index werden die Schlüssel-Indizes beim nächsten Zugriff neu aufgebaut
+    global _version
+    with _cache_lock:
+        _version += 1
+        _cache[ws] = (_version, df)
+        _index[ws] = index or {}
+        if _is_partition(ws):
+            _touch_partition(ws)
+    if persist and _snapshots:
+        _snapshots.schedule(ws)
+
+
+def _cached(ws):
+    entry = _cache.get(ws)
+    if entry is None:
+        # Pro Worksheet lädt nur ein Thread, alle anderen warten auf dessen Ergebnis
+        with _cache_lock:
+            lock = _load_locks.setdefault(ws, threading.Lock())
+        source = None
+        with lock:
+            entry = _cache.get(ws)
+            if entry is None:
+                snap   = _snapshots.load(ws) if _snapshots else None
+                source = 'backend' if snap is None else 'snapshot'
+                if snap is not None:
+                    df, sync = snap
+                    if sync.get('full_at'):
+                        _full_at[ws] = sync['full_at']
+                    _mark(ws, tuple(sync['marker']) if sync.get('marker') is not None else None)
+                else:
+                    if _wal and _wal.pending(ws):
+                        # Backend erst auf den Stand des Journals bringen
+                        _wal.replay()
+                    # Marke vor dem Read: ein Write dazwischen fällt beim nächsten Abgleich auf
+                    marker = backend.marker(ws)
+                    df = schema.normalize(ws, backend.read(ws))
+                    if _base(ws) in ledger.SHEETS:
+                        df = _fold_ledger(ws, df)
+                    _fetched[ws] = time.monotonic()
+                    _full_at[ws] = time.time()
+                    _mark(ws, marker)
+                _store(ws, df, persist=source == 'backend')
+                entry = _cache[ws]
+        if source == 'snapshot':
+            # Snapshot sofort ausliefern, im Hintergrund inkrementell abgleichen
+            _revalidate_async(ws)
+        elif source == 'backend' and _base(ws) in ID_SHEETS:
+            _backfill_ids(ws, entry[1])
+            entry = _cache[ws]
+    if _is_partition(ws):
+        _touch_partition(ws)
+        _trim_partitions(keep=ws)
+    return entry[1]
+
+
+# ── Stale-While-Revalidate ───────────────────────────────────
+# Lesezugriffe bekommen immer sofort den Cache. Ist ein Worksheet älter als
+# storage.ttl_seconds (60, 0 = aus), gleicht ein Hintergrund-Thread es ab;
+# brachte das neue Daten, steigt remote_version() und die Seite rerunt.
+
+TTL             = float(_storage_config().get('ttl_seconds', 60))
+FULL_REFRESH    = float(_storage_config().get('full_refresh_seconds', 600))
+_fetched        = {}      # ws → letzter Abgleich mit dem Backend (monotonic)
+_full_at        = {}      # ws → letzter vollständiger Read (time.time())
+_markers        = {}      # ws → Änderungsmarke des Backends, deren Stand der Cache vollständig kennt
+_revalidating   = set()
+_remote_version = 0
+
+
+def _mark(ws, marker):
+    with _cache_lock:
+        if marker is None:
+            _markers.pop(ws, None)
+        else:
+            _markers[ws] = marker
+
+
+def _synced(ws, result):
+    # Eigener Write ist angekommen: Marke nur mitziehen, wenn dazwischen niemand sonst geschrieben hat
+    if not isinstance(result, tuple) or len(result) != 2:
+        return
+    before, after = result
+    with _cache_lock:
+        if ws in _markers and _markers[ws] == before:
+            _markers[ws] = after
+
+
+def _change(ws, marker):
+    """
+    Was sich seit dem letzten Abgleich im Backend getan hat: 'none', 'tail' (nur angehängt)
+    oder 'full' (Zeilen geändert, gelöscht oder neu geschrieben). Ohne Änderungszähler (Sheets)
+    bleibt es beim Tail-Abgleich, alle storage.full_refresh_seconds (600, 0 = nie) wird komplett gelesen.
+    """
+    if FULL_REFRESH > 0 and time.time() - _full_at.get(ws, 0) >= FULL_REFRESH:
+        return 'full'
+    if marker is None:
+        return 'tail'
+    known = _markers.get(ws)
+    if known is None or marker[0] != known[0]:
+        return 'full'
+    return 'none' if marker == known else 'tail'
+
+
+def _revalidate_async(ws):
+    with _cache_lock:
+        if ws in _revalidating:
+            return
+        _revalidating.add(ws)
+    threading.Thread(target=_revalidate, args=(ws,), daemon=True).start()
+
+
+def _revalidate(ws):
+    global _remote_version
+    try:
+        if refresh(ws) != 'none':
+            with _cache_lock:
+                _remote_version += 1
+    except Exception:
+        # Backend nicht erreichbar: der Cache bleibt bis zum nächsten Abgleich gültig
+        pass
+    finally:
+        with _cache_lock:
+            _revalidating.discard(ws)
+
+
+def _maybe_revalidate(ws):
+    if TTL > 0 and ws in _cache and time.monotonic() - _fetched.get(ws, 0) >= TTL:
+        _revalidate_async(ws)
+
+
+def revalidate_stale(wss):
+    """Stößt den Abgleich aller abgelaufenen Worksheets an (blockiert nicht), siehe watched_sheets()."""
+    for ws in wss:
+        _maybe_revalidate(ws)
+
+
+def remote_version():
+    """Zähler für Änderungen, die per Hintergrund-Abgleich (nicht durch eigene Writes) kamen."""
+    return _remote_version
+
+
+def _backfill_ids(ws, df):
+    # Altbestand ohne (oder mit doppelter) ID bekommt einmalig eine neue
+    if len(df) == 0:
+        return
+    if 'id' not in df.columns:
+        _gs_update(ws, df.assign(id=[new_id() for _ in range(len(df))]))
+        return
+    ids  = df['id'].astype(str).str.strip()
+    keys = df.index[df['id'].isna() | ids.isin(['', 'nan']) | ids.duplicated()]
+    if len(keys) and _base(ws) in ledger.SHEETS:
+        # Ledger-Events adressieren Zeilen über die ID – fehlende IDs direkt in einen Checkpoint
+        fixed = df['id'].astype(object)
+        fixed[keys] = [new_id() for _ in keys]
+        _gs_update(ws, df.assign(id=fixed))
+        return
+    with write_batch():
+        for k in keys:
+            patch_rows(ws, [k], {'id': new_id()})
+
+
+def data_version(ws=None):
+    """Aktuelle Datenversion – global oder die des gecachten Worksheets (0 = nicht geladen)."""
+    if ws is None:
+        return _version
+    entry = _cache.get(ws)
+    return entry[0] if entry else 0
+
 
 def _gs_read(ws):
-    k = f"_gs_cache_{ws}"
-    if k not in st.session_state:
-        st.session_state[k] = conn.read(worksheet=ws, ttl=0)
-    return st.session_state[k].copy()
+    """Schreibgeschützte Sicht auf den Cache – Änderungen des Aufrufers kopieren lazy (CoW)."""
+    df = _cached(ws)
+    _maybe_revalidate(ws)
+    with _cache_lock:
+        return df.copy(deep=False)
+
+
+def _lookup(ws, df, col):
+    # wert → Positionen im gecachten Frame; einmal pro Laden aufgebaut, bei Writes fortgeschrieben
+    index = _index.setdefault(ws, {})
+    m = index.get(col)
+    if m is None:
+        if col not in df.columns:
+            m = {}
+        elif 'datum_dt' in df.columns:
+            # Positionen je Wert nach Datum – user_rows() liefert Buchungen dann schon sortiert
+            order = df['datum_dt'].values.argsort(kind='stable')
+            m = {k: order[pos].tolist() for k, pos in df.iloc[order].groupby(col, sort=False).indices.items()}
+        else:
+            m = {k: list(pos) for k, pos in df.groupby(col, sort=False).indices.items()}
+        index[col] = m
+    return m
+
+
+def _lookup_cached(ws, col):
+    # Frame und Index atomar greifen; geladen wird nie unter dem Cache-Lock
+    _cached(ws)
+    _maybe_revalidate(ws)
+    while True:
+        with _cache_lock:
+            entry = _cache.get(ws)
+            if entry is not None:
+                return entry[1], _lookup(ws, entry[1], col)
+        _cached(ws)
+
+
+def user_rows(ws, user):
+    """Alle Zeilen eines Users – Lookup über die Partition statt Scan über alle User."""
+    df, m = _lookup_cached(ws, _PART_COL.get(_base(ws), 'user'))
+    pos   = m.get(user)
+    return df.take(pos) if pos else df.iloc[0:0]
+
+
+def rows_by_id(ws, ids, user=None):
+    """Index-Labels der Zeilen mit diesen IDs (optional nur die des Users) über den ID-Index."""
+    df, m = _lookup_cached(ws, 'id')
+    pos   = [p for i in ids for p in m.get(str(i), [])]
+    if user is not None:
+        pos = [p for p in pos if df['user'].iat[p] == user]
+    return list(df.index[pos])
+
+
+def _live(df):
+    return df[~df['deleted'].astype(bool)] if 'deleted' in df.columns and len(df) else df
+
+
+def load_user_transactions(user, since=None):
+    """
+    Nicht gelöschte Buchungen eines Users ab since (date/Timestamp, None = gesamte Historie),
+    aufsteigend nach datum_dt – Zeiträume daraus mit schema.date_slice() schneiden.
+    Jahres-Partitionen vor dem Live-Zeitraum werden nur geladen, wenn since in sie hineinreicht.
+    """
+    shard = shard_of(user)
+    df    = _live(user_rows(_on("transactions", shard), user))
+    years = [y for y in partition_years(shard) if since is None or y >= pd.Timestamp(since).year]
+    if not years:
+        return schema.by_date(df)
+    parts = [_live(user_rows(_partition(y, shard), user)) for y in years] + [df]
+    out   = parts[0]
+    for part in parts[1:]:
+        out = schema.concat(out, part)
+    return schema.by_date(out.reset_index(drop=True))
 
 
 def _gs_update(ws, df):
-    conn.update(worksheet=ws, data=df)
-    st.session_state[f"_gs_cache_{ws}"] = df.copy()
+    df = schema.normalize(ws, df.reset_index(drop=True))
+    _submit('write', ws, df)
+    _store(ws, df)
+    if _base(ws) in ledger.SHEETS:
+        _checkpoint(ws)
 
 
 def _gs_invalidate(*wss):
+    global _version
+    _flush_pending(wss)
+    with _cache_lock:
+        for ws in wss:
+            _cache.pop(ws, None)
+            _index.pop(ws, None)
+            _cube.pop(ws, None)
+            _balances.pop(ws, None)
+            _last_ops.pop(ws, None)
+            if _snapshots:
+                _snapshots.drop(ws)
+        _version += 1
+
+
+# ── Prefetch ─────────────────────────────────────────────────
+# Nach dem Login alle Worksheets der Session parallel laden: ein Round-Trip statt fünf bis sechs.
+# partitions gehört dazu – jede Seite fragt partition_years() im Shard des Users ab.
+
+SESSION_SHEETS = ('settings', 'transactions', 'toepfe', 'goals', 'dauerauftraege', 'categories', 'partitions')
+_prefetch_stats = {'runs': 0, 'sheets': 0, 'wall': 0.0, 'serial': 0.0}
+
+
+def session_sheets(user):
+    """SESSION_SHEETS im Shard des Users."""
+    shard = shard_of(user)
+    return tuple(_on(ws, shard) for ws in SESSION_SHEETS)
+
+
+def watched_sheets(user):
+    """Session-Sheets plus Jahres-Partitionen im Shard des Users – was der Hintergrund-Abgleich prüft."""
+    shard = shard_of(user)
+    return session_sheets(user) + tuple(_partition(y, shard) for y in partition_years(shard))
+
+
+def prefetch(wss=SESSION_SHEETS):
+    """
+    Lädt alle noch nicht gecachten Worksheets gleichzeitig. Gibt wall/serial-Zeiten (s) zurück und
+    loggt sie (INFO) – nach dem Login sieht man so im Server-Log, was der parallele Prefetch spart.
+    """
+    todo = [ws for ws in wss if ws not in _cache]
+    if not todo:
+        return {'sheets': 0, 'wall': 0.0, 'serial': 0.0}
+
+    def load(ws):
+        t0 = time.perf_counter()
+        try:
+            _cached(ws)
+        except Exception:
+            pass   # Fehler tauchen beim eigentlichen Zugriff wieder auf
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+        serial = sum(pool.map(load, todo))
+    result = {'sheets': len(todo), 'wall': time.perf_counter() - t0, 'serial': serial}
+    log.info("Prefetch: %d Worksheets in %.0f ms (seriell %.0f ms)",
+             result['sheets'], result['wall'] * 1000, result['serial'] * 1000)
+    with _cache_lock:
+        _prefetch_stats['runs'] += 1
+        for k in ('sheets', 'wall', 'serial'):
+            _prefetch_stats[k] += result[k]
+    return result
+
+
+def prefetch_stats():
+    """Summierte Prefetch-Zeiten: wall (parallel) gegenüber serial (Summe der Einzel-Loads)."""
+    with _cache_lock:
+        return dict(_prefetch_stats)
+
+
+# ── Zeilen-Operationen ───────────────────────────────────────
+
+def append_rows(ws, rows):
+    """Hängt Zeilen an und lädt nur diese hoch. Gibt die neuen Index-Labels zurück."""
+    new = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    if new.empty:
+        return []
+    if _base(ws) in ID_SHEETS:
+        ids = new['id'] if 'id' in new.columns else pd.Series('', index=new.index)
+        new = new.assign(id=[i if isinstance(i, str) and i.strip() else new_id() for i in ids])
+    with _write_lock:
+        df = _cached(ws)
+        if _base(ws) in ledger.SHEETS:
+            _record_created(ws, new)
+        if len(df.columns) == 0 or not set(new.columns) <= set(df.columns):
+            # Neue Spalten ändern den Header – dann bleibt nur der komplette Upload
+            full = pd.concat([df, new], ignore_index=True)
+            _gs_update(ws, full)
+            return list(range(len(full) - len(new), len(full)))
+        start     = int(df.index.max()) + 1 if len(df) else 0
+        new       = schema.normalize(ws, new.reindex(columns=df.columns))
+        new.index = pd.RangeIndex(start, start + len(new))
+        if _base(ws) not in ledger.SHEETS:
+            _submit('append', ws, new)
+        _extend(ws, df, new)
+        return list(new.index)
+
+
+def _extend(ws, df, new):
+    # Neue Zeilen an den Cache hängen und die Schlüssel-Indizes fortschreiben
+    with _cache_lock:
+        index = {}
+        for col, m in _index.get(ws, {}).items():
+            m = index[col] = dict(m)
+            for i, k in enumerate(new[col] if col in new.columns else [], len(df)):
+                if not pd.isna(k):
+                    m[k] = m.get(k, []) + [i]
+        version = data_version(ws)
+        _store(ws, schema.concat(df, new) if len(df) else new, index)
+        _derived_apply(ws, version, add=new)
+
+
+def _derived_apply(ws, version, add=None, remove=None):
+    # Aus den Zeilen abgeleitete Strukturen (Monats-Würfel, Kontostand-Index, letzte Aktionen) fortschreiben
+    _cube_apply(ws, version, add, remove)
+    _balance_apply(ws, version, add, remove)
+    _ops_apply(ws, version, add, remove)
+
+
+def _same_row(ws, a, b):
+    cols = schema.stored_columns(a.columns)
+    a, b = (schema.serialize(ws, x.reindex(columns=cols)).iloc[0] for x in (a, schema.normalize(ws, b)))
+    return all(('' if pd.isna(x) else str(x)) == ('' if pd.isna(y) else str(y)) for x, y in zip(a, b))
+
+
+def refresh(ws):
+    """
+    Inkrementeller Abgleich: lädt nur Zeilen hinter der High-Water-Mark (Zeilenzahl im Cache).
+    Zeigt der Änderungszähler des Backends Edits an beliebiger Stelle, folgt ein vollständiger
+    Read, steht er still, gar keiner (siehe _change). Die letzte bekannte Zeile wird mitgelesen –
+    weicht sie ab (Edit, Kompaktierung) oder ist das Sheet geschrumpft, folgt ebenfalls ein
+    vollständiger Read. Gibt 'full', 'none' oder 'tail' zurück.
+    """
+    started = time.monotonic()
+    result  = _refresh(ws)
+    _fetched[ws] = started
+    return result
+
+
+def _refresh(ws):
+    if _base(ws) in ledger.SHEETS:
+        return _refresh_ledger(ws)
+    _flush_pending((ws,))
+    with _write_lock:
+        if ws not in _cache:
+            _cached(ws)
+            return 'full'
+        if _wal and _wal.pending(ws):
+            # Cache ist dem Backend voraus, bis das Journal eingespielt ist
+            return 'none'
+        marker = backend.marker(ws)
+        change = _change(ws, marker)
+        if change != 'tail':
+            return _reload(ws) if change == 'full' else 'none'
+        df   = _cached(ws)
+        hwm  = len(df)
+        tail = backend.read_tail(ws, max(hwm - 1, 0))
+        if hwm and (tail.empty or not _same_row(ws, df.iloc[[-1]], tail.iloc[[0]])):
+            return _reload(ws)
+        tail = tail.iloc[1:] if hwm else tail
+        if not set(tail.columns) <= set(df.columns):
+            return _reload(ws)
+        _mark(ws, marker)
+        if tail.empty:
+            return 'none'
+        new       = schema.normalize(ws, tail.reindex(columns=df.columns))
+        new.index = pd.RangeIndex(hwm, hwm + len(new))
+        _extend(ws, df, new)
+        if _base(ws) in ID_SHEETS and new['id'].isna().any():
+            _backfill_ids(ws, _cache[ws][1])
+        return 'tail'
+
+
+def _reload(ws):
+    _gs_invalidate(ws)
+    _cached(ws)
+    return 'full'
+
+
+def patch_rows(ws, keys, changes, event=None, ref=''):
+    """
+    Setzt `changes` (Spalte → Wert) in den Zeilen `keys` (Index-Labels aus _gs_read).
+    event überschreibt den Ledger-Event-Typ (Default: 'deleted' bzw. 'edited').
+    """
+    keys = [k for k in keys]
+    if not keys or not changes:
+        return
+    changes = schema.cast_changes(ws, changes)
+    with _write_lock:
+        df = _cached(ws)
+        if _base(ws) in ledger.SHEETS or _is_partition(ws):
+            _record_patch(ws, df, keys, changes, event, ref)
+        if any(c not in df.columns for c in changes):
+            full = df.copy(deep=False)
+            for c, v in changes.items():
+                if c not in full.columns:
+                    full[c] = ''
+                full[c] = full[c].astype(object)
+                full.loc[keys, c] = v
+            _gs_update(ws, full)
+            return
+        if _base(ws) not in ledger.SHEETS:
+            _submit('patch_many', ws, [(keys, dict(changes))], list(df.columns))
+        with _cache_lock:
+            version = data_version(ws)
+            before  = df.loc[keys] if ws in _cube or ws in _balances else None
+            for c, v in changes.items():
+                try:
+                    df.loc[keys, c] = v
+                except (TypeError, ValueError):
+                    df[c] = df[c].astype(object)
+                    df.loc[keys, c] = v
+            # Positionen bleiben gleich – nur Indizes über geänderte Spalten verfallen
+            _store(ws, df, {col: m for col, m in _index.get(ws, {}).items() if col not in changes})
+            if before is not None:
+                _derived_apply(ws, version, add=df.loc[keys], remove=before)
+
+
+# ── Write-Behind ─────────────────────────────────────────────
+# Innerhalb von write_batch() landen Backend-Schreibzugriffe in einer Queue;
+# der Cache ist sofort aktuell. Am Blockende (auch bei st.rerun) wird pro
+# Worksheet zusammengefasst und – mit Write-Ahead-Log – als ein Batch ins
+# Journal geschrieben, sonst direkt und parallel ins Backend.
+
+_batch       = threading.local()
+_queued      = collections.Counter()   # ws → Operationen in offenen write_batch()-Queues aller Threads
+_write_stats = {'flushes': 0, 'ops': 0, 'calls': 0, 'saved': 0}
+
+
+def _serialize(kind, ws, args):
+    # Erst hier werden Cache-dtypes zu Zellwerten (abgeleitete Spalten fallen weg)
+    if kind == 'patch_many':
+        patches, columns = args
+        return ([(keys, schema.serialize_changes(ws, changes)) for keys, changes in patches],
+                schema.stored_columns(columns))
+    return (schema.serialize(ws, args[0]),)
+
+
+def _call(kind, ws, args):
+    _synced(ws, getattr(backend, kind)(ws, *_serialize(kind, ws, args)))
+
+
+def _row_key(ws):
+    # Archive haben den Schlüssel ihrer Basis (ledger_archive → key)
+    base = _base(ws)
+    return ROW_KEYS.get(base[:-len('_archive')] if base.endswith('_archive') else base, ('id',))
+
+
+def _key_values(df, cols):
+    return pd.Series(list(zip(*(df[c].fillna('').astype(str).str.strip() for c in cols))), index=df.index)
+
+
+def _replay(kind, ws, args, retry):
+    if retry and kind == 'append':
+        # Der letzte Versuch ist mit unklarem Ausgang abgebrochen – schon angekommene Zeilen nicht doppelt anhängen
+        cols = _row_key(ws)
+        if not set(cols) <= set(args[0].columns):
+            # Ohne Schlüssel nicht entscheidbar – lieber als tote Operation melden als doppelt anhängen
+            raise ValueError(f"Append auf {ws} ohne Spalten {cols} nicht sicher wiederholbar")
+        have = backend.read(ws)
+        have = set(_key_values(have, cols)) if set(cols) <= set(have.columns) else set()
+        args = (args[0][~_key_values(args[0], cols).isin(have)],)
+        if args[0].empty:
+            return
+    _synced(ws, getattr(backend, kind)(ws, *args))
+
+
+def _diverged(ws):
+    # Cache ist dem Backend voraus und holt es nicht mehr ein – neu laden statt falsche Daten zu zeigen
+    with _cache_lock:
+        _cache.pop(ws, None)
+        _index.pop(ws, None)
+        if _snapshots:
+            _snapshots.drop(ws)
+
+
+_wal = create_wal(_storage_config(), _replay, _diverged, default_on=backend.name != 'sqlite')
+if _wal and _snapshots:
+    # Snapshots sind eventuell älter als die noch offenen Operationen eines abgestürzten Prozesses
+    for _ws in _wal.recovered():
+        _snapshots.drop(_ws)
+
+
+def _submit(kind, ws, *args):
+    ops = getattr(_batch, 'ops', None)
+    if ops is not None:
+        ops.append((kind, ws, args))
+        with _cache_lock:
+            _queued[ws] += 1
+    elif _wal:
+        _wal.append([(kind, ws, _serialize(kind, ws, args))])
+    else:
+        _call(kind, ws, args)
+
+
+def _coalesce(ops):
+    # Ein vollständiger Upload macht alles davor überflüssig
+    writes = [i for i, (kind, _, _) in enumerate(ops) if kind == 'write']
+    if writes:
+        ops = ops[writes[-1]:]
+    calls = []
+    for kind, ws, args in ops:
+        prev = calls[-1] if calls else None
+        if prev and prev[0] == 'write' and kind == 'append':
+            calls[-1] = ('write', ws, (pd.concat([prev[2][0], args[0]]),))
+        elif prev and prev[0] == 'write' and kind == 'patch_many':
+            df = prev[2][0].copy(deep=False)
+            for keys, changes in args[0]:
+                for c, v in changes.items():
+                    if c not in df.columns:
+                        df[c] = ''
+                    df[c] = df[c].astype(object)
+                    df.loc[keys, c] = v
+            calls[-1] = ('write', ws, (df,))
+        elif prev and prev[0] == kind == 'append':
+            calls[-1] = ('append', ws, (pd.concat([prev[2][0], args[0]]),))
+        elif prev and prev[0] == kind == 'patch_many' and prev[2][1] == args[1]:
+            calls[-1] = ('patch_many', ws, (prev[2][0] + args[0], args[1]))
+        else:
+            calls.append((kind, ws, args))
+    return calls
+
+
+def _flush(ops):
+    plan = {}
+    for op in ops:
+        plan.setdefault(op[1], []).append(op)
+    plan  = {ws: _coalesce(group) for ws, group in plan.items()}
+    calls = sum(len(c) for c in plan.values())
+    if _wal:
+        # Ein Batch, eine Transaktion: Multi-Sheet-Vorgänge kommen ganz oder gar nicht an
+        _wal.append([(kind, ws, _serialize(kind, ws, args)) for ws in plan for kind, _, args in plan[ws]])
+        with _cache_lock:
+            _write_stats['flushes'] += 1
+            _write_stats['ops']     += len(ops)
+            _write_stats['calls']   += calls
+            _write_stats['saved']   += len(ops) - calls
+        return len(ops) - calls
+
+    def run(ws):
+        for kind, _, args in plan[ws]:
+            _call(kind, ws, args)
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        futures = {ws: pool.submit(run, ws) for ws in plan}
+    for ws, f in futures.items():
+        if f.exception() is not None:
+            errors[ws] = f.exception()
+    with _cache_lock:
+        _write_stats['flushes'] += 1
+        _write_stats['ops']     += len(ops)
+        _write_stats['calls']   += calls
+        _write_stats['saved']   += len(ops) - calls
+    for ws in errors:
+        _diverged(ws)
+    if errors:
+        raise next(iter(errors.values()))
+    return len(ops) - calls
+
+
+def _unqueue(ops):
+    with _cache_lock:
+        _queued.subtract(op[1] for op in ops)
+        for ws in {op[1] for op in ops}:
+            if _queued[ws] <= 0:
+                del _queued[ws]
+    if any(_is_partition(op[1]) for op in ops):
+        # Während des Batches zurückgehaltene Partitionen jetzt verdrängen
+        _trim_partitions()
+
+
+def _flush_pending(wss):
+    ops = getattr(_batch, 'ops', None)
+    if ops:
+        due = [op for op in ops if op[1] in wss]
+        if due:
+            _batch.ops = [op for op in ops if op[1] not in wss]
+            try:
+                _flush(due)
+            finally:
+                _unqueue(due)
+
+
+@contextlib.contextmanager
+def write_batch():
+    """Unit of Work: sammelt alle Schreibzugriffe des Blocks und schreibt sie einmal gebündelt."""
+    if getattr(_batch, 'ops', None) is not None:
+        yield
+        return
+    _batch.ops = []
+    _batch.op  = new_id()
+    try:
+        yield
+    finally:
+        ops, _batch.ops, _batch.op = _batch.ops, None, None
+        if ops:
+            try:
+                _flush(ops)
+            finally:
+                _unqueue(ops)
+
+
+def write_stats():
+    """Zähler des Write-Behind: Operationen, tatsächliche Backend-Calls, gesparte Round-Trips und offene Journal-Einträge."""
+    with _cache_lock:
+        stats = dict(_write_stats)
+    if _wal:
+        stats.update(pending=_wal.pending(), replayed=_wal.stats['replayed'], dead=_wal.stats['dead'])
+    return stats
+
+
+# ── Ledger ───────────────────────────────────────────────────
+# Buchungen und Spartöpfe werden nur noch als Events ans Ledger angehängt (siehe ledger.py);
+# transactions/toepfe im Backend sind Checkpoints, die checkpoint() periodisch neu schreibt.
+# Alle Events eines write_batch() teilen eine op-ID – das ist die Einheit fürs Undo.
+# Jeder Shard hat sein eigenes Ledger; Events tragen den Worksheet-Namen ohne Shard.
+# Nach einem Checkpoint wandern Events, die alle Checkpoints schon enthalten, nach
+# ledger_archive; im Ledger bleiben die letzten storage.ledger_keep_events (500) fürs
+# Undo und state_at(). Das Ledger lädt mit transactions/toepfe, nicht als eigenes Session-Sheet.
+# Jahres-Partitionen schreiben direkt ins Backend; Änderungen an ihren Zeilen kommen trotzdem als
+# Events ins Ledger (ws = transactions_<jahr>) – eingefaltet werden sie nie, sie dienen nur dem Undo.
+
+_folded     = {}   # ws → Ledger-Position, bis zu der Events im Cache eingefaltet sind
+_last_ops   = {}   # Ledger-ws → (version, {user: [op-IDs]}, {zurückgenommene op-IDs}), siehe last_op()
+LEDGER_KEEP = int(_storage_config().get('ledger_keep_events', 500))
+UNDOABLE  = ('created', 'edited', 'deleted', 'pot_deposit', 'pot_withdraw')
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _op():
+    return getattr(_batch, 'op', None) or new_id()
+
+
+def _ledger(ws):
+    return _on(ledger.SHEET, _shard(ws))
+
+
+def _emit(ws, events):
+    start = len(_cached(_ledger(ws)))
+    append_rows(_ledger(ws), events)
+    # Eigene Events sind schon im Cache – beim nächsten Abgleich nicht erneut einfalten
+    if _folded.get(ws) == start:
+        _folded[ws] = start + len(events)
+
+
+def _record_created(ws, new):
+    ts, op = _now(), _op()
+    _emit(ws, [ledger.event(_base(ws), 'created', r.get('id', ''), r.get('user', ''), ts, op,
+                            data={k: v for k, v in r.items() if not pd.isna(v)})
+               for r in schema.serialize(ws, new).to_dict('records')])
+
+
+def _record_patch(ws, df, keys, changes, type=None, ref=''):
+    if type is None:
+        type = 'deleted' if changes.get('deleted') is True else 'edited'
+    data   = schema.serialize_changes(ws, changes)
+    # Spalten, die der Patch erst anlegt, waren vorher leer – auch das muss das Undo zurücknehmen
+    before = schema.serialize(ws, df.loc[keys].reindex(columns=list(data))).to_dict('index')
+    ts, op = _now(), _op()
+    _emit(ws, [ledger.event(_base(ws), type, df.at[k, 'id'], df.at[k, 'user'], ts, op, ref,
+                            data=data, before=before.get(k, {}))
+               for k in keys])
+
+
+def _fold_ledger(ws, df, start=None):
+    # Events seit dem letzten Checkpoint (bzw. ab start) in den materialisierten Stand einfalten
+    events = _cached(_ledger(ws))
+    if start is None:
+        start = ledger.last_checkpoint(events, _base(ws)) + 1
+    df, _ = ledger.fold(_base(ws), df, events.iloc[start:])
+    _folded[ws] = len(events)
+    return df
+
+
+def _refresh_ledger(ws):
+    # Checkpoint-Sheets ändern sich nur über das Ledger – dessen Tail reicht für den Abgleich
+    with _write_lock:
+        if ws not in _cache:
+            _cached(ws)
+            return 'full'
+        if _change(ws, backend.marker(ws)) == 'full':
+            # Checkpoint am Ledger vorbei geändert (anderer Prozess, Hand-Edit) oder Zeit für einen vollständigen Read
+            return _reload(ws)
+        full   = _refresh(_ledger(ws)) == 'full'
+        events = _cached(_ledger(ws))
+        start  = None if full else _folded.get(ws)
+        if start is None:
+            start = ledger.last_checkpoint(events, _base(ws)) + 1
+        df, n = ledger.fold(_base(ws), _cached(ws), events.iloc[start:])
+        _folded[ws] = len(events)
+        if not n:
+            return 'none'
+        _store(ws, df)
+        return 'tail'
+
+
+def _checkpoint(ws):
+    # Erst den Stand schreiben, dann das Checkpoint-Event – nie umgekehrt
+    _flush_pending((ws,))
+    _emit(ws, [ledger.event(_base(ws), 'checkpoint', ts=_now(), op=_op())])
+    _folded[ws] = len(_cached(_ledger(ws)))
+
+
+def checkpoint(ws, min_events=None):
+    """
+    Schreibt den materialisierten Stand von ws als neuen Checkpoint, sobald seit dem letzten
+    min_events (Default: storage.checkpoint_events, 200) Events aufgelaufen sind.
+    Gibt die Zahl der eingefalteten Events zurück (0 = kein Checkpoint nötig).
+    """
+    if min_events is None:
+        min_events = int(_storage_config().get('checkpoint_events', 200))
+    with _write_lock:
+        refresh(ws)
+        events = _cached(_ledger(ws))
+        since  = events.iloc[ledger.last_checkpoint(events, _base(ws)) + 1:]
+        n      = int((since['ws'] == _base(ws)).sum()) if len(since) else 0
+        if n < max(min_events, 1):
+            return 0
+        _gs_update(ws, _cached(ws))
+        _roll_ledger(_shard(ws))
+    return n
+
+
+def _covered(events, ws):
+    # Ledger-Position, vor der alle Events von ws im letzten Checkpoint stecken
+    if events.empty:
+        return 0
+    last = ledger.last_checkpoint(events, ws)
+    mine = events.index[(events['ws'] == ws) & (events['type'] != 'checkpoint') & (events.index > last)]
+    return int(mine[0]) if len(mine) else len(events)
+
+
+def _roll_ledger(shard=''):
+    """
+    Verschiebt Events vor den letzten LEDGER_KEEP, die alle Checkpoints schon enthalten, nach
+    ledger_archive und schreibt das Ledger gekürzt neu. Hält ein Sheet ohne frischen Checkpoint
+    das Kürzen auf, bekommt es vorher einen. Gibt die Zahl der archivierten Events zurück.
+    """
+    ws = _on(ledger.SHEET, shard)
+    with _write_lock:
+        events = _cached(ws)
+        target = len(events) - max(LEDGER_KEEP, 0)
+        if target <= 0:
+            return 0
+        for s in ledger.SHEETS:
+            if _covered(events, s) < target:
+                refresh(_on(s, shard))
+                _gs_update(_on(s, shard), _cached(_on(s, shard)))
+        events = _cached(ws)
+        cut    = min([target] + [_covered(events, s) for s in ledger.SHEETS])
+        ops    = events['op'].astype(str).values
+        while 0 < cut < len(ops) and ops[cut - 1] == ops[cut]:
+            # Eine Aktion nie zerteilen – sonst nähme das Undo nur ihren Rest zurück
+            cut -= 1
+        if cut <= 0:
+            return 0
+        _archive(_on(ledger.SHEET + '_archive', shard), events.iloc[:cut])
+        _gs_update(ws, events.iloc[cut:])
+        for s in ledger.SHEETS:
+            if _on(s, shard) in _folded:
+                _folded[_on(s, shard)] = max(_folded[_on(s, shard)] - cut, 0)
+    return cut
+
+
+def _ops_add(users, undone, events):
+    # Rückgängig machbare Aktionen je User in Ledger-Reihenfolge; undo-Events erledigen ihre op
+    if events.empty or 'op' not in events.columns:
+        return
+    for type, user, op, ref in zip(events['type'], events['user'], events['op'].astype(str), events['ref']):
+        if type == 'undo':
+            undone.add(str(ref))
+        elif type in UNDOABLE:
+            ops = users.setdefault(user, [])
+            if not ops or ops[-1] != op:
+                ops.append(op)
+
+
+def _ops_apply(ws, version, add=None, remove=None):
+    # Index der letzten Aktionen um angehängte Events fortschreiben
+    entry = _last_ops.get(ws)
+    if entry is None:
+        return
+    if entry[0] != version or remove is not None:
+        _last_ops.pop(ws, None)
+        return
+    if add is not None:
+        _ops_add(entry[1], entry[2], add)
+    _last_ops[ws] = (_cache[ws][0], entry[1], entry[2])
+
+
+def last_op(user):
+    """
+    op-ID der letzten noch nicht rückgängig gemachten Aktion des Users (oder None). Der Index
+    dahinter wird einmal pro Laden des Ledgers aufgebaut und beim Anhängen fortgeschrieben.
+    """
+    ws = sheet(ledger.SHEET, user)
+    while True:
+        _cached(ws)
+        _maybe_revalidate(ws)
+        with _cache_lock:
+            entry = _cache.get(ws)
+            if entry is None:
+                continue
+            index = _last_ops.get(ws)
+            if index is None or index[0] != entry[0]:
+                users, undone = {}, set()
+                _ops_add(users, undone, entry[1])
+                index = _last_ops[ws] = (entry[0], users, undone)
+            return next((op for op in reversed(index[1].get(user, [])) if op not in index[2]), None)
+
+
+def undo_last(user):
+    """Nimmt die letzte Aktion des Users zurück (als neue 'undo'-Events). Gibt die Zahl der Events zurück."""
+    op = last_op(user)
+    if op is None:
+        return 0
+    shard  = shard_of(user)
+    ev     = _gs_read(_on(ledger.SHEET, shard))
+    events = ev[(ev['op'].astype(str) == op) & (ev['user'] == user) & ev['type'].isin(UNDOABLE)]
+    years  = set()
+    with write_batch():
+        for e in reversed(events.to_dict('records')):
+            ws      = _on(e['ws'], shard)
+            keys    = rows_by_id(ws, [e['id']], user)
+            changes = ledger.inverse(e)
+            if e['type'] == 'created':
+                changes['deleted_at'] = _now()[:16]
+            if keys and changes:
+                patch_rows(ws, keys, changes, event='undo', ref=op)
+                if _is_partition(ws):
+                    years.add(int(_base(ws).rsplit('_', 1)[1]))
+        if years:
+            _refresh_totals(sorted(years), shard)
+        # Markiert die Aktion auch dann als erledigt, wenn keine Zeile mehr existierte
+        _emit(_on(ledger.SHEET, shard), [ledger.event('', 'undo', user=user, ts=_now(), op=_op(), ref=op)])
+    return len(events)
+
+
+def state_at(ws, at, user=None):
+    """
+    Stand von ws zum Zeitpunkt at, zurückgerechnet aus dem aktuellen Stand und den before-Werten
+    späterer Events. Zeilen von vor Einführung des Ledgers gelten als schon immer vorhanden.
+    Mit user wird ws im Shard des Users gelesen.
+    """
+    if user:
+        ws = sheet(ws, user)
+    df = user_rows(ws, user) if user else _gs_read(ws)
+    ev = _gs_read(_ledger(ws))
+    if ev.empty:
+        return df
+    at    = pd.Timestamp(at).strftime("%Y-%m-%d %H:%M:%S")
+    later = ev[(ev['ws'] == _base(ws)) & (ev['ts'].astype(str) > at)]
+    if user:
+        later = later[later['user'] == user]
+    return ledger.revert(_base(ws), df, later)
+
+
+# ── Soft-Delete & Kompaktierung ──────────────────────────────
+# Gelöschte Zeilen bleiben zunächst als Tombstone stehen (deleted='True' + deleted_at).
+# compact_tombstones() verschiebt alte Tombstones ins Archiv-Worksheet, damit das
+# Live-Sheet nur noch so groß ist wie die lebenden Daten (das Archiv-Worksheet legt
+# der erste Umzug an).
+
+ARCHIVE       = {'transactions': 'transactions_archive'}
+_last_compact = 0.0
+
+
+def _archive(archive, rows):
+    # Zeilen ans Archiv hängen, ohne es in den Cache zu laden – vom Backend kommt nur der Header
+    if archive in _cache:
+        append_rows(archive, rows)
+        return
+    cols = backend.header(archive)
+    if not cols:
+        _submit('write', archive, rows)
+    elif set(schema.stored_columns(rows.columns)) <= set(cols):
+        _submit('append', archive, rows.reindex(columns=cols))
+    else:
+        # Neue Spalten ändern den Header – das geht nur über den kompletten Upload
+        append_rows(archive, rows)
+        _gs_invalidate(archive)
+
+
+def soft_delete(ws, keys):
+    """Markiert Zeilen als gelöscht und merkt sich den Zeitpunkt für die Kompaktierung."""
+    patch_rows(ws, keys, {'deleted': 'True', 'deleted_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M")})
+
+
+def compact_tombstones(ws="transactions", max_age_days=None):
+    """
+    Verschiebt Tombstones älter als max_age_days (Default: storage.compact_after_days, 30)
+    ins Archiv und schreibt das Live-Worksheet neu. Tombstones ohne deleted_at stammen
+    von vor dessen Einführung und gelten als alt genug.
+    Gibt {'rows', 'bytes', 'live'} zurück – bytes als CSV-Größe der entfernten Zeilen.
+    """
+    if max_age_days is None:
+        max_age_days = float(_storage_config().get('compact_after_days', 30))
+    with _write_lock:
+        df = _cached(ws)
+        if 'deleted' not in df.columns or df.empty:
+            return {'rows': 0, 'bytes': 0, 'live': len(df)}
+        when = (pd.to_datetime(df['deleted_at'], errors='coerce') if 'deleted_at' in df.columns
+                else pd.Series(pd.NaT, index=df.index))
+        old  = df['deleted'].astype(bool) & (when.isna() | (when <= pd.Timestamp.now() - pd.Timedelta(days=max_age_days)))
+        if not old.any():
+            return {'rows': 0, 'bytes': 0, 'live': len(df)}
+        dead    = schema.serialize(ws, df[old])
+        archive = _on(ARCHIVE.get(_base(ws), _base(ws) + '_archive'), _shard(ws))
+        # Erst archivieren, dann das Live-Sheet kürzen – ein Abbruch dazwischen dupliziert höchstens
+        _archive(archive, dead)
+        _gs_update(ws, df[~old])
+    return {'rows': len(dead), 'bytes': len(dead.to_csv(index=False, header=False).encode()), 'live': int((~old).sum())}
+
+
+def maybe_compact():
+    """Startet die Kompaktierung im Hintergrund – prozessweit höchstens alle compact_interval_hours (24)."""
+    global _last_compact
+    interval = float(_storage_config().get('compact_interval_hours', 24)) * 3600
+    with _cache_lock:
+        if time.time() - _last_compact < interval:
+            return
+        _last_compact = time.time()
+
+    def run():
+        for shard in SHARDS:
+            for ws in ARCHIVE:
+                try:
+                    compact_tombstones(_on(ws, shard))
+                except Exception:
+                    pass
+            try:
+                archive_years(shard=shard)
+            except Exception:
+                pass
+            for ws in ledger.SHEETS:
+                try:
+                    checkpoint(_on(ws, shard))
+                except Exception:
+                    pass
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+# ── Jahres-Partitionen ───────────────────────────────────────
+# Das Live-Worksheet transactions hält nur die letzten storage.live_years (2) Kalenderjahre.
+# archive_years() verschiebt ältere Buchungen in transactions_<jahr>; das Worksheet
+# partitions führt je Jahr, User und Typ Summen, damit Gesamtwerte (Depot, balance_at) ohne die
+# alten Jahre auskommen. Geladen werden Partitionen erst, wenn eine Seite sie anfordert,
+# und höchstens storage.max_partitions (4) gleichzeitig (LRU, Snapshots machen Nachladen billig).
+# Partitionen mit noch nicht geschriebenen Operationen (write_batch, Journal) werden nie verdrängt.
+# Partitionen und Summen gibt es je Shard.
+
+PARTITIONS     = 'partitions'
+LIVE_YEARS     = int(_storage_config().get('live_years', 2))
+MAX_PARTITIONS = int(_storage_config().get('max_partitions', 4))
+_part_lru      = collections.OrderedDict()   # geladene Partitionen, zuletzt benutzte hinten
+
+
+def _partition(year, shard=''):
+    """Name der Jahres-Partition – lädt nichts und ändert die LRU nicht."""
+    return _on(f"transactions_{int(year)}", shard)
+
+
+def _is_partition(ws):
+    base = _base(ws)
+    return base.startswith('transactions_') and base[13:].isdigit()
+
+
+def _touch_partition(ws):
+    with _cache_lock:
+        _part_lru[ws] = True
+        _part_lru.move_to_end(ws)
+
+
+def _trim_partitions(keep=None):
+    # Älteste Partitionen über dem Limit verdrängen – außer solchen mit ausstehenden Writes
+    with _cache_lock:
+        over = len(_part_lru) - max(MAX_PARTITIONS, 1)
+        old  = [p for p in _part_lru if p != keep and not _queued[p]][:max(over, 0)]
+    old = [p for p in old if not (_wal and _wal.pending(p))]
+    if not old:
+        return
+    if _snapshots:
+        # Noch ausstehende Snapshots vorher schreiben, sonst lädt die Partition später veraltet
+        _snapshots.flush()
+    with _cache_lock:
+        for p in old:
+            if _queued[p]:
+                continue
+            _part_lru.pop(p, None)
+            _cache.pop(p, None)
+            _index.pop(p, None)
+            _cube.pop(p, None)
+            _balances.pop(p, None)
+
+
+def live_since():
+    """Erster Tag des Live-Zeitraums – alles davor liegt in Jahres-Partitionen."""
+    return datetime.date(datetime.date.today().year - LIVE_YEARS + 1, 1, 1)
+
+
+def partition_years(shard=''):
+    """Jahre mit eigener Partition im Shard, aufsteigend."""
+    df = _gs_read(_on(PARTITIONS, shard))
+    if df.empty or 'jahr' not in df.columns:
+        return []
+    return sorted({int(y) for y in pd.to_numeric(df['jahr'], errors='coerce').dropna()})
+
+
+def _totals(year, df):
+    df = _live(df)
+    if df.empty:
+        return pd.DataFrame(columns=['jahr', 'user', 'typ', 'betrag', 'betrag_abs', 'anzahl'])
+    g = df.assign(typ=df['typ'].astype(str), betrag_abs=df['betrag'].abs()).groupby(['user', 'typ'])
+    out = g.agg(betrag=('betrag', 'sum'), betrag_abs=('betrag_abs', 'sum'), anzahl=('betrag', 'size')).reset_index()
+    return out.assign(jahr=int(year))[['jahr', 'user', 'typ', 'betrag', 'betrag_abs', 'anzahl']]
+
+
+def _refresh_totals(years, shard=''):
+    # Summen der betroffenen Jahre aus den Partitionen neu berechnen (kleines Worksheet, ein Upload)
+    reg = _gs_read(_on(PARTITIONS, shard))
+    if len(reg) and 'jahr' in reg.columns:
+        reg = reg[~pd.to_numeric(reg['jahr'], errors='coerce').isin([int(y) for y in years])]
+    parts = [reg] if len(reg) else []
+    parts += [_totals(y, _gs_read(_partition(y, shard))) for y in years]
+    _gs_update(_on(PARTITIONS, shard), pd.concat(parts, ignore_index=True))
+
+
+def archive_years(live_years=None, shard=''):
+    """
+    Verschiebt nicht gelöschte Buchungen vor dem Live-Zeitraum in ihre Jahres-Partition und
+    schreibt das Live-Worksheet des Shards neu. Gibt {'rows', 'years'} zurück.
+    """
+    cutoff = datetime.date.today().year - (LIVE_YEARS if live_years is None else live_years) + 1
+    live   = _on("transactions", shard)
+    with _write_lock:
+        df   = _cached(live)
+        if df.empty or 'datum_dt' not in df.columns:
+            return {'rows': 0, 'years': []}
+        year = df['datum_dt'].dt.year
+        old  = (year < cutoff) & ~(df['deleted'].astype(bool) if 'deleted' in df.columns else False)
+        if not old.any():
+            return {'rows': 0, 'years': []}
+        known = set(partition_years(shard))
+        years = sorted(int(y) for y in year[old].unique())
+        # Erst Partitionen und Summen schreiben, dann das Live-Sheet kürzen
+        with write_batch():
+            for y in years:
+                rows = schema.serialize(live, df[old & (year == y)])
+                if y in known:
+                    append_rows(_partition(y, shard), rows)
+                else:
+                    _gs_update(_partition(y, shard), rows)
+            _refresh_totals(years, shard)
+            _gs_update(live, df[~old])
+    return {'rows': int(old.sum()), 'years': years}
+
+
+def locate_transaction(tx_id, user, datum=None):
+    """(Worksheet, Index-Labels) einer Buchung – Live-Sheet zuerst, sonst die Partition ihres Datums."""
+    shard = shard_of(user)
+    live  = _on("transactions", shard)
+    keys  = rows_by_id(live, [tx_id], user)
+    if keys or datum is None:
+        return live, keys
+    year = pd.Timestamp(datum).year
+    if year not in partition_years(shard):
+        return live, []
+    ws = _partition(year, shard)
+    return ws, rows_by_id(ws, [tx_id], user)
+
+
+def update_transaction(tx_id, user, datum, changes):
+    """Ändert eine Buchung, egal in welcher Partition sie liegt. Gibt False zurück, wenn sie fehlt."""
+    ws, keys = locate_transaction(tx_id, user, datum)
+    if not keys:
+        return False
+    if _base(ws) == "transactions":
+        patch_rows(ws, keys, changes)
+        return True
+    year = int(_base(ws).rsplit('_', 1)[1])
+    with write_batch():
+        if 'datum' in changes and pd.Timestamp(changes['datum']).year != year:
+            # Datum verlässt das Partitionsjahr – Buchung (gleiche ID) ins Live-Sheet umziehen
+            row = schema.serialize(ws, _gs_read(ws).loc[keys]).assign(**{c: [v] for c, v in changes.items()})
+            soft_delete(ws, keys)
+            append_rows(_on("transactions", _shard(ws)), row.assign(deleted=''))
+        else:
+            patch_rows(ws, keys, changes)
+        _refresh_totals([year], _shard(ws))
+    return True
+
+
+def delete_transaction(tx_id, user, datum):
+    ws, keys = locate_transaction(tx_id, user, datum)
+    if not keys:
+        return False
+    with write_batch():
+        soft_delete(ws, keys)
+        if _base(ws) != "transactions":
+            _refresh_totals([int(_base(ws).rsplit('_', 1)[1])], _shard(ws))
+    return True
+
+
+def delete_user_transactions(user):
+    """Soft-Delete aller Buchungen eines Users – Live-Sheet und alle Partitionen."""
+    shard = shard_of(user)
+    years = partition_years(shard)
+    with write_batch():
+        live = _on("transactions", shard)
+        soft_delete(live, user_rows(live, user).index)
+        for y in years:
+            soft_delete(_partition(y, shard), user_rows(_partition(y, shard), user).index)
+        if years:
+            _refresh_totals(years, shard)
+
+
+# ── Umbenennen & Umzug zwischen Shards ───────────────────────
+
+def _user_sheets(shard):
+    # Alle Worksheets mit Zeilen eines Users im Shard (ohne Ledger – Events bleiben Historie)
+    return [_on(ws, shard) for ws in USER_SHEETS + (PARTITIONS,)] + [_partition(y, shard) for y in partition_years(shard)]
+
+
+def rename_user(old, new):
+    """Benennt einen User um – users-Eintrag und alle seine Zeilen im Shard inklusive Partitionen."""
+    shard = shard_of(old)
+    with write_batch():
+        for ws in _user_sheets(shard):
+            patch_rows(ws, user_rows(ws, old).index, {'user': new})
+        patch_rows("users", user_rows("users", old).index, {'username': new})
+
+
+def _copy_user(src, dst, user, exists=True):
+    # Zeilen des Users nach dst kopieren; eine Teilkopie aus einem abgebrochenen Umzug wird ersetzt
+    rows = user_rows(src, user)
+    df   = _cached(dst) if exists else pd.DataFrame()
+    old  = df['user'] == user if 'user' in df.columns else pd.Series(False, index=df.index)
+    if rows.empty and not old.any():
+        return 0
+    rows = schema.serialize(src, rows)
+    if not exists:
+        _gs_update(dst, rows)
+    elif old.any() or _base(dst) in ledger.SHEETS:
+        # Checkpoint-Sheets direkt schreiben – created-Events würden den Umzug undo-fähig machen
+        _gs_update(dst, pd.concat([schema.serialize(dst, df[~old]), rows], ignore_index=True))
+    else:
+        append_rows(dst, rows)
+    return len(rows)
+
+
+def _drop_user(ws, user):
+    df = _cached(ws)
+    if 'user' in df.columns and (df['user'] == user).any():
+        _gs_update(ws, df[df['user'] != user])
+
+
+def move_user(user, target):
+    """
+    Zieht alle Daten eines Users in den Shard target um: erst kopieren, dann die Zuordnung im
+    users-Sheet umstellen, zuletzt die Zeilen im alten Shard entfernen. Bricht der Umzug vorher
+    ab, bleibt der User vollständig im alten Shard. Die Undo-Historie zieht nicht mit.
+    Gibt die Zahl der kopierten Zeilen zurück.
+    """
+    if target not in SHARDS:
+        raise ValueError(f"Unbekannter Shard: {target!r}")
+    source = shard_of(user)
+    if source == target:
+        return 0
+    with _write_lock:
+        years = partition_years(source)
+        known = set(partition_years(target))
+        pairs = [(_on(ws, source), _on(ws, target), True) for ws in USER_SHEETS]
+        pairs += [(_partition(y, source), _partition(y, target), y in known) for y in years]
+        moved = sum(_copy_user(src, dst, user, exists) for src, dst, exists in pairs)
+        if years:
+            _refresh_totals(years, target)
+        patch_rows("users", user_rows("users", user).index, {'shard': target})
+        for src, _, _ in pairs:
+            _drop_user(src, user)
+        if years:
+            _refresh_totals(years, source)
+    return moved
+
+
+def rebalance(dry_run=False):
+    """
+    Verschiebt User aus vollen in leere Shards, bis sich die Shards um höchstens einen
+    aktiven User unterscheiden. Gibt die Umzüge [(user, von, nach)] zurück; dry_run plant nur.
+    """
+    users = _user_shards()
+    load  = shard_load()
+    moves = []
+    while len(SHARDS) > 1:
+        hi = max(SHARDS, key=lambda s: load[s])
+        lo = min(SHARDS, key=lambda s: load[s])
+        if load[hi] - load[lo] <= 1:
+            break
+        # Zuletzt registrierte User zuerst – die haben die wenigsten Daten
+        user = [u for u in users.index[users == hi] if u not in {m[0] for m in moves}][-1]
+        moves.append((user, hi, lo))
+        load[hi] -= 1
+        load[lo] += 1
+    if not dry_run:
+        for user, _, target in moves:
+            move_user(user, target)
+    return moves
+
+
+# ── Monats-Aggregate ─────────────────────────────────────────
+# Je Buchungs-Worksheet ein Würfel (user, jahr, monat) → {(typ, kategorie): [summe, summe<0,
+# anzahl, min, max]} über die nicht gelöschten Zeilen. Einmal pro Laden mit einem groupby
+# aufgebaut, danach von append_rows/patch_rows fortgeschrieben (auch Daueraufträge, Umzüge
+# zwischen Partitionen, Soft-Deletes). Vollständige Writes und Abgleiche verwerfen ihn über die
+# Datenversion. Ein Monatswechsel auf den Seiten kostet damit O(Kategorien) statt O(Historie).
+
+CUBE_COLUMNS = ['typ', 'kategorie', 'betrag', 'betrag_neg', 'betrag_abs', 'anzahl', 'min', 'max']
+
+
+def _cube_cells(df):
+    # {(user, jahr, monat): {(typ, kategorie): [summe, summe<0, anzahl, min, max]}}
+    df = _live(df)
+    if df.empty or 'datum_dt' not in df.columns or 'betrag' not in df.columns:
+        return {}
+    df = df[df['datum_dt'].notna()]
+    g  = df.assign(jahr=df['datum_dt'].dt.year, monat=df['datum_dt'].dt.month, neg=df['betrag'].clip(upper=0),
+                   typ=df['typ'].astype(str), kategorie=df['kategorie'].fillna('').astype(str))
+    g  = g.groupby(['user', 'jahr', 'monat', 'typ', 'kategorie'], sort=False).agg(
+        s=('betrag', 'sum'), neg=('neg', 'sum'), n=('betrag', 'size'), lo=('betrag', 'min'), hi=('betrag', 'max'))
+    cells = {}
+    for (user, jahr, monat, typ, kat), v in zip(g.index, g.itertuples(index=False, name=None)):
+        cells.setdefault((user, int(jahr), int(monat)), {})[(typ, kat)] = list(v)
+    return cells
+
+
+def _cube_apply(ws, version, add=None, remove=None):
+    # Würfel um geänderte Zeilen fortschreiben – nur wenn er zum Stand vor der Änderung gehört
+    entry = _cube.get(ws)
+    if entry is None:
+        return
+    if entry[0] != version:
+        _cube.pop(ws, None)
+        return
+    cube, stale = entry[1], set()
+    for bucket, cells in _cube_cells(remove if remove is not None else pd.DataFrame()).items():
+        have = cube.get(bucket, {})
+        for key, (s, neg, n, lo, hi) in cells.items():
+            c = have.get(key)
+            if c is None or c[2] <= n:
+                have.pop(key, None)
+                continue
+            c[0] -= s
+            c[1] -= neg
+            c[2] -= n
+            if lo <= c[3] or hi >= c[4]:
+                stale.add(bucket)
+    for bucket, cells in _cube_cells(add if add is not None else pd.DataFrame()).items():
+        have = cube.setdefault(bucket, {})
+        for key, (s, neg, n, lo, hi) in cells.items():
+            c = have.get(key)
+            if c is None:
+                have[key] = [s, neg, n, lo, hi]
+            else:
+                c[0] += s
+                c[1] += neg
+                c[2] += n
+                c[3] = min(c[3], lo)
+                c[4] = max(c[4], hi)
+    df = _cache[ws][1]
+    for user, jahr, monat in stale:
+        # min/max lassen sich nicht abziehen – den Monat des Users aus seinen Zeilen neu bilden
+        pos  = _lookup(ws, df, 'user').get(user, [])
+        rows = df.take(pos) if pos else df.iloc[0:0]
+        cube[(user, jahr, monat)] = _cube_cells(
+            schema.date_slice(schema.by_date(rows), *schema.month_range(jahr, monat))
+        ).get((user, jahr, monat), {})
+    _cube[ws] = (_cache[ws][0], cube)
+
+
+def _cube_read(ws, user, year, months):
+    # Zellen des Users aus dem aktuellen Würfel von ws; fehlt er, wird er aus dem Cache gebaut
+    while True:
+        _cached(ws)
+        with _cache_lock:
+            entry = _cache.get(ws)
+            if entry is None:
+                continue
+            cube = _cube.get(ws)
+            if cube is None or cube[0] != entry[0]:
+                cube = _cube[ws] = (entry[0], _cube_cells(entry[1]))
+            return [(key, list(c)) for m in months for key, c in cube[1].get((user, year, m), {}).items()]
+
+
+def month_summary(user, year, month=None):
+    """
+    Summen eines Users je typ und kategorie für einen Monat (month=None: ganzes Jahr) aus dem
+    Aggregat-Würfel. Spalten: CUBE_COLUMNS – betrag ist die Summe, betrag_neg die der negativen
+    Beträge, betrag_abs die der Absolutbeträge.
+    """
+    year  = int(year)
+    shard = shard_of(user)
+    wss   = [_on("transactions", shard)]
+    if year in partition_years(shard):
+        wss.append(_partition(year, shard))
+    acc = {}
     for ws in wss:
-        st.session_state.pop(f"_gs_cache_{ws}", None)
+        for key, (s, neg, n, lo, hi) in _cube_read(ws, user, year, [month] if month else range(1, 13)):
+            c = acc.get(key)
+            if c is None:
+                acc[key] = [s, neg, n, lo, hi]
+            else:
+                acc[key] = [c[0] + s, c[1] + neg, c[2] + n, min(c[3], lo), max(c[4], hi)]
+    return pd.DataFrame([[typ, kat, s, neg, s - 2 * neg, n, lo, hi] for (typ, kat), (s, neg, n, lo, hi) in acc.items()],
+                        columns=CUBE_COLUMNS)
+
+
+# ── Kontostände ──────────────────────────────────────────────
+# Je Buchungs-Worksheet und User ein Prefix-Summen-Index: sortierte Tage mit Buchungen und
+# die kumulierten Stände [bank, depot, toepfe] bis einschließlich dieses Tages. Fortgeschrieben
+# wie der Monats-Würfel; eine Rückbuchung verschiebt nur die Stände ab ihrem Tag. Stand zu
+# einem Datum = Binärsuche im Live-Index + Jahressummen archivierter Jahre aus partitions.
+# Bank wie auf dem Dashboard: Einnahmen − Ausgaben − Depot-Einzahlungen + Spartopf-Buchungen.
+
+BALANCE_COLUMNS = ['bank', 'depot', 'toepfe']
+_NO_DATE        = np.datetime64('9999-12-31', 'D')
+
+
+def _split(typ, betrag, betrag_abs):
+    # Buchungen eines Typs → Beiträge zu [bank, depot, toepfe]
+    typ = np.asarray(typ, dtype=object)
+    b   = np.nan_to_num(np.asarray(betrag, dtype=float))
+    a   = np.nan_to_num(np.asarray(betrag_abs, dtype=float))
+    ein, aus, dep, sp = (typ == 'Einnahme'), (typ == 'Ausgabe'), (typ == 'Depot'), (typ == 'Spartopf')
+    return np.column_stack([np.where(ein | sp, b, 0.0) - np.where(aus | dep, a, 0.0),
+                            np.where(dep, a, 0.0),
+                            np.where(sp, -b, 0.0)])
+
+
+def _flows(df):
+    # Tagesbewegungen je (user, tag) der nicht gelöschten Buchungen, nach Tag sortiert
+    df = _live(df)
+    if df.empty or 'datum_dt' not in df.columns or 'betrag' not in df.columns:
+        return pd.DataFrame(columns=BALANCE_COLUMNS)
+    df = df[df['datum_dt'].notna()]
+    f  = pd.DataFrame(_split(df['typ'].astype(str), df['betrag'], df['betrag'].abs()), columns=BALANCE_COLUMNS)
+    f['user'] = df['user'].values
+    f['tag']  = df['datum_dt'].values.astype('datetime64[D]')
+    return f.groupby(['user', 'tag'], sort=True)[BALANCE_COLUMNS].sum()
+
+
+def _balance_build(df):
+    out = {}
+    for user, g in _flows(df).groupby(level=0, sort=False):
+        out[user] = (g.index.get_level_values(1).values.astype('datetime64[D]'), g.values.cumsum(axis=0))
+    return out
+
+
+def _balance_apply(ws, version, add=None, remove=None):
+    entry = _balances.get(ws)
+    if entry is None:
+        return
+    if entry[0] != version:
+        _balances.pop(ws, None)
+        return
+    index = entry[1]
+    for frame, sign in ((remove, -1.0), (add, 1.0)):
+        if frame is None:
+            continue
+        flows = _flows(frame)
+        for (user, tag), vec in zip(flows.index, flows.values):
+            tag        = np.datetime64(tag, 'D')
+            days, cum  = index.get(user, (np.array([], dtype='datetime64[D]'), np.zeros((0, 3))))
+            pos        = int(np.searchsorted(days, tag))
+            if pos == len(days) or days[pos] != tag:
+                days = np.insert(days, pos, tag)
+                cum  = np.insert(cum, pos, cum[pos - 1] if pos else np.zeros(3), axis=0)
+            else:
+                cum = cum.copy()
+            # Alle Stände ab dem Buchungstag verschieben sich um die Bewegung
+            cum[pos:] += sign * vec
+            index[user] = (days, cum)
+    _balances[ws] = (_cache[ws][0], index)
+
+
+def _balance_read(ws, user, at):
+    # (tage, kumulierte Stände) des Users in ws bis einschließlich at
+    while True:
+        _cached(ws)
+        with _cache_lock:
+            entry = _cache.get(ws)
+            if entry is None:
+                continue
+            index = _balances.get(ws)
+            if index is None or index[0] != entry[0]:
+                index = _balances[ws] = (entry[0], _balance_build(entry[1]))
+            days, cum = index[1].get(user, (np.array([], dtype='datetime64[D]'), np.zeros((0, 3))))
+            n = int(np.searchsorted(days, at, side='right'))
+            return days[:n], cum[:n]
+
+
+def _year_totals(user, shard):
+    # Jahressummen archivierter Jahre aus partitions: {jahr: [bank, depot, toepfe]}
+    df = user_rows(_on(PARTITIONS, shard), user)
+    if df.empty:
+        return {}
+    vals = _split(df['typ'].astype(str), pd.to_numeric(df['betrag'], errors='coerce'),
+                  pd.to_numeric(df['betrag_abs'], errors='coerce'))
+    out = {}
+    for jahr, v in zip(pd.to_numeric(df['jahr'], errors='coerce'), vals):
+        if not pd.isna(jahr):
+            out[int(jahr)] = out.get(int(jahr), 0.0) + v
+    return out
+
+
+def _year(day):
+    return int(day.astype('datetime64[Y]').astype(int)) + 1970
+
+
+def balance_at(user, at=None):
+    """
+    Stände eines Users am Ende des Tages at (None = inklusive aller Buchungen) als
+    {'bank', 'depot', 'toepfe', 'gesamt'} – Binärsuche statt Summe über die Historie.
+    """
+    at    = _NO_DATE if at is None else np.datetime64(pd.Timestamp(at).date(), 'D')
+    shard = shard_of(user)
+    total = np.zeros(3)
+    for y, v in _year_totals(user, shard).items():
+        if y < _year(at):
+            total += v
+        elif y == _year(at):
+            cum = _balance_read(_partition(y, shard), user, at)[1]
+            total += cum[-1] if len(cum) else 0.0
+    cum    = _balance_read(_on("transactions", shard), user, at)[1]
+    total += cum[-1] if len(cum) else 0.0
+    return {**dict(zip(BALANCE_COLUMNS, map(float, total))), 'gesamt': float(total.sum())}
+
+
+def balance_history(user, since=None):
+    """
+    Verlauf der Stände (datum, bank, depot, toepfe, gesamt): tagesgenau für jeden Tag mit
+    Buchungen im Live-Worksheet, archivierte Jahre als Stand zum Jahresende (ohne sie zu laden).
+    """
+    shard  = shard_of(user)
+    years  = _year_totals(user, shard)
+    days, live = _balance_read(_on("transactions", shard), user, _NO_DATE)
+    ends   = np.array([np.datetime64(f"{y}-12-31", 'D') for y in sorted(years)], dtype='datetime64[D]')
+    points = np.union1d(days, ends)
+    if since is not None:
+        points = points[points >= np.datetime64(pd.Timestamp(since).date(), 'D')]
+    if not len(points):
+        return pd.DataFrame(columns=['datum'] + BALANCE_COLUMNS + ['gesamt'])
+    # Live-Anteil per Binärsuche, archivierte Jahre davor als Prefix-Summe über die Jahre
+    vals = np.zeros((len(points), 3))
+    pos  = np.searchsorted(days, points, side='right') - 1
+    vals[pos >= 0] = live[pos[pos >= 0]]
+    ys   = np.array(sorted(years), dtype=int)
+    if len(ys):
+        acc  = np.vstack([np.zeros(3), np.cumsum([years[y] for y in ys], axis=0)])
+        py   = points.astype('datetime64[Y]').astype(int) + 1970
+        k    = np.searchsorted(ys, py)
+        vals += acc[k]
+        # Tage in einem archivierten Jahr: zum Jahresende die Jahressumme, sonst aus der Partition
+        for i in np.flatnonzero((k < len(ys)) & (ys[np.minimum(k, len(ys) - 1)] == py)):
+            y = int(py[i])
+            if points[i] == np.datetime64(f"{y}-12-31", 'D'):
+                vals[i] += years[y]
+            else:
+                cum = _balance_read(_partition(y, shard), user, points[i])[1]
+                vals[i] += cum[-1] if len(cum) else 0.0
+    out = pd.DataFrame(vals, columns=BALANCE_COLUMNS)
+    out.insert(0, 'datum', pd.to_datetime(points))
+    out['gesamt'] = out[BALANCE_COLUMNS].sum(axis=1)
+    return out
+
+
+# ── Ansichten & Nachbarmonate ────────────────────────────────
+# Fertige Ansichts-Modelle der Seiten (Monatsübersicht, Heatmap) je Datenstand des Users.
+# Nach dem Rendern rechnet prefetch_views() Vor- und Folgemonat im Hintergrund vor, ‹/› trifft
+# dann den Cache. Builder sind reine Funktionen build(user, *args) ohne st.*-Aufrufe.
+
+VIEW_CACHE_SIZE = 256
+_views          = collections.OrderedDict()   # (builder, user, args, user_version) → Modell
+_views_pending  = set()
+_view_stats     = {'hits': 0, 'misses': 0, 'prefetched': 0}
+
+
+def user_version(user):
+    """Datenstand aller Worksheets im Shard des Users (Session-Sheets und Jahres-Partitionen)."""
+    return tuple(data_version(ws) for ws in watched_sheets(user))
+
+
+def view(build, user, *args):
+    """build(user, *args) für den aktuellen Datenstand – aus dem Cache oder neu gerechnet."""
+    name = f"{build.__module__}.{build.__qualname__}"
+    for _ in range(3):
+        version = user_version(user)
+        key     = (name, user, args, version)
+        with _cache_lock:
+            if key in _views:
+                _views.move_to_end(key)
+                _view_stats['hits'] += 1
+                return _views[key]
+        result = build(user, *args)
+        # Hat der Builder erst Partitionen geladen oder kam ein Write dazwischen, neu rechnen
+        if user_version(user) == version:
+            with _cache_lock:
+                _view_stats['misses'] += 1
+                _views[key] = result
+                while len(_views) > VIEW_CACHE_SIZE:
+                    _views.popitem(last=False)
+            return result
+    return result
+
+
+def prefetch_views(build, user, argsets):
+    """Rechnet build(user, *args) für jedes args-Tupel in einem Hintergrund-Thread vor."""
+    name = f"{build.__module__}.{build.__qualname__}"
+    with _cache_lock:
+        todo = [args for args in argsets if (name, user, args) not in _views_pending]
+        _views_pending.update((name, user, args) for args in todo)
+    if not todo:
+        return
+
+    def run():
+        for args in todo:
+            try:
+                view(build, user, *args)
+                with _cache_lock:
+                    _view_stats['prefetched'] += 1
+            except Exception:
+                pass   # beim eigentlichen Aufruf tauchen Fehler wieder auf
+            finally:
+                with _cache_lock:
+                    _views_pending.discard((name, user, args))
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def view_stats():
+    with _cache_lock:
+        return dict(_view_stats, size=len(_views))
 
 
 # ── Kategorien ───────────────────────────────────────────────
 
 def load_custom_cats(user, typ):
     try:
-        df = _gs_read("categories")
-        if df.empty or 'user' not in df.columns:
+        df = user_rows(sheet("categories", user), user)
+        if df.empty:
             return []
-        return df[(df['user'] == user) & (df['typ'] == typ)]['kategorie'].tolist()
-    except:
+        return df[df['typ'] == typ]['kategorie'].tolist()
+    except DATA_ERRORS:
         return []
 
 
 def save_custom_cat(user, typ, kategorie):
-    try:
-        df = _gs_read("categories")
-    except:
-        df = pd.DataFrame(columns=['user', 'typ', 'kategorie'])
-    _gs_update("categories", pd.concat(
-        [df, pd.DataFrame([{'user': user, 'typ': typ, 'kategorie': kategorie}])],
-        ignore_index=True
-    ))
+    append_rows(sheet("categories", user), [{'user': user, 'typ': typ, 'kategorie': kategorie}])
 
 
 def delete_custom_cat(user, typ, kategorie):
     try:
-        df = _gs_read("categories")
-        _gs_update("categories", df[~((df['user'] == user) & (df['typ'] == typ) & (df['kategorie'] == kategorie))])
-    except:
+        ws = sheet("categories", user)
+        df = _gs_read(ws)
+        _gs_update(ws, df[~((df['user'] == user) & (df['typ'] == typ) & (df['kategorie'] == kategorie))])
+    except DATA_ERRORS:
         pass
 
 
 def update_custom_cat(user, typ, old_label, new_label):
     try:
-        df = _gs_read("categories")
-        df.loc[(df['user'] == user) & (df['typ'] == typ) & (df['kategorie'] == old_label), 'kategorie'] = new_label
-        _gs_update("categories", df)
-    except:
+        ws  = sheet("categories", user)
+        df  = _gs_read(ws)
+        idx = df[(df['user'] == user) & (df['typ'] == typ) & (df['kategorie'] == old_label)].index
+        patch_rows(ws, idx, {'kategorie': new_label})
+    except DATA_ERRORS:
         pass
 
 
@@ -72,38 +1788,29 @@ def update_custom_cat(user, typ, old_label, new_label):
 
 def load_goal(user):
     try:
-        df = _gs_read("goals")
-        if df.empty or 'user' not in df.columns:
-            return 0.0
-        row = df[df['user'] == user]
+        row = user_rows(sheet("goals", user), user)
         return float(row.iloc[-1].get('sparziel', 0) or 0) if not row.empty else 0.0
-    except:
+    except DATA_ERRORS:
         return 0.0
 
 
 def save_goal(user, goal):
-    try:
-        df = _gs_read("goals")
-    except:
-        df = pd.DataFrame(columns=['user', 'sparziel'])
+    ws = sheet("goals", user)
+    df = _gs_read(ws)
     if 'user' not in df.columns:
         df = pd.DataFrame(columns=['user', 'sparziel'])
-    mask = df['user'] == user
-    if mask.any():
-        df.loc[mask, 'sparziel'] = goal
+    idx = df[df['user'] == user].index
+    if len(idx):
+        patch_rows(ws, idx, {'sparziel': goal})
     else:
-        df = pd.concat([df, pd.DataFrame([{'user': user, 'sparziel': goal}])], ignore_index=True)
-    _gs_update("goals", df)
+        append_rows(ws, [{'user': user, 'sparziel': goal}])
 
 
 # ── User-Einstellungen ───────────────────────────────────────
 
 def load_user_settings(user):
     try:
-        df = _gs_read("settings")
-        if df.empty or 'user' not in df.columns:
-            return {}
-        row = df[df['user'] == user]
+        row = user_rows(sheet("settings", user), user)
         if row.empty:
             return {}
         r = row.iloc[-1]
@@ -114,72 +1821,58 @@ def load_user_settings(user):
             'theme': str(r.get('theme', 'Ocean Blue') or 'Ocean Blue'),
             'last_username_change': str(r.get('last_username_change', '') or ''),
         }
-    except:
+    except DATA_ERRORS:
         return {}
 
 
 def save_user_settings(user, **kwargs):
-    try:
-        df = _gs_read("settings")
-    except:
-        df = pd.DataFrame(columns=['user', 'budget', 'currency', 'avatar_url', 'theme'])
+    ws = sheet("settings", user)
+    df = _gs_read(ws)
     if 'user' not in df.columns:
         df = pd.DataFrame(columns=['user', 'budget', 'currency', 'avatar_url', 'theme'])
-    mask = df['user'] == user
-    if mask.any():
-        for k, v in kwargs.items():
-            df.loc[mask, k] = v
+    idx = df[df['user'] == user].index
+    if len(idx):
+        patch_rows(ws, idx, kwargs)
     else:
         row_data = {'user': user, 'budget': 0, 'currency': 'EUR', 'avatar_url': '', 'theme': 'Ocean Blue'}
         row_data.update(kwargs)
-        df = pd.concat([df, pd.DataFrame([row_data])], ignore_index=True)
-    _gs_update("settings", df)
+        append_rows(ws, [row_data])
 
 
 # ── Daueraufträge ────────────────────────────────────────────
 
 def load_dauerauftraege(user):
     try:
-        df = _gs_read("dauerauftraege")
-        if df.empty or 'user' not in df.columns:
+        df = user_rows(sheet("dauerauftraege", user), user)
+        if df.empty:
             return []
-        result = []
-        for _, r in df[df['user'] == user].iterrows():
-            if str(r.get('deleted', '')).strip().lower() in ('true', '1', '1.0'):
-                continue
-            result.append({
-                'id': str(r.get('id', '')),
-                'name': str(r.get('name', '')),
-                'betrag': float(r.get('betrag', 0) or 0),
-                'typ': str(r.get('typ', 'Ausgabe')),
-                'kategorie': str(r.get('kategorie', '')),
-                'aktiv': str(r.get('aktiv', 'True')),
-            })
-        return result
-    except:
+        df = df[~df['deleted'].astype(bool)] if 'deleted' in df.columns else df
+        df = df.assign(betrag=df['betrag'].fillna(0.0)) if 'betrag' in df.columns else df
+        return [{
+            'id': str(r.get('id', '')),
+            'name': str(r.get('name', '')),
+            'betrag': float(r.get('betrag', 0.0)),
+            'typ': str(r.get('typ', 'Ausgabe')),
+            'kategorie': str(r.get('kategorie', '')),
+            'aktiv': str(r.get('aktiv', 'True')),
+        } for r in df.to_dict('records')]
+    except DATA_ERRORS:
         return []
 
 
 def save_dauerauftrag(user, name, betrag, typ, kategorie):
-    try:
-        df = _gs_read("dauerauftraege")
-    except:
-        df = pd.DataFrame(columns=['user', 'id', 'name', 'betrag', 'typ', 'kategorie', 'aktiv', 'deleted'])
-    new_id = f"{user}_{int(time.time())}"
-    new_row = pd.DataFrame([{
-        'user': user, 'id': new_id, 'name': name,
+    append_rows(sheet("dauerauftraege", user), [{
+        'user': user, 'id': new_id(), 'name': name,
         'betrag': betrag, 'typ': typ, 'kategorie': kategorie,
         'aktiv': 'True', 'deleted': '',
     }])
-    _gs_update("dauerauftraege", pd.concat([df, new_row], ignore_index=True))
 
 
 def delete_dauerauftrag(user, da_id):
     try:
-        df = _gs_read("dauerauftraege")
-        df.loc[(df['user'] == user) & (df['id'] == da_id), 'deleted'] = 'True'
-        _gs_update("dauerauftraege", df)
-    except:
+        ws = sheet("dauerauftraege", user)
+        soft_delete(ws, rows_by_id(ws, [da_id], user))
+    except DATA_ERRORS:
         pass
 
 
@@ -190,20 +1883,18 @@ def apply_dauerauftraege(user):
             return 0
         today = datetime.date.today()
         target_date = today.replace(day=1)
-        df_t = _gs_read("transactions")
-        booked = 0
+        ws   = sheet("transactions", user)
+        df_t = schema.date_slice(schema.by_date(user_rows(ws, user)),
+                                 *schema.month_range(target_date.year, target_date.month))
+        new_rows = []
         for da in das:
             if da['aktiv'] != 'True':
                 continue
-            already = df_t[
-                (df_t['user'] == user) &
-                (df_t['notiz'] == f"⚙️ Dauerauftrag: {da['name']}") &
-                (df_t['datum'].astype(str).str.startswith(target_date.strftime('%Y-%m')))
-            ] if not df_t.empty and 'user' in df_t.columns else pd.DataFrame()
+            already = df_t[df_t['notiz'] == f"⚙️ Dauerauftrag: {da['name']}"] if not df_t.empty else pd.DataFrame()
             if not already.empty:
                 continue
             betrag_save = da['betrag'] if da['typ'] in ('Einnahme', 'Depot') else -da['betrag']
-            new_row = pd.DataFrame([{
+            new_rows.append({
                 'user': user,
                 'datum': str(target_date),
                 'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
@@ -212,13 +1903,10 @@ def apply_dauerauftraege(user):
                 'betrag': betrag_save,
                 'notiz': f"⚙️ Dauerauftrag: {da['name']}",
                 'deleted': '',
-            }])
-            df_t = pd.concat([df_t, new_row], ignore_index=True)
-            booked += 1
-        if booked > 0:
-            _gs_update("transactions", df_t)
-        return booked
-    except:
+            })
+        append_rows(ws, new_rows)
+        return len(new_rows)
+    except DATA_ERRORS:
         return 0
 
 
@@ -226,35 +1914,29 @@ def apply_dauerauftraege(user):
 
 def load_toepfe(user):
     try:
-        df = _gs_read("toepfe")
-        if df.empty or 'user' not in df.columns:
+        df = user_rows(sheet("toepfe", user), user)
+        if df.empty:
             return []
-        result = []
-        for _, r in df[df['user'] == user].iterrows():
-            if str(r.get('deleted', '')).strip().lower() in ('true', '1', '1.0'):
-                continue
-            result.append({
-                'id': str(r.get('id', '')),
-                'name': str(r.get('name', '')),
-                'ziel': float(r.get('ziel', 0) or 0),
-                'gespart': float(r.get('gespart', 0) or 0),
-                'emoji': str(r.get('emoji', '🪣')),
-                'farbe': str(r.get('farbe', '#38bdf8')),
-            })
-        return result
-    except:
+        df = df[~df['deleted'].astype(bool)] if 'deleted' in df.columns else df
+        df = df.fillna({c: 0.0 for c in ('ziel', 'gespart') if c in df.columns})
+        return [{
+            'id': str(r.get('id', '')),
+            'name': str(r.get('name', '')),
+            'ziel': float(r.get('ziel', 0.0)),
+            'gespart': float(r.get('gespart', 0.0)),
+            'emoji': str(r.get('emoji', '🪣')),
+            'farbe': str(r.get('farbe', '#38bdf8')),
+        } for r in df.to_dict('records')]
+    except DATA_ERRORS:
         return []
 
 
 def save_topf(user, name, ziel, emoji):
-    try:
-        df = _gs_read("toepfe")
-    except:
-        df = pd.DataFrame(columns=['user', 'id', 'name', 'ziel', 'gespart', 'emoji', 'farbe', 'deleted'])
-    cnt = len(df[df['user'] == user]) if not df.empty and 'user' in df.columns else 0
-    new_row = pd.DataFrame([{
+    ws  = sheet("toepfe", user)
+    cnt = len(user_rows(ws, user))
+    append_rows(ws, [{
         'user': user,
-        'id': f"{user}_{int(time.time())}",
+        'id': new_id(),
         'name': name,
         'ziel': ziel,
         'gespart': 0,
@@ -262,50 +1944,48 @@ def save_topf(user, name, ziel, emoji):
         'farbe': TOPF_PALETTE[cnt % len(TOPF_PALETTE)],
         'deleted': '',
     }])
-    _gs_update("toepfe", pd.concat([df, new_row], ignore_index=True))
 
 
 def update_topf_gespart(user, topf_id, topf_name, delta):
-    try:
-        df = _gs_read("toepfe")
-        mask = (df['user'] == user) & (df['id'] == topf_id)
-        if mask.any():
-            df.loc[mask, 'gespart'] = max(0, float(df.loc[mask, 'gespart'].values[0] or 0) + delta)
-            _gs_update("toepfe", df)
-    except:
-        pass
-    try:
-        df_t = _gs_read("transactions")
-        new_row = pd.DataFrame([{
-            "user": user,
-            "datum": str(datetime.date.today()),
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "typ": "Spartopf",
-            "kategorie": f"🪣 {topf_name}",
-            "betrag": (-1 if delta > 0 else 1) * abs(delta),
-            "notiz": f"{'↓' if delta > 0 else '↑'} {topf_name}",
-            'deleted': '',
-        }])
-        _gs_update("transactions", pd.concat([df_t, new_row], ignore_index=True))
-    except:
-        pass
+    shard = shard_of(user)
+    with write_batch():
+        try:
+            ws  = _on("toepfe", shard)
+            idx = rows_by_id(ws, [topf_id], user)
+            if idx:
+                gespart = _gs_read(ws).at[idx[0], 'gespart']
+                patch_rows(ws, idx, {'gespart': max(0.0, (0.0 if pd.isna(gespart) else gespart) + delta)},
+                           event='pot_deposit' if delta > 0 else 'pot_withdraw')
+        except DATA_ERRORS:
+            pass
+        try:
+            append_rows(_on("transactions", shard), [{
+                "user": user,
+                "datum": str(datetime.date.today()),
+                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+                "typ": "Spartopf",
+                "kategorie": f"🪣 {topf_name}",
+                "betrag": (-1 if delta > 0 else 1) * abs(delta),
+                "notiz": f"{'↓' if delta > 0 else '↑'} {topf_name}",
+                'deleted': '',
+            }])
+        except DATA_ERRORS:
+            pass
 
 
 def delete_topf(user, topf_id):
     try:
-        df = _gs_read("toepfe")
-        df.loc[(df['user'] == user) & (df['id'] == topf_id), 'deleted'] = 'True'
-        _gs_update("toepfe", df)
-    except:
+        ws = sheet("toepfe", user)
+        soft_delete(ws, rows_by_id(ws, [topf_id], user))
+    except DATA_ERRORS:
         pass
 
 
 def update_topf_meta(user, topf_id, name, ziel, emoji):
     try:
-        df = _gs_read("toepfe")
-        mask = (df['user'] == user) & (df['id'] == topf_id)
-        if mask.any():
-            df.loc[mask, ['name', 'ziel', 'emoji']] = [name, ziel, emoji]
-            _gs_update("toepfe", df)
-    except:
+        ws  = sheet("toepfe", user)
+        idx = rows_by_id(ws, [topf_id], user)
+        if idx:
+            patch_rows(ws, idx, {'name': name, 'ziel': ziel, 'emoji': emoji})
+    except DATA_ERRORS:
         pass
@@ -1,9 +1,8 @@
-import pandas as pd
 import streamlit as st
 
 from constants import DEFAULT_CATS
 from database import (
-    _gs_read, _gs_update,
+    delete_transaction,
     load_custom_cats, save_custom_cat, delete_custom_cat, update_custom_cat,
 )
 
@@ -121,20 +120,7 @@ def confirm_delete(row_data):
     c1, c2 = st.columns(2)
     with c1:
         if st.button("Löschen", use_container_width=True, type="primary"):
-            df_all = _gs_read("transactions")
-            if 'deleted' not in df_all.columns:
-                df_all['deleted'] = ''
-            mask = (
-                (df_all['user'] == row_data['user']) &
-                (df_all['datum'].astype(str) == str(row_data['datum'])) &
-                (pd.to_numeric(df_all['betrag'], errors='coerce') == pd.to_numeric(row_data['betrag'], errors='coerce')) &
-                (df_all['kategorie'] == row_data['kategorie']) &
-                (~df_all['deleted'].astype(str).str.strip().str.lower().isin(['true', '1', '1.0']))
-            )
-            idx = df_all[mask].index
-            if len(idx) > 0:
-                df_all.loc[idx[0], 'deleted'] = 'True'
-                _gs_update("transactions", df_all)
+            if delete_transaction(row_data['id'], row_data['user'], row_data['datum']):
                 st.session_state['edit_idx'] = None
                 st.rerun()
             else:
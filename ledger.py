@@ -0,0 +1,128 @@
+"""
+Event-Log (Ledger) für Buchungen und Spartöpfe.
+Jede Änderung wird als Event an das Worksheet 'ledger' angehängt – mit den neuen
+Werten (data) und den alten (before). Die Worksheets transactions/toepfe sind nur
+noch Checkpoints: materialisierter Stand bis zum letzten 'checkpoint'-Event des
+Worksheets. Beim Laden werden die Events danach eingefaltet (fold), rückwärts
+angewendet ergeben die before-Werte jeden früheren Stand (revert) und das Undo.
+
+Events tragen absolute Werte – mehrfaches Einfalten ergibt denselben Stand. id ist die
+ID der betroffenen Zeile, key die des Events selbst (daran erkennt ein Retry angekommene Events).
+Fehlt das Worksheet 'ledger' (bestehende Installation), gilt es als leer – das erste Event legt es an.
+Events, die alle Checkpoints schon enthalten, wandern nach 'ledger_archive' (database._roll_ledger).
+"""
+import json
+import uuid
+import pandas as pd
+
+import schema
+
+SHEET   = 'ledger'
+SHEETS  = ('transactions', 'toepfe')
+COLUMNS = ['ws', 'type', 'id', 'user', 'ts', 'op', 'ref', 'data', 'before', 'key']
+TYPES   = ('created', 'edited', 'deleted', 'pot_deposit', 'pot_withdraw', 'undo', 'checkpoint')
+
+
+def _plain(v):
+    if hasattr(v, 'item'):
+        return v.item()
+    return str(v)
+
+
+def _json(d):
+    return json.dumps({k: (None if v is None or (isinstance(v, float) and v != v) else v) for k, v in d.items()},
+                      default=_plain, ensure_ascii=False)
+
+
+def _load(v):
+    return json.loads(v) if isinstance(v, str) and v else {}
+
+
+def event(ws, type, id='', user='', ts='', op='', ref='', data=None, before=None):
+    return {'ws': ws, 'type': type, 'id': id, 'user': user, 'ts': ts, 'op': op, 'ref': ref,
+            'data': _json(data or {}), 'before': _json(before or {}), 'key': str(uuid.uuid4())}
+
+
+def last_checkpoint(events, ws):
+    """Position des letzten Checkpoints von ws im Ledger (-1 = keiner)."""
+    if events.empty or 'type' not in events.columns:
+        return -1
+    hits = events.index[(events['type'] == 'checkpoint') & (events['ws'] == ws)]
+    return int(hits[-1]) if len(hits) else -1
+
+
+def _set(df, pos, values):
+    for c, v in values.items():
+        if c not in df.columns:
+            df[c] = pd.Series(None, index=df.index, dtype=object)
+        try:
+            df.loc[pos, c] = v
+        except (TypeError, ValueError):
+            df[c] = df[c].astype(object)
+            df.loc[pos, c] = v
+
+
+def fold(ws, df, events):
+    """Events (Ledger-Zeilen in seq-Reihenfolge) auf den materialisierten Frame anwenden."""
+    events = events[events['ws'] == ws] if len(events) else events
+    if events.empty:
+        return df, 0
+    df   = df.copy()
+    pos  = {k: i for i, k in zip(df.index, df['id'].astype(str))} if 'id' in df.columns else {}
+    new  = []
+    done = 0
+    for e in events.itertuples(index=False):
+        eid = '' if pd.isna(e.id) else str(e.id)
+        if e.type == 'checkpoint' or not eid:
+            continue
+        if e.type == 'created':
+            if eid not in pos:
+                pos[eid] = None
+                new.append(_load(e.data))
+                done += 1
+            continue
+        if new and pos.get(eid, 0) is None:
+            # Zeile erst in diesem Durchlauf angelegt – vorher anhängen
+            df, pos, new = _flush(ws, df, pos, new)
+        if eid in pos:
+            _set(df, pos[eid], schema.cast_changes(ws, _load(e.data)))
+            done += 1
+    if new:
+        df, pos, new = _flush(ws, df, pos, new)
+    return df, done
+
+
+def _flush(ws, df, pos, new):
+    start = int(df.index.max()) + 1 if len(df) else 0
+    rows  = pd.DataFrame(new)
+    cols  = schema.stored_columns(df.columns)
+    rows  = schema.normalize(ws, rows.reindex(columns=cols + [c for c in rows.columns if c not in cols]))
+    rows.index = pd.RangeIndex(start, start + len(rows))
+    df = schema.concat(df, rows) if len(df) else rows
+    for i, k in zip(rows.index, rows['id'].astype(str)):
+        pos[k] = i
+    return df, pos, []
+
+
+def revert(ws, df, events):
+    """Events rückwärts zurücknehmen (before-Werte) – ergibt den Stand vor dem ersten Event."""
+    events = events[events['ws'] == ws] if len(events) else events
+    df     = df.copy()
+    pos    = {k: i for i, k in zip(df.index, df['id'].astype(str))} if 'id' in df.columns else {}
+    drop   = []
+    for e in reversed(list(events.itertuples(index=False))):
+        eid = '' if pd.isna(e.id) else str(e.id)
+        if eid not in pos:
+            continue
+        if e.type == 'created':
+            drop.append(pos[eid])
+        elif e.type != 'checkpoint':
+            _set(df, pos[eid], schema.cast_changes(ws, _load(e.before)))
+    return df.drop(index=drop)
+
+
+def inverse(e):
+    """Änderungen, die ein Event zurücknehmen (für das Undo)."""
+    if e['type'] == 'created':
+        return {'deleted': 'True'}
+    return _load(e['before'])
@@ -0,0 +1,239 @@
+"""
+Lokaler Ersatz für st-gsheets-connection – ein Worksheet pro CSV-Datei.
+Gleiche API wie GSheetsConnection (read(worksheet=, ttl=), update(worksheet=, data=),
+create(worksheet=, data=), client._select_worksheet() mit append_rows/batch_update), dazu
+einstellbare Latenz, Jitter und Quota-Fehler pro Call. Damit laufen Datenschicht und Seiten ohne Netz.
+Wie beim echten Spreadsheet wirft jeder Zugriff auf ein nicht angelegtes Worksheet
+gspread.exceptions.WorksheetNotFound – anlegen kann es nur create().
+
+Auswahl über .streamlit/secrets.toml:
+    [storage]
+    backend          = "local"
+    path             = "local_sheets"
+    latency_ms       = 300
+    jitter_ms        = 100
+    quota_error_rate = 0.02
+
+Benchmark:  python localsheets.py --users 200 --rows 20000 --latency-ms 300
+"""
+import collections
+import csv
+import os
+import random
+import re
+import threading
+import time
+import pandas as pd
+from gspread.exceptions import WorksheetNotFound
+
+
+class QuotaError(Exception):
+    """Nachbildung von gspread APIError 429 (Read/Write requests per minute)."""
+    code = 429
+
+    def __init__(self, op):
+        super().__init__(f"[429] Quota exceeded for quota metric 'Requests' ({op})")
+
+
+def _entered(v):
+    # USER_ENTERED: führendes ' markiert Text und wird nicht gespeichert
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    return v[1:] if isinstance(v, str) and v.startswith("'") else v
+
+
+def _a1(ref):
+    m = re.fullmatch(r"([A-Z]+)(\d+)", ref)
+    col = 0
+    for ch in m.group(1):
+        col = col * 26 + ord(ch) - 64
+    return int(m.group(2)) - 1, col - 1
+
+
+class _Worksheet:
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+
+    @property
+    def row_count(self):
+        return max(len(self.conn._grid(self.name)), 1000)
+
+    def batch_get(self, ranges):
+        self.conn._call('batch_get')
+        with self.conn._lock:
+            grid = self.conn._grid(self.name)
+        out = []
+        for r in ranges:
+            a, b = (int(x) for x in r.split(':'))
+            out.append(grid[a - 1:b])
+        return out
+
+    def append_rows(self, values, value_input_option='RAW', table_range=None):
+        self.conn._call('append_rows')
+        with self.conn._lock:
+            with open(self.conn._file(self.name), 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows([[_entered(v) for v in r] for r in values])
+
+    def batch_update(self, data, value_input_option='RAW'):
+        self.conn._call('batch_update')
+        with self.conn._lock:
+            grid = self.conn._grid(self.name)
+            for item in data:
+                r, c = _a1(item['range'])
+                while len(grid) <= r:
+                    grid.append([])
+                while len(grid[r]) <= c:
+                    grid[r].append("")
+                grid[r][c] = _entered(item['values'][0][0])
+            self.conn._save(self.name, grid)
+
+
+class LocalSheetsConnection:
+    """Dateibasierte GSheetsConnection mit simulierter Latenz und Quota."""
+
+    def __init__(self, path="local_sheets", latency_ms=0, jitter_ms=0, quota_error_rate=0.0, seed=None):
+        self.path             = path
+        self.latency          = float(latency_ms) / 1000
+        self.jitter           = float(jitter_ms) / 1000
+        self.quota_error_rate = float(quota_error_rate)
+        self.calls            = collections.Counter()
+        self._rng             = random.Random(seed)
+        self._lock            = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def client(self):
+        return self
+
+    def _select_worksheet(self, worksheet):
+        self._exists(worksheet)
+        return _Worksheet(self, worksheet)
+
+    def _file(self, ws):
+        return os.path.join(self.path, f"{ws}.csv")
+
+    def _call(self, op):
+        with self._lock:
+            self.calls[op] += 1
+            delay = self.latency + self._rng.uniform(-self.jitter, self.jitter)
+            fail  = self._rng.random() < self.quota_error_rate
+            if fail:
+                self.calls['quota_errors'] += 1
+        time.sleep(max(0.0, delay))
+        if fail:
+            raise QuotaError(op)
+
+    def _exists(self, ws):
+        if not os.path.exists(self._file(ws)):
+            raise WorksheetNotFound(ws)
+
+    def _grid(self, ws):
+        if not os.path.exists(self._file(ws)):
+            return []
+        with open(self._file(ws), newline='', encoding='utf-8') as f:
+            return [row for row in csv.reader(f)]
+
+    def _save(self, ws, grid):
+        tmp = self._file(ws) + ".tmp"
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(grid)
+        os.replace(tmp, self._file(ws))
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        self._call('read')
+        with self._lock:
+            self._exists(worksheet)
+            try:
+                return pd.read_csv(self._file(worksheet), keep_default_na=False, na_values=[""])
+            except pd.errors.EmptyDataError:
+                return pd.DataFrame()
+
+    def _upload(self, worksheet, data):
+        grid = [[str(c) for c in data.columns]] + [
+            [_entered(v) for v in r] for r in data.astype(object).itertuples(index=False, name=None)
+        ]
+        self._save(worksheet, grid)
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        self._call('update')
+        with self._lock:
+            self._exists(worksheet)
+            self._upload(worksheet, data)
+        return data
+
+    def create(self, worksheet=None, data=None, **kwargs):
+        self._call('create')
+        with self._lock:
+            self._upload(worksheet, data)
+        return data
+
+
+# ── Benchmark ────────────────────────────────────────────────
+
+def _seed(path, users, rows, seed=0):
+    rng   = random.Random(seed)
+    today = pd.Timestamp.today().normalize()
+    df = pd.DataFrame({
+        'user':      [f"user{rng.randrange(users)}" for _ in range(rows)],
+        'datum':     [str((today - pd.Timedelta(days=rng.randrange(730))).date()) for _ in range(rows)],
+        'timestamp': "",
+        'typ':       [rng.choice(['Einnahme', 'Ausgabe', 'Ausgabe', 'Depot']) for _ in range(rows)],
+        'kategorie': [rng.choice(['🍔 Essen', '🏠 Miete', '💼 Gehalt', '📦 ETF']) for _ in range(rows)],
+        'betrag':    [round(rng.uniform(-200, 200), 2) for _ in range(rows)],
+        'notiz':     "",
+        'deleted':   [('True' if rng.random() < 0.05 else '') for _ in range(rows)],
+    })
+    LocalSheetsConnection(path).create(worksheet='transactions', data=df)
+
+
+def _bench():
+    import argparse
+    import shutil
+    import tempfile
+    p = argparse.ArgumentParser(description="Datenschicht gegen LocalSheetsConnection messen")
+    p.add_argument('--users', type=int, default=100)
+    p.add_argument('--rows', type=int, default=10000)
+    p.add_argument('--latency-ms', type=float, default=0)
+    p.add_argument('--jitter-ms', type=float, default=0)
+    p.add_argument('--quota-error-rate', type=float, default=0)
+    p.add_argument('--repeat', type=int, default=20)
+    a = p.parse_args()
+
+    path = tempfile.mkdtemp(prefix="balancely_bench_")
+    try:
+        _seed(path, a.users, a.rows)
+        os.environ.update({
+            'BALANCELY_BACKEND': 'local', 'BALANCELY_LOCAL_DIR': path,
+            'BALANCELY_LATENCY_MS': str(a.latency_ms), 'BALANCELY_JITTER_MS': str(a.jitter_ms),
+            'BALANCELY_QUOTA_ERROR_RATE': str(a.quota_error_rate),
+            'BALANCELY_SNAPSHOT_DIR': os.path.join(path, 'snapshots'), 'BALANCELY_WAL': os.path.join(path, 'wal.db'),
+        })
+        import database
+
+        def timed(label, fn, n=1):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn()
+            print(f"{label:<28} {(time.perf_counter() - t0) / n * 1000:10.2f} ms")
+
+        timed("kalt: transactions laden", lambda: database._gs_read("transactions"))
+        timed("user slice (warm)", lambda: database.load_user_transactions("user1"), a.repeat)
+        timed("append_rows (1 Zeile)", lambda: database.append_rows("transactions", [{
+            'user': 'user1', 'datum': '2026-01-01', 'typ': 'Ausgabe', 'kategorie': '🍔 Essen', 'betrag': -1.0,
+        }]), a.repeat)
+        ids = database.load_user_transactions("user1")['id'].tolist()
+        timed("patch_rows (1 Zeile)", lambda: database.patch_rows(
+            "transactions", database.rows_by_id("transactions", ids[:1]), {'notiz': 'bench'}), a.repeat)
+        database._gs_invalidate(*database.SESSION_SHEETS)
+        pf = database.prefetch()
+        print(f"{'prefetch (parallel)':<28} {pf['wall'] * 1000:10.2f} ms  (seriell {pf['serial'] * 1000:.2f} ms)")
+        print(dict(database.backend.conn.calls))
+        print(database.scheduler.stats())
+        print(database.write_stats())
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    _bench()
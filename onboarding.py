@@ -9,7 +9,7 @@ Schritt 8: Abschluss
 
 import streamlit as st
 from constants import THEMES, CURRENCY_SYMBOLS
-from database import save_user_settings, _gs_read, _gs_update
+from database import save_user_settings, _gs_read, patch_rows
 
 
 WALKTHROUGH_STEPS = [
@@ -368,12 +368,9 @@ def onboarding_dialog(user_name: str):
                 save_user_settings(user_name, theme=chosen_theme, currency=chosen_currency)
                 try:
                     df_u = _gs_read("users")
-                    if "onboarding_done" not in df_u.columns:
-                        df_u["onboarding_done"] = ""
                     idx = df_u[df_u["username"] == user_name].index
                     if not idx.empty:
-                        df_u.loc[idx[0], "onboarding_done"] = "True"
-                        _gs_update("users", df_u)
+                        patch_rows("users", [idx[0]], {"onboarding_done": "True"})
                 except Exception:
                     pass
 
@@ -1,11 +1,53 @@
 import calendar
 import datetime
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 
+import analytics_engine as engine
+import charts
 from constants import PALETTE_AUS, PALETTE_EIN, PALETTE_DEP
-from database import _gs_read, load_goal, save_goal
+from database import load_user_transactions, load_goal, save_goal, month_summary, view, prefetch_views
+from schema import date_slice, month_range
+
+
+def _since(now):
+    # Ältester Monat, den ein Abschnitt der Seite braucht (Jahr, 12 Monate, Monats-Navigation);
+    # die Heatmap lädt ihren Monat selbst (_heatmap_view)
+    months = [now.year * 12, now.year * 12 + now.month - 13,
+              now.year * 12 + now.month - 1 + st.session_state.get('analysen_month_offset', 0)]
+    year, month = divmod(min(months), 12)
+    return datetime.date(year, month + 1, 1)
+
+
+def _heatmap_view(user_name, hm_year, hm_month, currency_sym, today):
+    # Kalenderzellen eines Monats – gecacht und für ‹/› vorgerechnet
+    hm_label      = datetime.date(hm_year, hm_month, 1).strftime("%B %Y")
+    start, end    = month_range(hm_year, hm_month)
+    rows          = date_slice(load_user_transactions(user_name, since=start), start, end)
+    tages_summen  = engine.heatmap(engine.daily(rows), hm_year, hm_month)
+    max_val       = max(tages_summen.max() if not tages_summen.empty else 1, 1)
+    days_in_month = calendar.monthrange(hm_year, hm_month)[1]
+    first_weekday = calendar.monthrange(hm_year, hm_month)[0]
+
+    cal_cells = "<div style='width:42px;height:42px;'></div>" * first_weekday
+    for day in range(1, days_in_month + 1):
+        val = tages_summen.get(day, 0)
+        intensity = val / max_val if max_val > 0 else 0
+        is_today  = (hm_year == today.year and hm_month == today.month and day == today.day)
+        if val == 0:
+            bg, text_color = "rgba(15,23,42,0.6)", "#1e293b"
+        else:
+            r, g, b = int(20 + intensity * 235), int(5 + (1 - intensity) * 30), int(5 + (1 - intensity) * 10)
+            bg = f"rgba({r},{g},{b},0.85)"
+            text_color = "#ffffff" if intensity > 0.3 else "#94a3b8"
+        border = "2px solid #38bdf8" if is_today else "1px solid rgba(148,163,184,0.06)"
+        cal_cells += (
+            f"<div title='{day}. {hm_label}: {val:.2f} {currency_sym}' style='width:42px;height:42px;border-radius:8px;"
+            f"background:{bg};border:{border};display:flex;flex-direction:column;align-items:center;justify-content:center;'>"
+            f"<span style='font-family:DM Mono,monospace;font-size:11px;color:#334155;line-height:1;'>{day}</span>"
+            + (f"<span style='font-family:DM Mono,monospace;font-size:8px;color:{text_color};line-height:1;margin-top:2px;'>{val:.0f}{currency_sym}</span>" if val > 0 else "")
+            + "</div>"
+        )
+    return {'cells': cal_cells, 'max': max_val}
 
 
 def render(user_name, currency_sym):
@@ -18,28 +60,25 @@ def render(user_name, currency_sym):
         unsafe_allow_html=True,
     )
 
+    now = datetime.datetime.now()
     try:
-        df_raw = _gs_read("transactions")
+        df_all = load_user_transactions(user_name, since=_since(now))
+        curr   = month_summary(user_name, now.year, now.month)
     except Exception as e:
         st.warning(f"Verbindung wird hergestellt... ({e})")
         return
 
-    if df_raw.empty or 'user' not in df_raw.columns:
+    if df_all.empty or 'user' not in df_all.columns:
         st.info("Noch keine Buchungen vorhanden.")
         return
 
-    df_all = df_raw[df_raw['user'] == user_name].copy()
-    if 'deleted' in df_all.columns:
-        df_all = df_all[~df_all['deleted'].astype(str).str.strip().str.lower().isin(['true', '1', '1.0'])]
-    df_all['datum_dt']   = pd.to_datetime(df_all['datum'], errors='coerce')
-    df_all['betrag_num'] = pd.to_numeric(df_all['betrag'], errors='coerce')
-    df_all = df_all.dropna(subset=['datum_dt'])
+    # Einziger Durchlauf über die Rohzeilen – alle Ansichten kommen aus dem Tagesaggregat
+    dk = engine.daily(df_all)
 
-    if df_all.empty:
+    if dk.empty:
         st.info("Noch keine Buchungen vorhanden.")
         return
 
-    now   = datetime.datetime.now()
     today = now.date()
 
     # ── Zeitraum-Selektor ─────────────────────────────────────
@@ -75,41 +114,26 @@ def render(user_name, currency_sym):
         with an3:
             if st.button("›", key="an_next", use_container_width=True, disabled=(an_offset >= 0)):
                 st.session_state['analysen_month_offset'] += 1; st.rerun()
-        period_mask  = (df_all['datum_dt'].dt.year == an_year) & (df_all['datum_dt'].dt.month == an_month)
+        period_sum   = month_summary(user_name, an_year, an_month)
         period_label = an_label
     elif zeitraum == "Wöchentlich":
         ws = today - datetime.timedelta(days=today.weekday())
         we = ws + datetime.timedelta(days=6)
-        period_mask  = (df_all['datum_dt'].dt.date >= ws) & (df_all['datum_dt'].dt.date <= we)
+        period_sum   = engine.period(dk, ws, we)
         period_label = f"{ws.strftime('%d.%m.')} – {we.strftime('%d.%m.%Y')}"
     else:
-        period_mask  = df_all['datum_dt'].dt.year == now.year
+        period_sum   = month_summary(user_name, now.year)
         period_label = str(now.year)
-
-    period_df = df_all[period_mask].copy()
     st.markdown(f"<div style='font-family:DM Mono,monospace;color:#475569;font-size:11px;letter-spacing:1px;margin-bottom:18px;'>{period_label}</div>", unsafe_allow_html=True)
 
     def make_donut(grp, palette, label, sign, center_color, key_suffix):
         if grp.empty:
             return
         cats   = grp['kategorie'].tolist()
-        vals   = grp['betrag_num'].abs().tolist()
+        vals   = grp['betrag'].abs().tolist()
         colors = [palette[i % len(palette)] for i in range(len(cats))]
         total  = sum(vals) if sum(vals) > 0 else 1
-        fig = go.Figure(go.Pie(
-            labels=cats, values=vals, hole=0.60,
-            marker=dict(colors=colors, line=dict(color="rgba(5,10,20,0.9)", width=2)),
-            textinfo="none", hoverinfo="none", direction="clockwise", sort=False, rotation=90,
-        ))
-        fig.update_traces(hovertemplate=None)
-        fig.update_layout(
-            paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", showlegend=False,
-            margin=dict(t=10, b=10, l=10, r=10), height=240, autosize=True, dragmode=False,
-            annotations=[dict(
-                text=f"<b>{sign}{total:,.2f} {currency_sym}</b>", x=0.5, y=0.5, showarrow=False,
-                font=dict(size=15, color=center_color, family="DM Sans, sans-serif"), xref="paper", yref="paper",
-            )],
-        )
+        fig    = charts.cached(charts.donut, cats, vals, colors, f"{sign}{total:,.2f} {currency_sym}", center_color)
         rows = "".join(
             f"<div style='display:flex;align-items:center;justify-content:space-between;padding:5px 0;"
             f"border-bottom:1px solid rgba(255,255,255,0.04);'>"
@@ -134,21 +158,16 @@ def render(user_name, currency_sym):
             st.markdown(f"<div style='padding:4px 0;'>{rows}</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
-    if period_df.empty:
+    if period_sum.empty:
         st.markdown(
             "<div style='text-align:center;padding:40px 20px;color:#334155;font-family:DM Sans,sans-serif;font-size:15px;'>"
             "Keine Buchungen im gewählten Zeitraum.</div>",
             unsafe_allow_html=True,
         )
     else:
-        aus_p = period_df[period_df['typ'] == 'Ausgabe'].copy()
-        aus_p['betrag_num'] = aus_p['betrag_num'].abs()
-        make_donut(aus_p.groupby('kategorie')['betrag_num'].sum().reset_index().sort_values('betrag_num', ascending=False), PALETTE_AUS, "Ausgaben", "−", "#f87171", "aus")
-        ein_p = period_df[period_df['typ'] == 'Einnahme'].copy()
-        make_donut(ein_p.groupby('kategorie')['betrag_num'].sum().reset_index().sort_values('betrag_num', ascending=False), PALETTE_EIN, "Einnahmen", "+", "#4ade80", "ein")
-        dep_p = period_df[period_df['typ'] == 'Depot'].copy()
-        dep_p['betrag_num'] = dep_p['betrag_num'].abs()
-        make_donut(dep_p.groupby('kategorie')['betrag_num'].sum().reset_index().sort_values('betrag_num', ascending=False), PALETTE_DEP, "Depot", "", "#38bdf8", "dep")
+        make_donut(engine.by_kategorie(period_sum, 'Ausgabe', 'betrag_abs'), PALETTE_AUS, "Ausgaben", "−", "#f87171", "aus")
+        make_donut(engine.by_kategorie(period_sum, 'Einnahme'), PALETTE_EIN, "Einnahmen", "+", "#4ade80", "ein")
+        make_donut(engine.by_kategorie(period_sum, 'Depot', 'betrag_abs'), PALETTE_DEP, "Depot", "", "#38bdf8", "dep")
 
     st.markdown("<hr>", unsafe_allow_html=True)
 
@@ -160,60 +179,21 @@ def render(user_name, currency_sym):
         unsafe_allow_html=True,
     )
     kv_l, kv_r = st.columns(2)
-    _twelve_months_ago = now - datetime.timedelta(days=365)
 
     with kv_l:
-        aus_all = df_all[(df_all['typ'] == 'Ausgabe') & (df_all['datum_dt'] >= _twelve_months_ago)].copy()
-        aus_all['betrag_num'] = aus_all['betrag_num'].abs()
-        _months_in_range = max(aus_all['datum_dt'].dt.to_period('M').nunique(), 1)
-        kat_grp_sum = aus_all.groupby('kategorie')['betrag_num'].sum()
-        kat_avg = (kat_grp_sum / _months_in_range).reset_index()
-        kat_grp = kat_avg.sort_values('betrag_num', ascending=True).tail(8)
+        kat_grp = engine.kategorie_avg(dk, now).tail(8)
         if not kat_grp.empty:
             REDS = ['#7f1d1d', '#991b1b', '#b91c1c', '#dc2626', '#ef4444', '#f87171', '#fca5a5', '#fecaca']
-            fig_kat = go.Figure(go.Bar(
-                x=kat_grp['betrag_num'], y=kat_grp['kategorie'], orientation='h',
-                marker=dict(color=REDS[:len(kat_grp)], cornerradius=6),
-                text=[f"Ø {v:,.0f} {currency_sym}" for v in kat_grp['betrag_num']],
-                textposition='inside', insidetextanchor='middle',
-                textfont=dict(size=11, color='rgba(255,255,255,0.85)', family='DM Mono, monospace'),
-                hovertemplate=None,
-            ))
-            fig_kat.update_traces(hovertemplate=None)
-            fig_kat.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-                height=280, margin=dict(t=0, b=0, l=0, r=10), dragmode=False,
-                xaxis=dict(showgrid=False, showticklabels=False, showline=False, fixedrange=True),
-                yaxis=dict(tickfont=dict(size=12, color='#94a3b8', family='DM Sans, sans-serif'), showgrid=False, showline=False, fixedrange=True, automargin=True),
-            )
+            fig_kat = charts.cached(charts.kategorie_bars, kat_grp, REDS[:len(kat_grp)], currency_sym)
             st.markdown("<p style='font-family:DM Sans,sans-serif;color:#475569;font-size:13px;margin-bottom:8px;'>Top Ausgabe-Kategorien — Ø pro Monat</p>", unsafe_allow_html=True)
             st.plotly_chart(fig_kat, use_container_width=True, key="kat_chart", config={"displayModeBar": False, "staticPlot": True})
         else:
             st.info("Keine Ausgaben vorhanden.")
 
     with kv_r:
-        aus_all2 = df_all[(df_all['typ'] == 'Ausgabe') & (df_all['datum_dt'] >= _twelve_months_ago)].copy()
-        aus_all2['betrag_num'] = aus_all2['betrag_num'].abs()
-        aus_all2['wochentag'] = aus_all2['datum_dt'].dt.day_name()
-        wt_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        wt_de    = {'Monday': 'Mo', 'Tuesday': 'Di', 'Wednesday': 'Mi', 'Thursday': 'Do', 'Friday': 'Fr', 'Saturday': 'Sa', 'Sunday': 'So'}
-        if not aus_all2.empty:
-            heat = aus_all2.groupby('wochentag')['betrag_num'].mean().reindex(wt_order).fillna(0)
-            fig_heat = go.Figure(go.Bar(
-                x=[wt_de.get(d, d) for d in heat.index], y=heat.values,
-                marker=dict(color=heat.values, colorscale=[[0, '#1a0505'], [0.5, '#dc2626'], [1, '#ff5232']], showscale=False, cornerradius=6),
-                text=[f"{v:,.0f} {currency_sym}" if v > 0 else "" for v in heat.values],
-                textposition='inside', insidetextanchor='middle',
-                textfont=dict(size=10, color='rgba(255,255,255,0.7)', family='DM Mono, monospace'),
-                hovertemplate=None,
-            ))
-            fig_heat.update_traces(hovertemplate=None)
-            fig_heat.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-                height=280, margin=dict(t=0, b=0, l=0, r=0), dragmode=False,
-                xaxis=dict(tickfont=dict(size=13, color='#94a3b8', family='DM Sans, sans-serif'), showgrid=False, showline=False, fixedrange=True),
-                yaxis=dict(showgrid=False, showticklabels=False, showline=False, fixedrange=True),
-            )
+        heat = engine.weekdays(dk, now)
+        if heat is not None:
+            fig_heat = charts.cached(charts.weekday_bars, heat, currency_sym)
             st.markdown("<p style='font-family:DM Sans,sans-serif;color:#475569;font-size:13px;margin-bottom:8px;'>Ø Ausgaben nach Wochentag</p>", unsafe_allow_html=True)
             st.plotly_chart(fig_heat, use_container_width=True, key="heat_chart", config={"displayModeBar": False, "staticPlot": True})
 
@@ -240,40 +220,13 @@ def render(user_name, currency_sym):
         if st.button("›", key="hm_next", use_container_width=True, disabled=(hm_offset >= 0)):
             st.session_state['heatmap_month_offset'] += 1; st.rerun()
 
-    hm_df = df_all[
-        (df_all['datum_dt'].dt.year == hm_year) &
-        (df_all['datum_dt'].dt.month == hm_month) &
-        (df_all['typ'] == 'Ausgabe')
-    ].copy()
-    hm_df['betrag_num'] = hm_df['betrag_num'].abs()
-    tages_summen  = hm_df.groupby(hm_df['datum_dt'].dt.day)['betrag_num'].sum()
-    max_val       = max(tages_summen.max() if not tages_summen.empty else 1, 1)
-    days_in_month = calendar.monthrange(hm_year, hm_month)[1]
-    first_weekday = calendar.monthrange(hm_year, hm_month)[0]
-
+    hm        = view(_heatmap_view, user_name, hm_year, hm_month, currency_sym, today)
+    cal_cells = hm['cells']
+    max_val   = hm['max']
     header_html = "".join(
         f"<div style='width:42px;text-align:center;font-family:DM Mono,monospace;font-size:10px;color:#334155;padding-bottom:4px;'>{d}</div>"
         for d in ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
     )
-    cal_cells = "<div style='width:42px;height:42px;'></div>" * first_weekday
-    for day in range(1, days_in_month + 1):
-        val = tages_summen.get(day, 0)
-        intensity = val / max_val if max_val > 0 else 0
-        is_today  = (hm_year == now.year and hm_month == now.month and day == now.day)
-        if val == 0:
-            bg, text_color = "rgba(15,23,42,0.6)", "#1e293b"
-        else:
-            r, g, b = int(20 + intensity * 235), int(5 + (1 - intensity) * 30), int(5 + (1 - intensity) * 10)
-            bg = f"rgba({r},{g},{b},0.85)"
-            text_color = "#ffffff" if intensity > 0.3 else "#94a3b8"
-        border = "2px solid #38bdf8" if is_today else "1px solid rgba(148,163,184,0.06)"
-        cal_cells += (
-            f"<div title='{day}. {hm_label}: {val:.2f} {currency_sym}' style='width:42px;height:42px;border-radius:8px;"
-            f"background:{bg};border:{border};display:flex;flex-direction:column;align-items:center;justify-content:center;'>"
-            f"<span style='font-family:DM Mono,monospace;font-size:11px;color:#334155;line-height:1;'>{day}</span>"
-            + (f"<span style='font-family:DM Mono,monospace;font-size:8px;color:{text_color};line-height:1;margin-top:2px;'>{val:.0f}{currency_sym}</span>" if val > 0 else "")
-            + "</div>"
-        )
     st.markdown(
         f"<div style='background:linear-gradient(145deg,rgba(14,22,38,0.9),rgba(10,16,30,0.95));"
         f"border:1px solid rgba(148,163,184,0.08);border-radius:16px;padding:20px 22px;'>"
@@ -286,6 +239,13 @@ def render(user_name, currency_sym):
         f"<span style='font-family:DM Mono,monospace;font-size:10px;color:#64748b;'>{max_val:.0f} {currency_sym}</span></div></div>",
         unsafe_allow_html=True,
     )
+    # Vor- und Folgemonat im Hintergrund vorrechnen – ‹/› trifft danach den View-Cache
+    nachbarn = []
+    for d in (-1, 1):
+        if hm_offset + d <= 0:
+            n_year, n_mi = divmod(hm_m_total + d, 12)
+            nachbarn.append((n_year, n_mi + 1, currency_sym, today))
+    prefetch_views(_heatmap_view, user_name, nachbarn)
 
     st.markdown("<hr>", unsafe_allow_html=True)
 
@@ -295,24 +255,19 @@ def render(user_name, currency_sym):
         "letter-spacing:1.5px;text-transform:uppercase;margin-bottom:14px;'>Monatsende-Prognose</p>",
         unsafe_allow_html=True,
     )
-    curr_month_df = df_all[(df_all['datum_dt'].dt.year == now.year) & (df_all['datum_dt'].dt.month == now.month)].copy()
-    today_day     = now.day
-    days_in_cur   = calendar.monthrange(now.year, now.month)[1]
-    days_left     = days_in_cur - today_day
-    curr_ein      = curr_month_df[curr_month_df['typ'] == 'Einnahme']['betrag_num'].sum()
-    curr_aus      = curr_month_df[curr_month_df['typ'] == 'Ausgabe']['betrag_num'].abs().sum()
-    curr_dep      = curr_month_df[curr_month_df['typ'] == 'Depot']['betrag_num'].sum()
-    curr_sp_netto = curr_month_df[curr_month_df['typ'] == 'Spartopf']['betrag_num'].sum()
-    daily_rate    = curr_aus / today_day if today_day > 0 else 0
-    fc_aus_total  = daily_rate * days_in_cur
-    fc_remaining  = daily_rate * days_left
-    fc_bank       = curr_ein - fc_aus_total - curr_dep + curr_sp_netto
-    curr_bank     = curr_ein - curr_aus - curr_dep + curr_sp_netto
+    fc           = engine.forecast(curr, now)
+    today_day    = fc['tag']
+    days_in_cur  = fc['tage']
+    days_left    = fc['rest_tage']
+    daily_rate   = fc['tagesrate']
+    fc_remaining = fc['rest']
+    fc_bank      = fc['prognose']
+    curr_bank    = fc['bank']
     fc_color   = "#4ade80" if fc_bank >= 0 else "#f87171"
     fc_str     = f"+{fc_bank:,.2f} {currency_sym}" if fc_bank >= 0 else f"-{abs(fc_bank):,.2f} {currency_sym}"
     curr_color = "#4ade80" if curr_bank >= 0 else "#f87171"
     curr_str   = f"+{curr_bank:,.2f} {currency_sym}" if curr_bank >= 0 else f"-{abs(curr_bank):,.2f} {currency_sym}"
-    month_pct  = today_day / days_in_cur * 100
+    month_pct  = fc['fortschritt']
 
     fc_col_l, fc_col_r = st.columns(2)
     with fc_col_l:
@@ -383,26 +338,10 @@ def render(user_name, currency_sym):
         "letter-spacing:1.5px;text-transform:uppercase;margin-bottom:14px;'>Spar-Potenzial</p>",
         unsafe_allow_html=True,
     )
-    hist_df = df_all[
-        ~((df_all['datum_dt'].dt.year == now.year) & (df_all['datum_dt'].dt.month == now.month)) &
-        (df_all['typ'] == 'Ausgabe')
-    ].copy()
-    hist_df['betrag_num'] = hist_df['betrag_num'].abs()
-    hist_df = hist_df[hist_df['datum_dt'] >= now - datetime.timedelta(days=90)]
-
-    if not hist_df.empty and not curr_month_df.empty:
-        hist_months  = max(hist_df['datum_dt'].dt.to_period('M').nunique(), 1)
-        avg_per_kat  = hist_df.groupby('kategorie')['betrag_num'].sum() / hist_months
-        curr_aus_df  = curr_month_df[curr_month_df['typ'] == 'Ausgabe'].copy()
-        curr_aus_df['betrag_num'] = curr_aus_df['betrag_num'].abs()
-        curr_per_kat = curr_aus_df.groupby('kategorie')['betrag_num'].sum()
-        potenzial_rows = sorted([
-            {'kategorie': kat, 'aktuell': curr_per_kat.get(kat, 0), 'durchschn': avg_per_kat.get(kat, 0),
-             'diff_pct': (curr_per_kat.get(kat, 0) - avg_per_kat.get(kat, 0)) / avg_per_kat.get(kat, 0) * 100,
-             'diff_eur': curr_per_kat.get(kat, 0) - avg_per_kat.get(kat, 0)}
-            for kat in curr_per_kat.index
-            if avg_per_kat.get(kat, 0) > 0 and curr_per_kat.get(kat, 0) > avg_per_kat.get(kat, 0) * 1.1
-        ], key=lambda x: x['diff_eur'], reverse=True)
+    avg_per_kat = engine.hist_avg(dk, now)
+
+    if avg_per_kat is not None and not curr.empty:
+        potenzial_rows = engine.potenzial(curr, avg_per_kat)
 
         if potenzial_rows:
             total_potenzial = sum(r['diff_eur'] for r in potenzial_rows)
@@ -455,15 +394,12 @@ def render(user_name, currency_sym):
         unsafe_allow_html=True,
     )
     current_goal = load_goal(user_name)
-    df_month = df_all[(df_all['datum_dt'].dt.year == now.year) & (df_all['datum_dt'].dt.month == now.month)].copy()
-    df_month['betrag_num'] = pd.to_numeric(df_month['betrag'], errors='coerce')
-    monat_ein        = df_month[df_month['typ'] == 'Einnahme']['betrag_num'].sum()
-    monat_aus        = df_month[df_month['typ'] == 'Ausgabe']['betrag_num'].abs().sum()
-    monat_dep        = df_month[df_month['typ'] == 'Depot']['betrag_num'].sum()
-    monat_sp_einzahl = abs(df_month[(df_month['typ'] == 'Spartopf') & (df_month['betrag_num'] < 0)]['betrag_num'].sum())
-    monat_sp_netto   = df_month[df_month['typ'] == 'Spartopf']['betrag_num'].sum()
-    bank_aktuell     = monat_ein - monat_aus - monat_dep + monat_sp_netto
-    akt_spar         = bank_aktuell + monat_sp_einzahl + abs(monat_dep)
+    sv               = engine.savings(curr)
+    monat_ein        = sv['einnahmen']
+    monat_aus        = sv['ausgaben']
+    monat_dep        = sv['depot']
+    monat_sp_einzahl = sv['toepfe']
+    akt_spar         = sv['gespart']
 
     sg_col_l, sg_col_r = st.columns([1, 1])
     with sg_col_l:
@@ -516,22 +452,20 @@ def render(user_name, currency_sym):
                 unsafe_allow_html=True,
             )
             if not erreicht and fehlbetrag > 0:
-                aus_monat = df_month[df_month['typ'] == 'Ausgabe'].copy()
-                aus_monat['betrag_num'] = aus_monat['betrag_num'].abs()
-                kat_monat = aus_monat.groupby('kategorie')['betrag_num'].sum().reset_index().sort_values('betrag_num', ascending=False)
+                kat_monat = engine.by_kategorie(curr, 'Ausgabe', 'betrag_abs')
                 if not kat_monat.empty:
                     remaining  = fehlbetrag
                     rows_html  = ""
                     for _, kr in kat_monat.iterrows():
                         if remaining <= 0:
                             break
-                        cut = min(kr['betrag_num'], remaining)
+                        cut = min(kr['betrag'], remaining)
                         rows_html += (
                             f"<div style='display:flex;justify-content:space-between;align-items:center;padding:9px 0;"
                             f"border-bottom:1px solid rgba(255,255,255,0.04);'>"
                             f"<span style='font-family:DM Sans,sans-serif;color:#94a3b8;font-size:13px;'>{kr['kategorie']}</span>"
                             f"<div><span style='font-family:DM Mono,monospace;color:#f87171;font-size:12px;'>−{cut:,.2f} {currency_sym}</span>"
-                            f"<span style='font-family:DM Mono,monospace;color:#334155;font-size:11px;margin-left:8px;'>({cut / kr['betrag_num'] * 100:.0f}%)</span></div></div>"
+                            f"<span style='font-family:DM Mono,monospace;color:#334155;font-size:11px;margin-left:8px;'>({cut / kr['betrag'] * 100:.0f}%)</span></div></div>"
                         )
                         remaining -= cut
                     st.markdown(
@@ -1,13 +1,51 @@
 import datetime
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 
+import charts
 from constants import PALETTE_AUS, PALETTE_EIN, PALETTE_DEP, CURRENCY_SYMBOLS
-from database import _gs_read, load_toepfe, load_goal
+from database import (
+    load_user_transactions, load_toepfe, load_goal, month_summary, balance_at, balance_history, view, prefetch_views,
+)
+from schema import date_slice, month_range
 from styling import inject_theme
 
 
+def _by_kategorie(summ, typ, col):
+    # Monatssummen eines Typs je Kategorie aus dem Aggregat-Würfel
+    return (summ[summ["typ"] == typ][["kategorie", col]].rename(columns={col: "betrag"})
+            .sort_values("betrag", ascending=False))
+
+
+def _month_view(user_name, year, month, currency_sym):
+    # Monatsmodell: Summen, Donut-Segmente und Figure – gecacht und für ‹/› vorgerechnet
+    summ = month_summary(user_name, year, month)
+    if summ.empty:
+        return None
+    typ_sum = summ.groupby("typ")[["betrag", "betrag_neg", "betrag_abs"]].sum()
+    typ_sum = typ_sum.reindex(["Einnahme", "Ausgabe", "Depot", "Spartopf"], fill_value=0.0)
+    ein     = typ_sum.at["Einnahme", "betrag"]
+    aus     = typ_sum.at["Ausgabe", "betrag_abs"]
+    dep     = typ_sum.at["Depot", "betrag_abs"]
+    bank    = ein - aus - dep + typ_sum.at["Spartopf", "betrag"]
+    bank_color = "#e2e8f0" if bank >= 0 else "#f87171"
+    bank_str   = f"{bank:,.2f} {currency_sym}" if bank >= 0 else f"-{abs(bank):,.2f} {currency_sym}"
+
+    cats, vals, colors, types = [], [], [], []
+    for typ, col, palette in (("Einnahme", "betrag", PALETTE_EIN), ("Ausgabe", "betrag_abs", PALETTE_AUS),
+                              ("Depot", "betrag_abs", PALETTE_DEP)):
+        for i, (kat, val) in enumerate(_by_kategorie(summ, typ, col).itertuples(index=False, name=None)):
+            cats.append(kat); vals.append(float(val))
+            colors.append(palette[i % len(palette)]); types.append(typ)
+
+    fig = charts.cached(charts.bank_donut, cats, vals, colors, bank_str, bank_color,
+                        f"+{ein:,.0f}  /  -{aus:,.0f} {currency_sym}")
+    return {
+        'ein': ein, 'aus': aus, 'dep_monat': dep, 'sp_einz': abs(typ_sum.at["Spartopf", "betrag_neg"]),
+        'bank': bank, 'bank_color': bank_color, 'bank_str': bank_str,
+        'cats': cats, 'vals': vals, 'colors': colors, 'types': types, 'fig': fig,
+    }
+
+
 def render(user_name, user_settings, theme, currency_sym):
     now = datetime.datetime.now()
     st.markdown(
@@ -43,18 +81,9 @@ def render(user_name, user_settings, theme, currency_sym):
             st.rerun()
 
     try:
-        df_t = _gs_read("transactions")
-        if "user" not in df_t.columns:
-            st.info("Noch keine Daten vorhanden.")
-            return
-
-        alle = df_t[df_t["user"] == user_name].copy()
-        if "deleted" in alle.columns:
-            alle = alle[~alle["deleted"].astype(str).str.strip().str.lower().isin(["true", "1", "1.0"])]
-        alle["datum_dt"] = pd.to_datetime(alle["datum"], errors="coerce")
-        monat_df = alle[(alle["datum_dt"].dt.year == t_year) & (alle["datum_dt"].dt.month == t_month)].copy()
+        mv = view(_month_view, user_name, t_year, t_month, currency_sym)
 
-        if monat_df.empty:
+        if mv is None:
             st.markdown(
                 f"<div style='text-align:center;padding:60px 20px;color:#334155;font-family:DM Sans,sans-serif;"
                 f"font-size:15px;'>Keine Buchungen im {monat_label}</div>",
@@ -62,21 +91,17 @@ def render(user_name, user_settings, theme, currency_sym):
             )
             return
 
-        monat_df["betrag_num"] = pd.to_numeric(monat_df["betrag"], errors="coerce")
-        alle["betrag_num"]     = pd.to_numeric(alle["betrag"], errors="coerce")
-
-        ein        = monat_df[monat_df["typ"] == "Einnahme"]["betrag_num"].sum()
-        aus        = monat_df[monat_df["typ"] == "Ausgabe"]["betrag_num"].abs().sum()
-        dep_monat  = monat_df[monat_df["typ"] == "Depot"]["betrag_num"].abs().sum()
-        sp_netto   = monat_df[monat_df["typ"] == "Spartopf"]["betrag_num"].sum()
-        bank       = ein - aus - dep_monat + sp_netto
-        dep_gesamt = alle[alle["typ"] == "Depot"]["betrag_num"].abs().sum()
+        ein        = mv['ein']
+        aus        = mv['aus']
+        dep_monat  = mv['dep_monat']
+        bank       = mv['bank']
+        dep_gesamt = balance_at(user_name)["depot"]
         topf_gesamt= sum(t['gespart'] for t in load_toepfe(user_name))
         networth   = bank + dep_gesamt + topf_gesamt
 
-        bank_color = "#e2e8f0" if bank >= 0 else "#f87171"
+        bank_color = mv['bank_color']
         nw_color   = "#4ade80" if networth >= 0 else "#f87171"
-        bank_str   = f"{bank:,.2f} {currency_sym}" if bank >= 0 else f"-{abs(bank):,.2f} {currency_sym}"
+        bank_str   = mv['bank_str']
         nw_str     = f"{networth:,.2f} {currency_sym}" if networth >= 0 else f"-{abs(networth):,.2f} {currency_sym}"
 
         # Budget bar
@@ -101,7 +126,7 @@ def render(user_name, user_settings, theme, currency_sym):
         # Sparziel alert
         if offset == 0:
             _goal    = load_goal(user_name)
-            _sp_einz = abs(monat_df[(monat_df["typ"] == "Spartopf") & (monat_df["betrag_num"] < 0)]["betrag_num"].sum())
+            _sp_einz = mv['sp_einz']
             if _goal > 0:
                 _effektiv = bank + _sp_einz
                 if _effektiv < _goal:
@@ -132,7 +157,7 @@ def render(user_name, user_settings, theme, currency_sym):
                         unsafe_allow_html=True,
                     )
 
-        _sp_einz2 = abs(monat_df[(monat_df["typ"] == "Spartopf") & (monat_df["betrag_num"] < 0)]["betrag_num"].sum())
+        _sp_einz2 = mv['sp_einz']
         dep_html = (
             f"<div style='flex:1;min-width:160px;background:linear-gradient(145deg,rgba(14,22,38,0.9),rgba(10,16,30,0.95));"
             f"border:1px solid rgba(56,189,248,0.15);border-radius:16px;padding:20px 22px;'>"
@@ -173,43 +198,8 @@ def render(user_name, user_settings, theme, currency_sym):
             unsafe_allow_html=True,
         )
 
-        ausg_df  = monat_df[monat_df["typ"] == "Ausgabe"].copy()
-        ausg_df["betrag_num"] = ausg_df["betrag_num"].abs()
-        ein_df   = monat_df[monat_df["typ"] == "Einnahme"].copy()
-        dep_df   = monat_df[monat_df["typ"] == "Depot"].copy()
-        dep_df["betrag_num"] = pd.to_numeric(dep_df["betrag_num"], errors="coerce").abs()
-        ausg_grp = ausg_df.groupby("kategorie")["betrag_num"].sum().reset_index().sort_values("betrag_num", ascending=False)
-        ein_grp  = ein_df.groupby("kategorie")["betrag_num"].sum().reset_index().sort_values("betrag_num", ascending=False)
-        dep_grp  = dep_df.groupby("kategorie")["betrag_num"].sum().reset_index().sort_values("betrag_num", ascending=False)
-
-        all_cats, all_vals, all_colors, all_types = [], [], [], []
-        for i, (_, row) in enumerate(ein_grp.iterrows()):
-            all_cats.append(row["kategorie"]); all_vals.append(float(row["betrag_num"]))
-            all_colors.append(PALETTE_EIN[i % len(PALETTE_EIN)]); all_types.append("Einnahme")
-        for i, (_, row) in enumerate(ausg_grp.iterrows()):
-            all_cats.append(row["kategorie"]); all_vals.append(float(row["betrag_num"]))
-            all_colors.append(PALETTE_AUS[i % len(PALETTE_AUS)]); all_types.append("Ausgabe")
-        for i, (_, row) in enumerate(dep_grp.iterrows()):
-            all_cats.append(row["kategorie"]); all_vals.append(float(row["betrag_num"]))
-            all_colors.append(PALETTE_DEP[i % len(PALETTE_DEP)]); all_types.append("Depot")
-
-        fig = go.Figure(go.Pie(
-            labels=all_cats, values=all_vals, hole=0.62,
-            marker=dict(colors=all_colors, line=dict(color="rgba(5,10,20,0.8)", width=2)),
-            textinfo="none", hoverinfo="none", direction="clockwise", sort=False, rotation=90,
-        ))
-        fig.update_layout(
-            paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", showlegend=False,
-            margin=dict(t=20, b=20, l=20, r=20), height=380, autosize=True,
-            annotations=[
-                dict(text="BANK", x=0.5, y=0.62, showarrow=False,
-                     font=dict(size=10, color="#334155", family="DM Mono, monospace"), xref="paper", yref="paper"),
-                dict(text=f"<b>{bank_str}</b>", x=0.5, y=0.50, showarrow=False,
-                     font=dict(size=22, color=bank_color, family="DM Sans, sans-serif"), xref="paper", yref="paper"),
-                dict(text=f"+{ein:,.0f}  /  -{aus:,.0f} {currency_sym}", x=0.5, y=0.38, showarrow=False,
-                     font=dict(size=11, color="#334155", family="DM Sans, sans-serif"), xref="paper", yref="paper"),
-            ],
-        )
+        all_cats, all_vals, all_colors, all_types = mv['cats'], mv['vals'], mv['colors'], mv['types']
+        fig = mv['fig']
 
         chart_col, legend_col = st.columns([2, 2])
         with chart_col:
@@ -219,9 +209,13 @@ def render(user_name, user_settings, theme, currency_sym):
             sel_typ   = st.session_state.get('dash_selected_typ')
             sel_color = st.session_state.get('dash_selected_color')
             if sel_cat and sel_typ:
-                src_df = {"Ausgabe": ausg_df, "Einnahme": ein_df, "Depot": dep_df}.get(sel_typ, ausg_df)
-                detail  = src_df[src_df["kategorie"] == sel_cat]
-                total_d = detail["betrag_num"].sum()
+                # Einzelbuchungen nur für die gewählte Kategorie laden
+                alle    = date_slice(load_user_transactions(user_name, since=datetime.date(t_year, t_month, 1)),
+                                     *month_range(t_year, t_month))
+                detail  = alle[(alle["typ"] == sel_typ) & (alle["kategorie"] == sel_cat)]
+                if sel_typ != "Einnahme":
+                    detail = detail.assign(betrag=detail["betrag"].abs())
+                total_d = detail["betrag"].sum()
                 sign    = "−" if sel_typ == "Ausgabe" else "+"
                 rows_html = "".join(
                     f"<div style='display:flex;justify-content:space-between;align-items:center;padding:10px 0;"
@@ -231,8 +225,8 @@ def render(user_name, user_settings, theme, currency_sym):
                     + (f"<span style='color:#94a3b8;font-size:13px;'>{str(tr.get('notiz', ''))}</span>"
                        if str(tr.get('notiz', '')).lower() not in ('nan', '') else "")
                     + f"</div><span style='color:{sel_color};font-weight:600;font-size:13px;font-family:DM Mono,monospace;'>"
-                    f"{sign}{tr['betrag_num']:,.2f} {currency_sym}</span></div>"
-                    for _, tr in detail.sort_values("datum_dt", ascending=False).iterrows()
+                    f"{sign}{tr['betrag']:,.2f} {currency_sym}</span></div>"
+                    for _, tr in detail.iloc[::-1].iterrows()
                 )
                 if st.button("← Alle Kategorien", key="dash_back_btn"):
                     st.session_state.update({'dash_selected_cat': None, 'dash_selected_typ': None, 'dash_selected_color': None})
@@ -284,5 +278,24 @@ def render(user_name, user_settings, theme, currency_sym):
                             st.session_state.update({'dash_selected_cat': cat, 'dash_selected_typ': typ, 'dash_selected_color': color})
                             st.rerun()
 
+        # ── Vermögensverlauf ──────────────────────────────────
+        verlauf = balance_history(user_name)
+        if len(verlauf) > 1:
+            st.markdown(
+                "<p style='font-family:DM Mono,monospace;color:#334155;font-size:10px;font-weight:500;"
+                "letter-spacing:1.5px;text-transform:uppercase;margin:28px 0 10px 0;'>Vermögensverlauf</p>",
+                unsafe_allow_html=True,
+            )
+            fig_nw = charts.cached(charts.networth, verlauf, currency_sym)
+            st.plotly_chart(fig_nw, use_container_width=True, key="networth_chart", config={"displayModeBar": False})
+
     except Exception as e:
         st.warning(f"Verbindung wird hergestellt... ({e})")
+    finally:
+        # Vor- und Folgemonat im Hintergrund vorrechnen – ‹/› trifft danach den View-Cache
+        nachbarn = []
+        for d in (-1, 1):
+            if offset + d <= 0:
+                n_year, n_mi = divmod(m_total + d, 12)
+                nachbarn.append((n_year, n_mi + 1, currency_sym))
+        prefetch_views(_month_view, user_name, nachbarn)
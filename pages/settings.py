@@ -5,7 +5,8 @@ import streamlit as st
 
 from constants import THEMES, CURRENCY_SYMBOLS
 from database import (
-    _gs_read, _gs_update, _gs_invalidate,
+    _gs_read, _gs_update, patch_rows, write_batch, user_rows, load_user_transactions, soft_delete,
+    delete_user_transactions, rename_user, sheet,
     load_user_settings, save_user_settings,
 )
 from styling import section_header, inject_theme
@@ -114,21 +115,9 @@ def _render_profil(user_name, user_settings, theme):
                     elif new_uname == user_name:     st.error("❌ Das ist bereits dein Benutzername.")
                     elif not df_u_name[df_u_name['username'] == new_uname].empty: st.error("❌ Benutzername bereits vergeben.")
                     else:
-                        df_u_name.loc[idx_un[0], 'username'] = new_uname
-                        if 'username_changed_at' not in df_u_name.columns:
-                            df_u_name['username_changed_at'] = ''
-                        df_u_name.loc[idx_un[0], 'username_changed_at'] = str(datetime.date.today())
-                        _gs_update("users", df_u_name)
-                        for ws, col in [("transactions", "user"), ("toepfe", "user"), ("goals", "user"), ("settings", "user"), ("dauerauftraege", "user")]:
-                            try:
-                                df_ws = _gs_read(ws)
-                                if col in df_ws.columns:
-                                    df_ws.loc[df_ws[col] == user_name, col] = new_uname
-                                    _gs_update(ws, df_ws)
-                            except:
-                                pass
-                        for k in [k for k in st.session_state if k.startswith("_gs_cache_")]:
-                            del st.session_state[k]
+                        with write_batch():
+                            rename_user(user_name, new_uname)
+                            patch_rows("users", [idx_un[0]], {'username_changed_at': str(datetime.date.today())})
                         st.session_state['user_name'] = new_uname
                         st.success(f"✅ Benutzername geändert zu @{new_uname}!")
                         st.rerun()
@@ -157,7 +146,6 @@ def _render_finanzen(user_name, user_settings, currency_sym):
             new_currency = curr_options[curr_labels.index(new_curr_lbl)]
             if st.form_submit_button("Währung speichern", use_container_width=True, type="primary"):
                 save_user_settings(user_name, currency=new_currency)
-                _gs_invalidate("settings")
                 st.success(f"✅ Währung auf {new_currency} gesetzt!")
                 st.rerun()
 
@@ -223,8 +211,7 @@ def _render_sicherheit(user_name, user_settings, theme):
                     if not ok:            st.error(f"❌ {msg}")
                     elif pw_neu != pw_neu2: st.error("❌ Die neuen Passwörter stimmen nicht überein.")
                     else:
-                        df_u.loc[idx[0], 'password'] = make_hashes(pw_neu)
-                        _gs_update("users", df_u)
+                        patch_rows("users", [idx[0]], {'password': make_hashes(pw_neu)})
                         st.success("✅ Passwort erfolgreich geändert!")
 
     with col_r:
@@ -274,8 +261,7 @@ def _render_sicherheit(user_name, user_settings, theme):
                         df_u2 = _gs_read("users")
                         idx2  = df_u2[df_u2['username'] == user_name].index
                         if not idx2.empty:
-                            df_u2.loc[idx2[0], 'email'] = st.session_state['email_verify_new']
-                            _gs_update("users", df_u2)
+                            patch_rows("users", [idx2[0]], {'email': st.session_state['email_verify_new']})
                         st.session_state.update({'email_verify_code': "", 'email_verify_expiry': None, 'email_verify_new': ""})
                         st.success("✅ E-Mail-Adresse erfolgreich geändert!")
                         st.rerun()
@@ -288,12 +274,9 @@ def _render_daten(user_name, currency_sym):
     # Export
     section_header("Excel-Export")
     try:
-        df_export = _gs_read("transactions")
+        df_export = load_user_transactions(user_name)
         if 'user' in df_export.columns:
-            df_export = df_export[df_export['user'] == user_name]
-            if 'deleted' in df_export.columns:
-                df_export = df_export[~df_export['deleted'].astype(str).str.strip().str.lower().isin(['true', '1', '1.0'])]
-            df_export = df_export.drop(columns=['deleted', 'user'], errors='ignore')
+            df_export = df_export.drop(columns=['deleted', 'user', 'datum_dt'], errors='ignore')
         buffer = io.BytesIO()
         with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
             df_export.to_excel(writer, index=False, sheet_name='Transaktionen')
@@ -332,10 +315,7 @@ def _render_daten(user_name, currency_sym):
         with rc1:
             if st.button("Ja, löschen", use_container_width=True, type="primary"):
                 try:
-                    df_all_t = _gs_read("transactions")
-                    if 'deleted' not in df_all_t.columns: df_all_t['deleted'] = ''
-                    df_all_t.loc[df_all_t['user'] == user_name, 'deleted'] = 'True'
-                    _gs_update("transactions", df_all_t)
+                    delete_user_transactions(user_name)
                     st.session_state['confirm_reset'] = False
                     st.success("✅ Alle Transaktionen gelöscht.")
                     st.rerun()
@@ -367,20 +347,15 @@ def _render_daten(user_name, currency_sym):
         with da1:
             if st.button("Ja, Account löschen", use_container_width=True, type="primary"):
                 try:
-                    for ws, col_name in [("transactions", "user"), ("toepfe", "user")]:
-                        df_ws = _gs_read(ws)
-                        if 'deleted' not in df_ws.columns: df_ws['deleted'] = ''
-                        df_ws.loc[df_ws[col_name] == user_name, 'deleted'] = 'True'
-                        _gs_update(ws, df_ws)
-                    for ws in ["goals", "settings"]:
-                        df_ws = _gs_read(ws)
-                        _gs_update(ws, df_ws[df_ws['user'] != user_name])
-                    df_u3 = _gs_read("users")
-                    if 'deleted' not in df_u3.columns: df_u3['deleted'] = ''
-                    df_u3.loc[df_u3['username'] == user_name, 'deleted'] = 'True'
-                    _gs_update("users", df_u3)
-                    for k in [k for k in st.session_state if k.startswith("_gs_cache_")]:
-                        del st.session_state[k]
+                    with write_batch():
+                        delete_user_transactions(user_name)
+                        ws_t = sheet("toepfe", user_name)
+                        soft_delete(ws_t, user_rows(ws_t, user_name).index)
+                        for ws in [sheet("goals", user_name), sheet("settings", user_name)]:
+                            df_ws = _gs_read(ws)
+                            _gs_update(ws, df_ws[df_ws['user'] != user_name])
+                        df_u3 = _gs_read("users")
+                        patch_rows("users", df_u3[df_u3['username'] == user_name].index, {'deleted': 'True'})
                     st.session_state.update({'logged_in': False, 'user_name': '', 'confirm_delete_account': False})
                     st.rerun()
                 except Exception as e:
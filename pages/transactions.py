@@ -1,16 +1,15 @@
 import datetime
 import re as _re
-import pandas as pd
 import streamlit as st
 
 from constants import DEFAULT_CATS, TYPE_COLORS
 from database import (
-    _gs_read, _gs_update,
+    append_rows, sheet, load_user_transactions, update_transaction, last_op, undo_last, live_since, partition_years, shard_of,
     load_custom_cats, save_custom_cat,
     load_dauerauftraege, save_dauerauftrag, delete_dauerauftrag,
 )
 from dialogs import new_category_dialog, edit_category_dialog, confirm_delete_cat, confirm_delete
-from utils import format_timestamp, find_row_mask
+from utils import format_timestamp
 
 
 def render(user_name, currency_sym):
@@ -68,13 +67,12 @@ def render(user_name, currency_sym):
                 t_note = st.text_input("Notiz (optional)", placeholder="z.B. Supermarkt, Tankstelle...")
             if st.form_submit_button("Speichern", use_container_width=True):
                 betrag_save = t_amount if t_type in ("Depot", "Einnahme") else -t_amount
-                new_row = pd.DataFrame([{
+                append_rows(sheet("transactions", user_name), [{
                     "user": user_name, "datum": str(t_date),
                     "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
                     "typ": t_type, "kategorie": t_cat, "betrag": betrag_save,
                     "notiz": t_note, "deleted": "",
                 }])
-                _gs_update("transactions", pd.concat([_gs_read("transactions"), new_row], ignore_index=True))
                 st.session_state['tx_page'] = 0
                 st.success(f"✅ {t_type} über {t_amount:.2f} {currency_sym} gespeichert!")
                 st.balloons()
@@ -110,7 +108,12 @@ def render(user_name, currency_sym):
             unsafe_allow_html=True,
         )
 
-        search_col, _ = st.columns([2, 3])
+        search_col, _, undo_col = st.columns([2, 2, 1])
+        with undo_col:
+            if st.button("↩️ Rückgängig", use_container_width=True, type="secondary",
+                         disabled=last_op(user_name) is None, help="Letzte Änderung zurücknehmen"):
+                undo_last(user_name)
+                st.rerun()
         with search_col:
             search_val = st.text_input(
                 "🔍 Suchen...", value=st.session_state.get('tx_search', ''),
@@ -122,125 +125,121 @@ def render(user_name, currency_sym):
                 st.rerun()
 
         try:
-            df_t = _gs_read("transactions")
-            if 'user' not in df_t.columns:
+            # Ältere Jahres-Partitionen erst laden, wenn über das Ende der Liste hinaus geblättert wird
+            since   = live_since().replace(year=live_since().year - st.session_state.get('tx_years_back', 0))
+            older   = any(y < since.year for y in partition_years(shard_of(user_name)))
+            user_df = load_user_transactions(user_name, since=since)
+            if user_df.empty:
                 st.info("Noch keine Buchungen vorhanden.")
             else:
-                del_mask = (~df_t['deleted'].astype(str).str.strip().str.lower().isin(['true', '1', '1.0'])
-                            if 'deleted' in df_t.columns
-                            else pd.Series([True] * len(df_t), index=df_t.index))
-                user_df = df_t[(df_t['user'] == user_name) & del_mask].copy()
-                if user_df.empty:
-                    st.info("Noch keine Buchungen vorhanden.")
-                else:
-                    def betrag_anzeige(row, sym=currency_sym):
-                        x = pd.to_numeric(row['betrag'], errors='coerce')
-                        if row.get('typ') == 'Depot':    return f"📦 {abs(x):.2f} {sym}"
-                        if row.get('typ') == 'Spartopf': return f"🪣 {abs(x):.2f} {sym}" if x < 0 else f"🪣 +{abs(x):.2f} {sym}"
-                        return f"+{x:.2f} {sym}" if x > 0 else f"{x:.2f} {sym}"
+                def betrag_anzeige(row, sym=currency_sym):
+                    x = row['betrag']
+                    if row.get('typ') == 'Depot':    return f"📦 {abs(x):.2f} {sym}"
+                    if row.get('typ') == 'Spartopf': return f"🪣 {abs(x):.2f} {sym}" if x < 0 else f"🪣 +{abs(x):.2f} {sym}"
+                    return f"+{x:.2f} {sym}" if x > 0 else f"{x:.2f} {sym}"
 
-                    user_df['betrag_anzeige'] = user_df.apply(betrag_anzeige, axis=1)
-                    sort_col = 'timestamp' if 'timestamp' in user_df.columns else 'datum'
-                    user_df  = user_df.sort_values(sort_col, ascending=False)
+                user_df['betrag_anzeige'] = user_df.apply(betrag_anzeige, axis=1)
+                sort_col = 'timestamp' if 'timestamp' in user_df.columns else 'datum'
+                user_df  = user_df.sort_values(sort_col, ascending=False)
 
-                    search_q = st.session_state.get('tx_search', '').strip().lower()
-                    if search_q:
-                        _pat = _re.escape(search_q)
-                        betrag_match = user_df['betrag_anzeige'].str.lower().str.contains(
-                            r'(?<!\d)' + _pat + r'(?!\d)', na=False, regex=True)
-                        mask_s = (
-                            user_df['kategorie'].str.lower().str.contains(search_q, na=False) |
-                            user_df['notiz'].astype(str).str.lower().str.contains(search_q, na=False) |
-                            betrag_match |
-                            user_df['typ'].str.lower().str.contains(search_q, na=False)
-                        )
-                        user_df = user_df[mask_s]
+                search_q = st.session_state.get('tx_search', '').strip().lower()
+                if search_q:
+                    _pat = _re.escape(search_q)
+                    betrag_match = user_df['betrag_anzeige'].str.lower().str.contains(
+                        r'(?<!\d)' + _pat + r'(?!\d)', na=False, regex=True)
+                    mask_s = (
+                        user_df['kategorie'].str.lower().str.contains(search_q, na=False) |
+                        user_df['notiz'].astype(str).str.lower().str.contains(search_q, na=False) |
+                        betrag_match |
+                        user_df['typ'].str.lower().str.contains(search_q, na=False)
+                    )
+                    user_df = user_df[mask_s]
 
-                    PAGE_SIZE = 10
-                    total    = len(user_df)
-                    page     = st.session_state.get('tx_page', 0)
-                    max_page = max(0, (total - 1) // PAGE_SIZE)
-                    page     = min(page, max_page)
-                    st.session_state['tx_page'] = page
-                    start    = page * PAGE_SIZE
-                    page_df  = user_df.iloc[start:start + PAGE_SIZE]
+                PAGE_SIZE = 10
+                total    = len(user_df)
+                page     = st.session_state.get('tx_page', 0)
+                max_page = max(0, (total - 1) // PAGE_SIZE)
+                page     = min(page, max_page)
+                st.session_state['tx_page'] = page
+                start    = page * PAGE_SIZE
+                page_df  = user_df.iloc[start:start + PAGE_SIZE]
 
-                    if page_df.empty:
-                        st.info("Keine Buchungen gefunden.")
-                    else:
-                        for orig_idx, row in page_df.iterrows():
-                            notiz      = str(row.get('notiz', ''))
-                            notiz      = '' if notiz.lower() == 'nan' else notiz
-                            betrag_num = pd.to_numeric(row['betrag'], errors='coerce')
-                            farbe      = TYPE_COLORS.get(row['typ'], '#f87171')
-                            zeit_label = format_timestamp(row.get('timestamp', ''), row.get('datum', ''))
+                if page_df.empty:
+                    st.info("Keine Buchungen gefunden.")
+                else:
+                    for orig_idx, row in page_df.iterrows():
+                        notiz      = str(row.get('notiz', ''))
+                        notiz      = '' if notiz.lower() == 'nan' else notiz
+                        betrag_num = row['betrag']
+                        farbe      = TYPE_COLORS.get(row['typ'], '#f87171')
+                        zeit_label = format_timestamp(row.get('timestamp', ''), row.get('datum', ''))
 
-                            c1, c2, c3, c4, c5 = st.columns([2.5, 2, 2.5, 3, 1])
-                            c1.markdown(f"<span style='font-family:DM Mono,monospace;color:#334155;font-size:12px;line-height:2.4;display:block;'>{zeit_label}</span>", unsafe_allow_html=True)
-                            c2.markdown(f"<span style='font-family:DM Mono,monospace;color:{farbe};font-weight:500;font-size:13px;line-height:2.4;display:block;'>{row['betrag_anzeige']}</span>", unsafe_allow_html=True)
-                            c3.markdown(f"<span style='font-family:DM Sans,sans-serif;color:#64748b;font-size:13px;line-height:2.4;display:block;'>{row['kategorie']}</span>", unsafe_allow_html=True)
-                            c4.markdown(f"<span style='font-family:DM Sans,sans-serif;color:#334155;font-size:13px;line-height:2.4;display:block;'>{notiz}</span>", unsafe_allow_html=True)
-                            with c5:
-                                with st.popover("⋯", use_container_width=True):
-                                    if st.button("✏️ Bearbeiten", key=f"edit_btn_{orig_idx}", use_container_width=True):
-                                        st.session_state['edit_idx'] = None if st.session_state['edit_idx'] == orig_idx else orig_idx
-                                        st.session_state['show_new_cat'] = False
-                                        st.rerun()
-                                    if st.button("🗑️ Löschen", key=f"del_btn_{orig_idx}", use_container_width=True):
-                                        confirm_delete({"user": row['user'], "datum": row['datum'], "betrag": row['betrag'],
-                                                        "betrag_anzeige": row['betrag_anzeige'], "kategorie": row['kategorie']})
+                        c1, c2, c3, c4, c5 = st.columns([2.5, 2, 2.5, 3, 1])
+                        c1.markdown(f"<span style='font-family:DM Mono,monospace;color:#334155;font-size:12px;line-height:2.4;display:block;'>{zeit_label}</span>", unsafe_allow_html=True)
+                        c2.markdown(f"<span style='font-family:DM Mono,monospace;color:{farbe};font-weight:500;font-size:13px;line-height:2.4;display:block;'>{row['betrag_anzeige']}</span>", unsafe_allow_html=True)
+                        c3.markdown(f"<span style='font-family:DM Sans,sans-serif;color:#64748b;font-size:13px;line-height:2.4;display:block;'>{row['kategorie']}</span>", unsafe_allow_html=True)
+                        c4.markdown(f"<span style='font-family:DM Sans,sans-serif;color:#334155;font-size:13px;line-height:2.4;display:block;'>{notiz}</span>", unsafe_allow_html=True)
+                        with c5:
+                            with st.popover("⋯", use_container_width=True):
+                                if st.button("✏️ Bearbeiten", key=f"edit_btn_{orig_idx}", use_container_width=True):
+                                    st.session_state['edit_idx'] = None if st.session_state['edit_idx'] == orig_idx else orig_idx
+                                    st.session_state['show_new_cat'] = False
+                                    st.rerun()
+                                if st.button("🗑️ Löschen", key=f"del_btn_{orig_idx}", use_container_width=True):
+                                    confirm_delete({"id": row['id'], "user": row['user'], "datum": row['datum'], "betrag": row['betrag'],
+                                                    "betrag_anzeige": row['betrag_anzeige'], "kategorie": row['kategorie']})
 
-                            if st.session_state['edit_idx'] == orig_idx:
-                                with st.form(key=f"edit_form_{orig_idx}"):
-                                    st.markdown(
-                                        "<p style='font-family:DM Sans,sans-serif;color:#38bdf8;font-weight:500;font-size:14px;margin-bottom:12px;'>Eintrag bearbeiten</p>",
-                                        unsafe_allow_html=True,
-                                    )
-                                    ec1, ec2 = st.columns(2)
-                                    with ec1:
-                                        e_betrag = st.number_input(f"Betrag in {currency_sym}", value=abs(float(betrag_num)), min_value=0.01, step=0.01, format="%.2f")
-                                        e_datum  = st.date_input("Datum", value=datetime.date.fromisoformat(str(row['datum'])))
-                                    with ec2:
-                                        e_typ = st.selectbox("Typ", ["Einnahme", "Ausgabe", "Depot"],
-                                                             index=["Einnahme", "Ausgabe", "Depot"].index(row['typ']) if row['typ'] in ["Einnahme", "Ausgabe", "Depot"] else 1)
-                                        e_all_cats = DEFAULT_CATS[e_typ] + load_custom_cats(user_name, e_typ)
-                                        e_cat = st.selectbox("Kategorie", e_all_cats,
-                                                             index=e_all_cats.index(row['kategorie']) if row['kategorie'] in e_all_cats else 0)
-                                    e_notiz = st.text_input("Notiz (optional)", value=notiz)
-                                    cs, cc = st.columns(2)
-                                    with cs: saved     = st.form_submit_button("Speichern", use_container_width=True, type="primary")
-                                    with cc: cancelled = st.form_submit_button("Abbrechen", use_container_width=True)
-                                    if saved:
-                                        df_all = _gs_read("transactions")
-                                        if 'deleted' not in df_all.columns: df_all['deleted'] = ''
-                                        match_idx = df_all[find_row_mask(df_all, row)].index
-                                        if len(match_idx) > 0:
-                                            neuer_betrag = e_betrag if e_typ == "Einnahme" else -e_betrag
-                                            df_all.loc[match_idx[0], ['datum', 'typ', 'kategorie', 'betrag', 'notiz']] = [str(e_datum), e_typ, e_cat, neuer_betrag, e_notiz]
-                                            _gs_update("transactions", df_all)
-                                            st.session_state['edit_idx'] = None
-                                            st.success("✅ Gespeichert!")
-                                            st.rerun()
-                                        else:
-                                            st.error("❌ Eintrag nicht gefunden.")
-                                    if cancelled:
+                        if st.session_state['edit_idx'] == orig_idx:
+                            with st.form(key=f"edit_form_{orig_idx}"):
+                                st.markdown(
+                                    "<p style='font-family:DM Sans,sans-serif;color:#38bdf8;font-weight:500;font-size:14px;margin-bottom:12px;'>Eintrag bearbeiten</p>",
+                                    unsafe_allow_html=True,
+                                )
+                                ec1, ec2 = st.columns(2)
+                                with ec1:
+                                    e_betrag = st.number_input(f"Betrag in {currency_sym}", value=abs(float(betrag_num)), min_value=0.01, step=0.01, format="%.2f")
+                                    e_datum  = st.date_input("Datum", value=datetime.date.fromisoformat(str(row['datum'])))
+                                with ec2:
+                                    e_typ = st.selectbox("Typ", ["Einnahme", "Ausgabe", "Depot"],
+                                                         index=["Einnahme", "Ausgabe", "Depot"].index(row['typ']) if row['typ'] in ["Einnahme", "Ausgabe", "Depot"] else 1)
+                                    e_all_cats = DEFAULT_CATS[e_typ] + load_custom_cats(user_name, e_typ)
+                                    e_cat = st.selectbox("Kategorie", e_all_cats,
+                                                         index=e_all_cats.index(row['kategorie']) if row['kategorie'] in e_all_cats else 0)
+                                e_notiz = st.text_input("Notiz (optional)", value=notiz)
+                                cs, cc = st.columns(2)
+                                with cs: saved     = st.form_submit_button("Speichern", use_container_width=True, type="primary")
+                                with cc: cancelled = st.form_submit_button("Abbrechen", use_container_width=True)
+                                if saved:
+                                    neuer_betrag = e_betrag if e_typ == "Einnahme" else -e_betrag
+                                    if update_transaction(row['id'], user_name, row['datum'], {
+                                        'datum': str(e_datum), 'typ': e_typ, 'kategorie': e_cat,
+                                        'betrag': neuer_betrag, 'notiz': e_notiz,
+                                    }):
                                         st.session_state['edit_idx'] = None
+                                        st.success("✅ Gespeichert!")
                                         st.rerun()
+                                    else:
+                                        st.error("❌ Eintrag nicht gefunden.")
+                                if cancelled:
+                                    st.session_state['edit_idx'] = None
+                                    st.rerun()
 
-                    st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
-                    p1, p2, p3 = st.columns([1, 4, 1])
-                    with p1:
-                        if st.button("‹ Neuer", use_container_width=True, disabled=(page <= 0)):
-                            st.session_state['tx_page'] = page - 1; st.rerun()
-                    with p2:
-                        st.markdown(
-                            f"<div style='text-align:center;font-family:DM Mono,monospace;color:#334155;font-size:12px;padding:8px 0;'>"
-                            f"Seite {page + 1} von {max_page + 1} · {total} Einträge</div>",
-                            unsafe_allow_html=True,
-                        )
-                    with p3:
-                        if st.button("Älter ›", use_container_width=True, disabled=(page >= max_page)):
-                            st.session_state['tx_page'] = page + 1; st.rerun()
+                st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
+                p1, p2, p3 = st.columns([1, 4, 1])
+                with p1:
+                    if st.button("‹ Neuer", use_container_width=True, disabled=(page <= 0)):
+                        st.session_state['tx_page'] = page - 1; st.rerun()
+                with p2:
+                    st.markdown(
+                        f"<div style='text-align:center;font-family:DM Mono,monospace;color:#334155;font-size:12px;padding:8px 0;'>"
+                        f"Seite {page + 1} von {max_page + 1} · {total} Einträge</div>",
+                        unsafe_allow_html=True,
+                    )
+                with p3:
+                    if st.button("Älter ›", use_container_width=True, disabled=(page >= max_page and not older)):
+                        if page >= max_page:
+                            st.session_state['tx_years_back'] = st.session_state.get('tx_years_back', 0) + 1
+                        st.session_state['tx_page'] = page + 1; st.rerun()
         except Exception as e:
             st.warning(f"Fehler beim Laden: {e}")
 
@@ -0,0 +1,42 @@
+"""
+Verteilt die User gleichmäßig auf die Shards (storage.shards, siehe ShardedBackend).
+
+    python rebalance.py --dry-run           # nur anzeigen, wer wohin umziehen würde
+    python rebalance.py                     # umziehen
+    python rebalance.py --user anna --to s2 # einzelnen User umziehen
+"""
+import argparse
+
+
+def _name(shard):
+    return shard or 'primär'
+
+
+def main():
+    p = argparse.ArgumentParser(description="User gleichmäßig auf die Shards verteilen")
+    p.add_argument('--dry-run', action='store_true', help="nur planen, nichts schreiben")
+    p.add_argument('--user', help="nur diesen User umziehen (mit --to)")
+    p.add_argument('--to', default='', help="Ziel-Shard für --user ('' = primär)")
+    a = p.parse_args()
+
+    import database
+    print("Vorher:", {_name(s): n for s, n in database.shard_load().items()})
+    if a.user:
+        moves = [(a.user, database.shard_of(a.user), a.to)]
+        if not a.dry_run:
+            database.move_user(a.user, a.to)
+    else:
+        moves = database.rebalance(dry_run=a.dry_run)
+    for user, src, dst in moves:
+        print(f"  {user}: {_name(src)} → {_name(dst)}")
+    if not a.dry_run:
+        # Journal und Snapshots vor dem Beenden einspielen – sonst erst beim nächsten Start
+        if database._wal:
+            database._wal.replay()
+        if database._snapshots:
+            database._snapshots.flush()
+        print("Nachher:", {_name(s): n for s, n in database.shard_load().items()})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Zentrale Ablaufsteuerung für alle Backend-Calls.
+- Singleflight: gleichzeitige identische Reads (auch aus verschiedenen Sessions) teilen sich einen Call
+- Token-Bucket je Shard und Richtung (read/write) passend zur Sheets-Quota pro Minute
+- Retries bei 429/5xx mit exponentiellem Backoff und Full Jitter
+- Zähler über stats()
+
+Einstellungen in .streamlit/secrets.toml:
+    [storage]
+    rate_per_minute = 60        # 0 = unbegrenzt (Default bei SQLite)
+    burst           = 10
+    max_retries     = 5
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BackendUnavailable(Exception):
+    """Backend nach allen Retries nicht erreichbar (Quota, 5xx, Netz)."""
+
+
+def _status(e):
+    code = getattr(e, 'code', None)
+    if code is None:
+        code = getattr(getattr(e, 'response', None), 'status_code', None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def retriable(e, idempotent):
+    """429 wurde nicht ausgeführt und darf immer wiederholt werden, 5xx/Netz nur idempotente Calls."""
+    status = _status(e)
+    if status == 429:
+        return True
+    if status is not None:
+        return idempotent and 500 <= status < 600
+    return idempotent and isinstance(e, OSError)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate   = rate_per_minute / 60.0
+        self.burst  = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.stamp  = time.monotonic()
+        self._lock  = threading.Lock()
+
+    def acquire(self):
+        """Wartet auf ein Token und gibt die Wartezeit in Sekunden zurück."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now         = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp  = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                pause = (1 - self.tokens) / self.rate
+            time.sleep(pause)
+            waited += pause
+
+
+class Scheduler:
+    READS      = ('read', 'read_tail', 'header')
+    IDEMPOTENT = ('read', 'read_tail', 'header', 'write', 'patch_many')
+
+    def __init__(self, rate_per_minute=60, burst=10, max_retries=5, base_delay=0.5, max_delay=32.0):
+        self.rate        = rate_per_minute
+        self.burst       = burst
+        self.buckets     = {}   # (shard, 'read'|'write') → TokenBucket
+        self.max_retries = int(max_retries)
+        self.base_delay  = base_delay
+        self.max_delay   = max_delay
+        self._inflight   = {}
+        self._lock       = threading.Lock()
+        self._stats      = {'calls': 0, 'coalesced': 0, 'retries': 0, 'throttled': 0, 'wait_s': 0.0, 'failures': 0}
+
+    def _count(self, **kw):
+        with self._lock:
+            for k, v in kw.items():
+                self._stats[k] += v
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def call(self, kind, fn, *args):
+        if kind not in self.READS:
+            return self._run(kind, fn, args)
+        key = (kind,) + args
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is None:
+                shared = self._inflight[key] = Future()
+                owner  = True
+            else:
+                self._stats['coalesced'] += 1
+                owner = False
+        if not owner:
+            return shared.result()
+        try:
+            shared.set_result(self._run(kind, fn, args))
+        except BaseException as e:
+            shared.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return shared.result()
+
+    def _bucket(self, kind, args):
+        # Die Quota gilt pro Spreadsheet – 'transactions@s1' zählt gegen Shard s1
+        key = (str(args[0]).partition('@')[2] if args else '', 'read' if kind in self.READS else 'write')
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _run(self, kind, fn, args):
+        bucket = self._bucket(kind, args)
+        for attempt in range(self.max_retries + 1):
+            waited = bucket.acquire()
+            self._count(calls=1, throttled=int(waited > 0), wait_s=waited)
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries or not retriable(e, kind in self.IDEMPOTENT):
+                    self._count(failures=1)
+                    if retriable(e, kind in self.IDEMPOTENT):
+                        raise BackendUnavailable(f"{kind} nach {attempt + 1} Versuchen fehlgeschlagen: {e}") from e
+                    raise
+                self._count(retries=1)
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+
+class ScheduledBackend:
+    """Reicht jeden Call eines StorageBackend durch den Scheduler."""
+
+    def __init__(self, inner, scheduler):
+        self.inner     = inner
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def read(self, ws):
+        return self.scheduler.call('read', self.inner.read, ws)
+
+    def read_tail(self, ws, start):
+        return self.scheduler.call('read_tail', self.inner.read_tail, ws, start)
+
+    def header(self, ws):
+        return self.scheduler.call('header', self.inner.header, ws)
+
+    def write(self, ws, df):
+        return self.scheduler.call('write', self.inner.write, ws, df)
+
+    def append(self, ws, rows):
+        return self.scheduler.call('append', self.inner.append, ws, rows)
+
+    def patch(self, ws, keys, changes, columns):
+        return self.patch_many(ws, [(keys, changes)], columns)
+
+    def patch_many(self, ws, patches, columns):
+        return self.scheduler.call('patch_many', self.inner.patch_many, ws, patches, columns)
+
+
+def create_scheduler(config, default_rate):
+    return Scheduler(
+        rate_per_minute=float(config.get('rate_per_minute', default_rate)),
+        burst=float(config.get('burst', 10)),
+        max_retries=int(config.get('max_retries', 5)),
+    )
@@ -0,0 +1,146 @@
+"""
+Typisiertes Schema der Worksheets.
+normalize() bringt ein Worksheet einmal beim Laden in echte dtypes (Beträge als float,
+Soft-Delete als bool, Typ als Kategorie, Datum zusätzlich als datetime64 in datum_dt).
+serialize() macht daraus wieder Zellwerte wie im Sheet und entfernt abgeleitete Spalten.
+by_date()/date_slice() schneiden Zeiträume per Binärsuche aus nach Datum sortierten Frames.
+"""
+import re
+import numpy as np
+import pandas as pd
+
+
+TYPES = ['Einnahme', 'Ausgabe', 'Depot', 'Spartopf']
+
+SCHEMA = {
+    'transactions':   {'betrag': 'num', 'typ': 'cat', 'deleted': 'flag', 'datum': 'date'},
+    'toepfe':         {'ziel': 'num', 'gespart': 'num', 'deleted': 'flag'},
+    'dauerauftraege': {'betrag': 'num', 'typ': 'cat', 'deleted': 'flag'},
+    'goals':          {'sparziel': 'num'},
+    'settings':       {'budget': 'num'},
+}
+DERIVED = {'datum': 'datum_dt'}   # Quellspalte → abgeleitete Spalte (wird nie gespeichert)
+
+
+def spec_for(ws):
+    """Schema eines Worksheets – Shards (transactions@s1) und Jahres-Partitionen (transactions_2021) erben das der Basis."""
+    ws = ws.partition('@')[0]
+    return SCHEMA.get(ws) or SCHEMA.get(re.sub(r'_\d{4}$', '', ws))
+
+
+def is_flag(s):
+    """Flag wie es im Sheet steht ('True', '1', '1.0', …) als bool-Maske."""
+    return s.astype(str).str.strip().str.lower().isin(['true', '1', '1.0'])
+
+
+def _flag(v):
+    return str(v).strip().lower() in ('true', '1', '1.0')
+
+
+def _date(s):
+    return pd.to_datetime(s, errors='coerce', format='ISO8601')
+
+
+def normalize(ws, df):
+    spec = spec_for(ws)
+    if not spec:
+        return df
+    df = df.copy(deep=False)
+    for col, kind in spec.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if kind == 'num':
+            df[col] = pd.to_numeric(s, errors='coerce').astype(float)
+        elif kind == 'flag':
+            df[col] = is_flag(s)
+        elif kind == 'cat':
+            extra   = sorted(set(s.dropna().astype(str)) - set(TYPES))
+            df[col] = s.astype(pd.CategoricalDtype(TYPES + extra))
+        elif kind == 'date':
+            df[DERIVED[col]] = _date(s)
+    return df
+
+
+def concat(df, new):
+    """Typisierte Zeilen anhängen, ohne dass Kategorie-Spalten zu object zerfallen."""
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype) and c in new.columns:
+            cats  = list(df[c].cat.categories)
+            cats += [v for v in new[c].dropna().astype(str).unique() if v not in cats]
+            dtype = pd.CategoricalDtype(cats)
+            df    = df.assign(**{c: df[c].astype(dtype)})
+            new   = new.assign(**{c: new[c].astype(dtype)})
+    return pd.concat([df, new])
+
+
+# ── Zeiträume ────────────────────────────────────────────────
+
+def _is_sorted(v):
+    # aufsteigend, NaT nur am Ende (so sortiert numpy datetime64)
+    n = len(v) - int(np.isnat(v).sum())
+    return bool(np.isnat(v[n:]).all() and (v[1:n] >= v[:n - 1]).all())
+
+
+def by_date(df, col='datum_dt'):
+    """Frame stabil nach Datum sortiert (NaT zuletzt) – ohne Kopie, wenn er es schon ist."""
+    if col not in df.columns or len(df) < 2:
+        return df
+    v = df[col].values
+    return df if _is_sorted(v) else df.take(v.argsort(kind='stable'))
+
+
+def date_slice(df, start=None, end=None, col='datum_dt'):
+    """Zeilen mit start <= Datum < end aus einem nach Datum sortierten Frame (searchsorted statt Maske)."""
+    if col not in df.columns or not len(df):
+        return df
+    v = df[col].values
+    a = np.searchsorted(v, pd.Timestamp(start).to_datetime64(), 'left') if start is not None else 0
+    b = np.searchsorted(v, pd.Timestamp(end).to_datetime64(), 'left') if end is not None else len(v) - int(np.isnat(v).sum())
+    return df.iloc[a:max(a, b)]
+
+
+def month_range(year, month):
+    """[Monatserster, Erster des Folgemonats) als Timestamps – passend für date_slice."""
+    start = pd.Timestamp(year, month, 1)
+    return start, start + pd.offsets.MonthBegin(1)
+
+
+def serialize(ws, df):
+    spec = spec_for(ws)
+    if not spec:
+        return df
+    df = df.drop(columns=[c for c in DERIVED.values() if c in df.columns])
+    for col, kind in spec.items():
+        if col not in df.columns:
+            continue
+        if kind == 'flag':
+            df[col] = is_flag(df[col]).map({True: 'True', False: ''})
+        elif kind == 'cat':
+            df[col] = df[col].astype(object)
+    return df
+
+
+def cast_changes(ws, changes):
+    """Einzelwerte eines Patches in die Cache-dtypes bringen (inkl. abgeleiteter Spalten)."""
+    spec = spec_for(ws) or {}
+    out  = dict(changes)
+    for col, v in changes.items():
+        kind = spec.get(col)
+        if kind == 'num':
+            out[col] = float(pd.to_numeric(v, errors='coerce'))
+        elif kind == 'flag':
+            out[col] = _flag(v)
+        elif kind == 'date':
+            out[DERIVED[col]] = _date(pd.Series([v])).iloc[0]
+    return out
+
+
+def serialize_changes(ws, changes):
+    spec = spec_for(ws) or {}
+    return {c: ('True' if _flag(v) else '') if spec.get(c) == 'flag' else v
+            for c, v in changes.items() if c not in DERIVED.values()}
+
+
+def stored_columns(columns):
+    return [c for c in columns if c not in DERIVED.values()]
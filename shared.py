@@ -7,7 +7,7 @@ import datetime
 import streamlit as st
 
 from constants import THEMES, CURRENCY_SYMBOLS
-from database import load_user_settings, apply_dauerauftraege, _gs_invalidate
+from database import load_user_settings, apply_dauerauftraege
 from styling import inject_base_css, inject_theme
 
 _DEFAULTS = {
@@ -25,7 +25,7 @@ _DEFAULTS = {
     'email_verify_code': "", 'email_verify_expiry': None, 'email_verify_new': "",
     'theme': 'Ocean Blue',
     'confirm_reset': False, 'confirm_delete_account': False,
-    'tx_page': 0, 'tx_search': "",
+    'tx_page': 0, 'tx_search': "", 'tx_years_back': 0,
 }
 
 
@@ -58,7 +58,6 @@ def setup(page_title="Balancely"):
     if datetime.date.today().day == 1:
         booked = apply_dauerauftraege(st.session_state['user_name'])
         if booked > 0:
-            _gs_invalidate("transactions")
             st.toast(f"✅ {booked} Dauerauftrag/-aufträge gebucht", icon="⚙️")
 
     _render_sidebar(_t, _theme_name, _user_settings, _currency_sym)
@@ -117,7 +116,5 @@ def _render_sidebar(t, theme_name, user_settings, currency_sym):
         st.markdown("<div style='height:28vh;'></div>", unsafe_allow_html=True)
 
         if st.button("Logout ➜", use_container_width=True, type="secondary"):
-            for k in [k for k in st.session_state if k.startswith("_gs_cache_")]:
-                del st.session_state[k]
             st.session_state['logged_in'] = False
             st.switch_page("Balancely.py")
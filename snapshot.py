@@ -0,0 +1,117 @@
+"""
+Snapshots der typisierten Worksheets auf der Platte (Arrow IPC / Feather, memory-mapped).
+Ein Kaltstart lädt den Snapshot statt das ganze Sheet herunterzuladen; database.py
+gleicht danach im Hintergrund inkrementell ab (refresh). Dafür trägt jeder Snapshot
+den Abgleich-Stand mit (Änderungsmarke des Backends, Zeit des letzten vollständigen Reads).
+Geschrieben wird entprellt nach Änderungen, damit ein Burst von Writes nur einen Snapshot erzeugt.
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+import schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:   # pyarrow kommt mit streamlit, ohne bleibt der Snapshot-Cache aus
+    pa = None
+
+# Ändert sich das Schema, passen alte Snapshots nicht mehr
+FORMAT = "1-" + hashlib.sha1(json.dumps([schema.SCHEMA, schema.DERIVED, schema.TYPES], sort_keys=True).encode()).hexdigest()[:8]
+
+
+class SnapshotStore:
+    def __init__(self, path, source, delay=1.0):
+        """source(ws) → (version, DataFrame, sync) | None liefert den aktuellen Cache-Stand."""
+        self.path    = path
+        self.source  = source
+        self.delay   = delay
+        self.stats   = {'hits': 0, 'misses': 0, 'saves': 0, 'errors': 0}
+        self._timers = {}
+        self._lock   = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        atexit.register(self.flush)
+
+    def _file(self, ws):
+        return os.path.join(self.path, f"{ws}.arrow")
+
+    def load(self, ws):
+        """(typisierter Frame, sync) aus dem Snapshot oder None (fehlt, altes Format, defekt)."""
+        try:
+            with pa.memory_map(self._file(ws)) as src:
+                table = pa.ipc.open_file(src).read_all()
+            meta = table.schema.metadata or {}
+            if meta.get(b'balancely_format', b'').decode() != FORMAT:
+                raise ValueError("Snapshot-Format veraltet")
+            df   = table.to_pandas()
+            sync = json.loads(meta.get(b'balancely_sync', b'{}').decode())
+        except Exception:
+            self.stats['misses'] += 1
+            return None
+        df.index = pd.RangeIndex(len(df))
+        self.stats['hits'] += 1
+        return df, sync
+
+    def save(self, ws, df, version, sync=None):
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b'balancely_format': FORMAT.encode(),
+            b'balancely_version': str(version).encode(),
+            b'balancely_written': str(time.time()).encode(),
+            b'balancely_sync': json.dumps(sync or {}).encode(),
+        })
+        tmp = self._file(ws) + ".tmp"
+        feather.write_feather(table, tmp, compression='uncompressed')
+        os.replace(tmp, self._file(ws))
+        self.stats['saves'] += 1
+
+    def schedule(self, ws):
+        """Entprellt speichern: mehrere Änderungen innerhalb von delay ergeben einen Snapshot."""
+        with self._lock:
+            if ws in self._timers:
+                return
+            t = threading.Timer(self.delay, self._write, args=(ws,))
+            t.daemon = True
+            self._timers[ws] = t
+        t.start()
+
+    def _write(self, ws):
+        with self._lock:
+            self._timers.pop(ws, None)
+        entry = self.source(ws)
+        if entry is None:
+            return
+        try:
+            self.save(ws, entry[1], entry[0], *entry[2:])
+        except Exception:
+            # z.B. gemischte Typen in einer object-Spalte – dann eben ohne Snapshot
+            self.stats['errors'] += 1
+
+    def flush(self):
+        with self._lock:
+            due = list(self._timers)
+            for t in self._timers.values():
+                t.cancel()
+            self._timers.clear()
+        for ws in due:
+            self._write(ws)
+
+    def drop(self, ws):
+        try:
+            os.remove(self._file(ws))
+        except FileNotFoundError:
+            pass
+
+
+def create_store(config, source, default_on):
+    """Snapshot-Cache laut storage.snapshot_dir ('' schaltet ab); ohne pyarrow immer aus."""
+    path = config.get('snapshot_dir', os.environ.get('BALANCELY_SNAPSHOT_DIR', '.snapshots' if default_on else ''))
+    if pa is None or not path:
+        return None
+    return SnapshotStore(path, source)
@@ -0,0 +1,444 @@
+"""
+Storage-Backends für die Datenschicht.
+database.py spricht ausschließlich über dieses Interface mit dem Speicher:
+read() liefert ein Worksheet als DataFrame, write() ersetzt es vollständig.
+
+Auswahl über .streamlit/secrets.toml:
+    [storage]
+    backend = "sqlite"          # oder "gsheets" (Default), "local" (siehe localsheets.py)
+    path    = "balancely.db"
+    shards  = ["s1", "s2"]      # optional: weitere Spreadsheets/Datenbanken (siehe ShardedBackend)
+"""
+import numbers
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+
+
+# ── Tabellen-Schema (SQLite) ─────────────────────────────────
+
+TABLES = {
+    'transactions': {
+        'columns': [('user', 'TEXT'), ('datum', 'TEXT'), ('timestamp', 'TEXT'), ('typ', 'TEXT'),
+                    ('kategorie', 'TEXT'), ('betrag', 'REAL'), ('notiz', 'TEXT'), ('deleted', 'TEXT'), ('id', 'TEXT'),
+                    ('deleted_at', 'TEXT')],
+        'indexes': [('user', 'datum'), ('id',)],
+    },
+    'transactions_archive': {
+        'columns': [('user', 'TEXT'), ('datum', 'TEXT'), ('timestamp', 'TEXT'), ('typ', 'TEXT'),
+                    ('kategorie', 'TEXT'), ('betrag', 'REAL'), ('notiz', 'TEXT'), ('deleted', 'TEXT'), ('id', 'TEXT'),
+                    ('deleted_at', 'TEXT')],
+        'indexes': [('user',)],
+    },
+    'toepfe': {
+        'columns': [('user', 'TEXT'), ('id', 'TEXT'), ('name', 'TEXT'), ('ziel', 'REAL'), ('gespart', 'REAL'),
+                    ('emoji', 'TEXT'), ('farbe', 'TEXT'), ('deleted', 'TEXT'), ('deleted_at', 'TEXT')],
+        'indexes': [('user',), ('id',)],
+    },
+    'dauerauftraege': {
+        'columns': [('user', 'TEXT'), ('id', 'TEXT'), ('name', 'TEXT'), ('betrag', 'REAL'), ('typ', 'TEXT'),
+                    ('kategorie', 'TEXT'), ('aktiv', 'TEXT'), ('deleted', 'TEXT'), ('deleted_at', 'TEXT')],
+        'indexes': [('user',), ('id',)],
+    },
+    'ledger': {
+        'columns': [('ws', 'TEXT'), ('type', 'TEXT'), ('id', 'TEXT'), ('user', 'TEXT'), ('ts', 'TEXT'),
+                    ('op', 'TEXT'), ('ref', 'TEXT'), ('data', 'TEXT'), ('before', 'TEXT'), ('key', 'TEXT')],
+        'indexes': [('user',), ('key',)],
+    },
+    'partitions': {
+        'columns': [('jahr', 'INTEGER'), ('user', 'TEXT'), ('typ', 'TEXT'), ('betrag', 'REAL'),
+                    ('betrag_abs', 'REAL'), ('anzahl', 'INTEGER')],
+        'indexes': [('user',)],
+    },
+    'categories': {
+        'columns': [('user', 'TEXT'), ('typ', 'TEXT'), ('kategorie', 'TEXT')],
+        'indexes': [('user', 'typ')],
+    },
+    'goals': {
+        'columns': [('user', 'TEXT'), ('sparziel', 'REAL')],
+        'indexes': [('user',)],
+    },
+    'settings': {
+        'columns': [('user', 'TEXT'), ('budget', 'REAL'), ('currency', 'TEXT'), ('avatar_url', 'TEXT'),
+                    ('theme', 'TEXT'), ('last_username_change', 'TEXT')],
+        'indexes': [('user',)],
+    },
+    'users': {
+        'columns': [('name', 'TEXT'), ('username', 'TEXT'), ('email', 'TEXT'), ('password', 'TEXT'),
+                    ('verified', 'TEXT'), ('token', 'TEXT'), ('token_expiry', 'TEXT'),
+                    ('onboarding_done', 'TEXT'), ('username_changed_at', 'TEXT'), ('deleted', 'TEXT')],
+        'indexes': [('username',), ('email',)],
+    },
+}
+
+
+def _table(ws):
+    # Jahres-Partitionen (transactions_2021) und Archive (ledger_archive) haben das Schema ihrer Basistabelle
+    return TABLES.get(ws) or TABLES.get(re.sub(r'_(\d{4}|archive)$', '', ws))
+
+
+def _q(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# ── Backends ─────────────────────────────────────────────────
+
+def _cell(v):
+    # Zellwert wie gspread_dataframe.set_with_dataframe (USER_ENTERED, Formeln escaped)
+    if pd.isnull(v):
+        return ""
+    if isinstance(v, numbers.Real) and not isinstance(v, bool):
+        return v.item() if hasattr(v, 'item') else v
+    v = str(v)
+    return "'" + v if v.startswith(("=", "'")) else v
+
+
+def _infer(s):
+    # Zahlen-Spalten wie beim vollständigen Read als Zahlen liefern
+    num = pd.to_numeric(s, errors='coerce')
+    return num if num.notna().sum() == s.notna().sum() else s
+
+
+class StorageBackend:
+    """
+    Index-Konvention: Zeile i eines gelesenen Frames ist Datenzeile i im Speicher.
+    append() hängt hinten an, patch()/patch_many() ändern einzelne Zellen über diese
+    Positionen (patch_many bündelt mehrere Patches in einem Round-Trip).
+    read_tail(ws, start) liefert nur die Zeilen ab Position start, header(ws) nur die Spalten.
+    marker(ws) ist ein Änderungszähler (geändert, angehängt) oder None, wenn das Backend keinen
+    führt; dann geben write/append/patch_many die Marke vor und nach ihrem Commit zurück.
+    """
+    name = "base"
+
+    def marker(self, ws):
+        return None
+
+    def read(self, ws):
+        raise NotImplementedError
+
+    def read_tail(self, ws, start):
+        return self.read(ws).iloc[start:]
+
+    def header(self, ws):
+        return [str(c) for c in self.read(ws).columns]
+
+    def write(self, ws, df):
+        raise NotImplementedError
+
+    def append(self, ws, rows):
+        # Fallback für Backends ohne Zeilen-API: read-modify-write
+        self.write(ws, pd.concat([self.read(ws), rows], ignore_index=True))
+
+    def patch(self, ws, keys, changes, columns):
+        self.patch_many(ws, [(keys, changes)], columns)
+
+    def patch_many(self, ws, patches, columns):
+        df = self.read(ws)
+        for keys, changes in patches:
+            for c, v in changes.items():
+                if c not in df.columns:
+                    df[c] = ''
+                df[c] = df[c].astype(object)
+                df.loc[list(keys), c] = v
+        self.write(ws, df)
+
+
+class GSheetsBackend(StorageBackend):
+    """
+    Google Sheets über st-gsheets-connection (jedes write lädt das ganze Worksheet hoch).
+    Worksheets, die eine ältere Installation noch nicht hat (partitions, ledger, Archive),
+    lesen sich leer; der erste write()/append() legt sie an.
+    """
+    name = "gsheets"
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def read(self, ws):
+        try:
+            return self.conn.read(worksheet=ws, ttl=0)
+        except WorksheetNotFound:
+            return pd.DataFrame()
+
+    def write(self, ws, df):
+        try:
+            self.conn.update(worksheet=ws, data=df)
+        except WorksheetNotFound:
+            self.conn.create(worksheet=ws, data=df)
+
+    def _worksheet(self, ws):
+        select = getattr(getattr(self.conn, 'client', None), '_select_worksheet', None)
+        return select(worksheet=ws) if select else None
+
+    def read_tail(self, ws, start):
+        try:
+            sheet = self._worksheet(ws)
+        except WorksheetNotFound:
+            return pd.DataFrame(index=pd.RangeIndex(start, start))
+        if sheet is None:
+            return super().read_tail(ws, start)
+        # Header und Tail in einem Request
+        header, tail = sheet.batch_get(['1:1', f"{start + 2}:{max(sheet.row_count, start + 2)}"])
+        cols = header[0] if header else []
+        rows = [list(r) + [''] * (len(cols) - len(r)) for r in tail]
+        df   = pd.DataFrame([r[:len(cols)] for r in rows], columns=cols,
+                            index=pd.RangeIndex(start, start + len(rows)))
+        return df.replace('', np.nan).apply(_infer)
+
+    def header(self, ws):
+        try:
+            sheet = self._worksheet(ws)
+        except WorksheetNotFound:
+            return []
+        if sheet is None:
+            return super().header(ws)
+        rows = sheet.batch_get(['1:1'])[0]
+        return [str(c) for c in rows[0]] if rows else []
+
+    def append(self, ws, rows):
+        try:
+            sheet = self._worksheet(ws)
+        except WorksheetNotFound:
+            self.conn.create(worksheet=ws, data=rows)
+            return
+        if sheet is None:
+            return super().append(ws, rows)
+        sheet.append_rows(
+            [[_cell(v) for v in r] for r in rows.itertuples(index=False, name=None)],
+            value_input_option='USER_ENTERED', table_range='A1',
+        )
+
+    def patch_many(self, ws, patches, columns):
+        sheet = self._worksheet(ws)
+        if sheet is None:
+            return super().patch_many(ws, patches, columns)
+        cols = list(columns)
+        sheet.batch_update(
+            [{'range': rowcol_to_a1(int(k) + 2, cols.index(c) + 1), 'values': [[_cell(v)]]}
+             for keys, changes in patches for k in keys for c, v in changes.items()],
+            value_input_option='USER_ENTERED',
+        )
+
+
+class SQLiteBackend(StorageBackend):
+    """Eingebettete SQLite-Datenbank im WAL-Modus mit einer Tabelle pro Worksheet."""
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path   = path
+        self._local = threading.local()
+        self._lock  = threading.Lock()
+        self._cols  = {}
+        with self._lock:
+            db = self._db()
+            # Je Tabelle: Writes mit geänderten Zeilen (write, patch_many) und mit angehängten (append)
+            db.execute("CREATE TABLE IF NOT EXISTS _changes "
+                       "(ws TEXT PRIMARY KEY, modified INTEGER NOT NULL DEFAULT 0, appended INTEGER NOT NULL DEFAULT 0)")
+            db.commit()
+            for ws, spec in TABLES.items():
+                self._ensure_table(ws, [c for c, _ in spec['columns']])
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _ensure_table(self, ws, columns):
+        db    = self._db()
+        known = self._cols.get(ws)
+        if known is None:
+            known = [r[1] for r in db.execute(f"PRAGMA table_info({_q(ws)})")]
+            if not known:
+                spec  = _table(ws) or {'columns': [(c, 'TEXT') for c in columns], 'indexes': []}
+                known = [c for c, _ in spec['columns']]
+                if not known:
+                    return []
+                db.execute(f"CREATE TABLE {_q(ws)} (" + ", ".join(f"{_q(c)} {t}" for c, t in spec['columns']) + ")")
+                for cols in spec['indexes']:
+                    db.execute(
+                        f"CREATE INDEX IF NOT EXISTS {_q('ix_' + ws + '_' + '_'.join(cols))} "
+                        f"ON {_q(ws)} (" + ", ".join(_q(c) for c in cols) + ")"
+                    )
+                db.commit()
+        for c in columns:
+            if c not in known:
+                db.execute(f"ALTER TABLE {_q(ws)} ADD COLUMN {_q(c)} TEXT")
+                known = known + [c]
+        db.commit()
+        self._cols[ws] = known
+        return known
+
+    def read(self, ws):
+        return self.read_tail(ws, 0)
+
+    def read_tail(self, ws, start):
+        with self._lock:
+            cols = self._ensure_table(ws, [])
+        df = pd.read_sql_query(f"SELECT rowid - 1 AS _pos, * FROM {_q(ws)} WHERE rowid > ? ORDER BY rowid",
+                               self._db(), params=(int(start),))
+        if df.empty:
+            return pd.DataFrame(columns=cols)
+        df = df.set_index('_pos')
+        df.index.name = None
+        # Leere Zellen wie bei Google Sheets als NaN ausliefern
+        for c in df.columns:
+            if not pd.api.types.is_numeric_dtype(df[c]):
+                df[c] = df[c].where(df[c].notna(), np.nan)
+        return df
+
+    def header(self, ws):
+        with self._lock:
+            return list(self._ensure_table(ws, []))
+
+    def marker(self, ws):
+        row = self._db().execute("SELECT modified, appended FROM _changes WHERE ws = ?", (ws,)).fetchone()
+        return tuple(row) if row else (0, 0)
+
+    def _changed(self, db, ws, col):
+        # Zähler im selben Commit wie die Daten; BEGIN IMMEDIATE hält andere Prozesse solange draußen
+        before = self.marker(ws)
+        db.execute(f"INSERT INTO _changes (ws, {col}) VALUES (?, 1) "
+                   f"ON CONFLICT(ws) DO UPDATE SET {col} = {col} + 1", (ws,))
+        return before, self.marker(ws)
+
+    def _insert(self, db, ws, df, start):
+        cols = [str(c) for c in df.columns]
+        rows = df.astype(object).where(df.notna(), None).values.tolist()
+        if rows:
+            db.executemany(
+                f"INSERT INTO {_q(ws)} (rowid, " + ", ".join(_q(c) for c in cols) + ") "
+                "VALUES (" + ", ".join("?" * (len(cols) + 1)) + ")",
+                [[start + i + 1] + r for i, r in enumerate(rows)],
+            )
+
+    def write(self, ws, df):
+        with self._lock:
+            self._ensure_table(ws, [str(c) for c in df.columns])
+            db = self._db()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute(f"DELETE FROM {_q(ws)}")
+                self._insert(db, ws, df, 0)
+                return self._changed(db, ws, 'modified')
+
+    def append(self, ws, rows):
+        with self._lock:
+            self._ensure_table(ws, [str(c) for c in rows.columns])
+            db = self._db()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                start = db.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {_q(ws)}").fetchone()[0]
+                self._insert(db, ws, rows, start)
+                return self._changed(db, ws, 'appended')
+
+    def patch_many(self, ws, patches, columns):
+        with self._lock:
+            self._ensure_table(ws, [str(c) for _, changes in patches for c in changes])
+            db = self._db()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                for keys, changes in patches:
+                    vals = [None if pd.isnull(v) else v for v in changes.values()]
+                    db.executemany(
+                        f"UPDATE {_q(ws)} SET " + ", ".join(f"{_q(str(c))} = ?" for c in changes) + " WHERE rowid = ?",
+                        [vals + [int(k) + 1] for k in keys],
+                    )
+                return self._changed(db, ws, 'modified')
+
+
+class ShardedBackend(StorageBackend):
+    """
+    Mehrere Spreadsheets (bzw. Datenbanken) hinter einem Interface. Worksheet-Namen der
+    Form 'transactions@s1' gehen an Shard s1, Namen ohne @ an das primäre Backend – ein
+    Setup ohne Shards sieht also genau wie vorher aus. Jeder Shard hat seine eigene Quota.
+    In Google Sheets ist jeder Shard ein eigenes Spreadsheet ([connections.gsheets_s1])
+    mit denselben Worksheets wie das primäre.
+    """
+
+    def __init__(self, shards):
+        self.backends = shards
+        self.name     = shards[''].name
+
+    @property
+    def shards(self):
+        return list(self.backends)
+
+    def __getattr__(self, name):
+        return getattr(self.backends[''], name)
+
+    def _route(self, ws):
+        base, _, shard = ws.partition('@')
+        return self.backends[shard], base
+
+    def read(self, ws):
+        b, ws = self._route(ws)
+        return b.read(ws)
+
+    def read_tail(self, ws, start):
+        b, ws = self._route(ws)
+        return b.read_tail(ws, start)
+
+    def header(self, ws):
+        b, ws = self._route(ws)
+        return b.header(ws)
+
+    def marker(self, ws):
+        b, ws = self._route(ws)
+        return b.marker(ws)
+
+    def write(self, ws, df):
+        b, ws = self._route(ws)
+        return b.write(ws, df)
+
+    def append(self, ws, rows):
+        b, ws = self._route(ws)
+        return b.append(ws, rows)
+
+    def patch_many(self, ws, patches, columns):
+        b, ws = self._route(ws)
+        return b.patch_many(ws, patches, columns)
+
+
+def _suffixed(path, shard):
+    # balancely.db → balancely_s1.db, local_sheets → local_sheets_s1
+    if not shard:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{shard}{ext}"
+
+
+def _create_one(config, kind, shard):
+    env = os.environ.get
+    if kind == 'sqlite':
+        return SQLiteBackend(_suffixed(config.get('path', env('BALANCELY_DB', 'balancely.db')), shard))
+    if kind == 'local':
+        from localsheets import LocalSheetsConnection
+        return GSheetsBackend(LocalSheetsConnection(
+            path=_suffixed(config.get('path', env('BALANCELY_LOCAL_DIR', 'local_sheets')), shard),
+            latency_ms=config.get('latency_ms', env('BALANCELY_LATENCY_MS', 0)),
+            jitter_ms=config.get('jitter_ms', env('BALANCELY_JITTER_MS', 0)),
+            quota_error_rate=config.get('quota_error_rate', env('BALANCELY_QUOTA_ERROR_RATE', 0)),
+        ))
+    import streamlit as st
+    from streamlit_gsheets import GSheetsConnection
+    # Pro Shard eine eigene Verbindung: [connections.gsheets_s1] mit der URL des Spreadsheets
+    return GSheetsBackend(st.connection("gsheets" + (f"_{shard}" if shard else ""), type=GSheetsConnection))
+
+
+def create_backend(config):
+    """Erzeugt das konfigurierte Backend (st.secrets["storage"], Default: Google Sheets)."""
+    kind   = str(config.get('backend', os.environ.get('BALANCELY_BACKEND', 'gsheets'))).lower()
+    shards = config.get('shards', [s for s in os.environ.get('BALANCELY_SHARDS', '').split(',') if s.strip()])
+    shards = [str(s).strip() for s in shards if str(s).strip()]
+    if not shards:
+        return _create_one(config, kind, '')
+    return ShardedBackend({s: _create_one(config, kind, s) for s in [''] + shards})
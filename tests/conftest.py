@@ -0,0 +1,94 @@
+"""
+Gemeinsame Fixtures: database.py läuft gegen eine SQLite-Datei im Temp-Verzeichnis,
+ohne Write-Ahead-Log und Snapshots (beides wählt das Modul beim Import) und ohne
+Hintergrund-Abgleich. Jeder Test startet mit leeren Tabellen und leerem Cache.
+sheets stellt stattdessen eine bestehende Google-Sheets-Installation nach (LocalSheetsConnection):
+nur die Worksheets von vor Ledger, Partitionen und Archiven, mit ihren damaligen Spalten.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix="balancely-tests-")
+
+sys.path.insert(0, ROOT)
+os.environ.update({
+    'BALANCELY_BACKEND':      'sqlite',
+    'BALANCELY_DB':           os.path.join(TMP, 'balancely.db'),
+    'BALANCELY_WAL':          '',
+    'BALANCELY_SNAPSHOT_DIR': '',
+    'BALANCELY_SHARDS':       '',
+})
+
+BASELINE = {
+    'transactions':   ['user', 'datum', 'timestamp', 'typ', 'kategorie', 'betrag', 'notiz', 'deleted'],
+    'toepfe':         ['user', 'id', 'name', 'ziel', 'gespart', 'emoji', 'farbe', 'deleted'],
+    'dauerauftraege': ['user', 'id', 'name', 'betrag', 'typ', 'kategorie', 'aktiv', 'deleted'],
+    'categories':     ['user', 'typ', 'kategorie'],
+    'goals':          ['user', 'sparziel'],
+    'settings':       ['user', 'budget', 'currency', 'avatar_url', 'theme'],
+    'users':          ['name', 'username', 'email', 'password', 'verified', 'token', 'token_expiry'],
+}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # database.py liest die Pfade beim Import, daher kein tmp_path – das Verzeichnis hier wieder entfernen
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def _reset(database):
+    db = database._backend._db()
+    with db:
+        for (table,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            db.execute(f'DELETE FROM "{table}"')
+    with database._cache_lock:
+        for state in (database._cache, database._index, database._cube, database._balances,
+                      database._folded, database._fetched, database._views, database._last_ops,
+                      database._markers, database._full_at):
+            state.clear()
+        database._part_lru.clear()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    import database
+    monkeypatch.setattr(database, 'TTL', 0)
+    _reset(database)
+    yield database
+    _reset(database)
+
+
+@pytest.fixture
+def sheets(db, tmp_path):
+    from localsheets import LocalSheetsConnection
+    from scheduler import ScheduledBackend
+    from storage import GSheetsBackend
+    conn = LocalSheetsConnection(path=str(tmp_path / 'sheets'))
+    for ws, cols in BASELINE.items():
+        conn.create(worksheet=ws, data=pd.DataFrame(columns=cols))
+    local = GSheetsBackend(conn)
+    # Vor dem Aufräumen von db zurückstellen – _reset leert die SQLite-Tabellen
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, '_backend', local)
+        mp.setattr(db, 'backend', ScheduledBackend(local, db.scheduler))
+        yield conn
+    _reset(db)
+
+
+@pytest.fixture
+def shards(db, tmp_path):
+    # Zwei Shards: das primäre Spreadsheet ('') und s1, je eine eigene SQLite-Datei
+    from scheduler import ScheduledBackend
+    from storage import ShardedBackend, SQLiteBackend
+    sharded = ShardedBackend({s: SQLiteBackend(str(tmp_path / f"shard{s}.db")) for s in ('', 's1')})
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, '_backend', sharded)
+        mp.setattr(db, 'backend', ScheduledBackend(sharded, db.scheduler))
+        mp.setattr(db, 'SHARDS', sharded.shards)
+        yield sharded
+    _reset(db)
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from gspread.exceptions import WorksheetNotFound
+
+from localsheets import LocalSheetsConnection, QuotaError
+from storage import GSheetsBackend, SQLiteBackend
+
+
+@pytest.fixture(params=['sqlite', 'local'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBackend(str(tmp_path / 'test.db'))
+    return GSheetsBackend(LocalSheetsConnection(path=str(tmp_path / 'sheets')))
+
+
+def _rows(*ids):
+    return pd.DataFrame({'user': 'anna', 'id': list(ids), 'betrag': [float(i) for i in range(len(ids))]})
+
+
+def test_append_patch_and_tail(backend):
+    backend.write('goals', _rows('a', 'b'))
+    backend.append('goals', _rows('c'))
+    backend.patch_many('goals', [([0], {'user': 'ben'})], ['user', 'id', 'betrag'])
+
+    df = backend.read('goals')
+    assert list(df['id']) == ['a', 'b', 'c']
+    assert list(df['user']) == ['ben', 'anna', 'anna']
+
+    tail = backend.read_tail('goals', 1)
+    assert list(tail.index) == [1, 2]
+    assert list(tail['id']) == ['b', 'c']
+
+
+def test_local_quota_errors(tmp_path):
+    conn = LocalSheetsConnection(path=str(tmp_path), quota_error_rate=1.0, seed=1)
+    with pytest.raises(QuotaError) as err:
+        conn.read(worksheet='goals')
+    assert err.value.code == 429
+    assert conn.calls['read'] == 1 and conn.calls['quota_errors'] == 1
+
+
+def test_local_missing_worksheet_behaves_like_sheets(tmp_path):
+    conn = LocalSheetsConnection(path=str(tmp_path))
+    for call in (lambda: conn.read(worksheet='ledger'), lambda: conn.client._select_worksheet(worksheet='ledger'),
+                 lambda: conn.update(worksheet='ledger', data=_rows('a'))):
+        with pytest.raises(WorksheetNotFound):
+            call()
+    conn.create(worksheet='ledger', data=_rows('a'))
+    assert list(conn.read(worksheet='ledger')['id']) == ['a']
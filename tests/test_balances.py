@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+
+def _tx(id, datum, typ, betrag):
+    return {'user': 'anna', 'id': id, 'datum': datum, 'timestamp': f"{datum} 10:00", 'typ': typ,
+            'kategorie': 'x', 'betrag': betrag, 'notiz': ''}
+
+
+def _expected(db, at):
+    # Stand direkt aus den Buchungen summiert – so rechnete das Dashboard vor dem Index
+    df  = db.load_user_transactions('anna')
+    df  = df[df['datum_dt'] <= pd.Timestamp(at)]
+    s   = lambda typ: df.loc[df['typ'] == typ, 'betrag']
+    dep = float(s('Depot').abs().sum())
+    ein, aus, sp = float(s('Einnahme').sum()), float(s('Ausgabe').abs().sum()), float(s('Spartopf').sum())
+    return {'bank': ein + sp - aus - dep, 'depot': dep, 'toepfe': -sp}
+
+
+def test_balance_index_follows_writes(db):
+    db.append_rows('transactions', [_tx('a', '2024-01-05', 'Einnahme', 3000.0), _tx('b', '2024-01-10', 'Ausgabe', -800.0),
+                                    _tx('c', '2024-02-01', 'Depot', -500.0), _tx('d', '2024-02-15', 'Spartopf', -200.0)])
+    assert db.balance_at('anna')['gesamt'] == pytest.approx(2200.0)
+
+    db.append_rows('transactions', [_tx('e', '2024-01-07', 'Ausgabe', -40.0), _tx('f', '2024-03-01', 'Spartopf', 50.0)])
+    db.patch_rows('transactions', db.rows_by_id('transactions', ['b']), {'betrag': -900.0})
+    db.patch_rows('transactions', db.rows_by_id('transactions', ['c']), {'datum': '2024-01-20'})
+    db.soft_delete('transactions', db.rows_by_id('transactions', ['a']))
+    db.append_rows('transactions', [_tx('g', '2024-01-01', 'Einnahme', 2500.0)])
+    # Fortgeschrieben, nicht neu gebaut
+    assert db._balances['transactions'][0] == db.data_version('transactions')
+
+    days = ['2023-12-31', '2024-01-01', '2024-01-07', '2024-01-20', '2024-02-14', '2024-02-15', '2024-12-31']
+    kept = {d: db.balance_at('anna', d) for d in days}
+    db._balances.pop('transactions')
+    for d in days:
+        assert kept[d] == pytest.approx(db.balance_at('anna', d))
+        want = _expected(db, d)
+        assert {k: kept[d][k] for k in want} == pytest.approx(want)
+
+    hist = db.balance_history('anna').set_index('datum')
+    assert list(hist.index.strftime('%Y-%m-%d')) == ['2024-01-01', '2024-01-07', '2024-01-10', '2024-01-20',
+                                                     '2024-02-15', '2024-03-01']
+    assert hist['gesamt'].iloc[-1] == pytest.approx(db.balance_at('anna')['gesamt'])
+
+
+def test_balance_over_archived_years(db):
+    db._gs_update('transactions', pd.DataFrame(
+        [_tx(f"e{y}", f"{y}-02-01", 'Einnahme', 1000.0) for y in range(2018, 2023)] +
+        [_tx(f"d{y}", f"{y}-06-01", 'Depot', -100.0) for y in range(2018, 2023)]))
+    assert db.archive_years(live_years=1)['years'] == list(range(2018, 2023))
+    db._gs_invalidate(*list(db._cache))
+
+    for d in ('2018-01-31', '2019-03-01', '2020-12-31', '2022-06-01', None):
+        want = _expected(db, d or '2100-01-01')
+        got  = db.balance_at('anna', d)
+        assert {k: got[k] for k in want} == pytest.approx(want)
+    hist = db.balance_history('anna')
+    assert hist['gesamt'].iloc[-1] == pytest.approx(db.balance_at('anna')['gesamt'])
@@ -0,0 +1,18 @@
+import pandas as pd
+
+
+def _tx(i, deleted):
+    return {'user': 'anna', 'id': f"t{i}", 'datum': '2024-05-01', 'timestamp': '2024-05-01 10:00', 'typ': 'Ausgabe',
+            'kategorie': 'Essen', 'betrag': -float(i), 'notiz': '', 'deleted': 'True' if deleted else '',
+            'deleted_at': '2024-05-02 10:00' if deleted else ''}
+
+
+def test_compaction_appends_to_archive_without_loading_it(db):
+    db._gs_update('transactions', pd.DataFrame([_tx(1, True), _tx(2, False), _tx(3, True)]))
+    assert db.compact_tombstones('transactions', max_age_days=0)['rows'] == 2
+    db.append_rows('transactions', [_tx(4, True)])
+    assert db.compact_tombstones('transactions', max_age_days=0)['rows'] == 1
+
+    assert 'transactions_archive' not in db._cache
+    assert list(db.backend.read('transactions_archive')['id']) == ['t1', 't3', 't4']
+    assert list(db._gs_read('transactions')['id']) == ['t2']
@@ -0,0 +1,37 @@
+import pandas as pd
+
+
+def _tx(id, datum, betrag, typ='Ausgabe', kategorie='Essen'):
+    return {'user': 'anna', 'id': id, 'datum': datum, 'timestamp': f"{datum} 10:00", 'typ': typ,
+            'kategorie': kategorie, 'betrag': betrag, 'notiz': ''}
+
+
+def _summary(db, month):
+    df = db.month_summary('anna', 2024, month)
+    return df.sort_values(['typ', 'kategorie']).reset_index(drop=True)
+
+
+def _rebuilt(db, month):
+    db._cube.pop('transactions', None)
+    return _summary(db, month)
+
+
+def test_cube_follows_writes_like_a_rebuild(db):
+    db.append_rows('transactions', [_tx('a', '2024-03-01', -10.0), _tx('b', '2024-03-05', -30.0),
+                                    _tx('c', '2024-03-09', 2000.0, 'Einnahme', 'Gehalt'),
+                                    _tx('d', '2024-04-02', -5.0, kategorie='Kino')])
+    assert _summary(db, 3)['anzahl'].sum() == 3
+
+    db.append_rows('transactions', [_tx('e', '2024-03-20', -50.0)])
+    db.patch_rows('transactions', db.rows_by_id('transactions', ['b']), {'betrag': -35.0})
+    db.patch_rows('transactions', db.rows_by_id('transactions', ['a']), {'kategorie': 'Kino'})
+    db.patch_rows('transactions', db.rows_by_id('transactions', ['d']), {'datum': '2024-03-15'})
+    db.soft_delete('transactions', db.rows_by_id('transactions', ['e']))
+    # Fortgeschrieben, nicht neu gebaut
+    assert db._cube['transactions'][0] == db.data_version('transactions')
+
+    for month in (3, 4, None):
+        pd.testing.assert_frame_equal(_summary(db, month), _rebuilt(db, month))
+    essen = _summary(db, 3).set_index(['typ', 'kategorie']).loc[('Ausgabe', 'Essen')]
+    assert (essen['betrag'], essen['anzahl'], essen['min'], essen['max']) == (-35.0, 1, -35.0, -35.0)
+    assert _summary(db, 4).empty
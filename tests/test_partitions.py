@@ -0,0 +1,109 @@
+import datetime
+import os
+
+import pandas as pd
+
+YEARS = list(range(2010, 2018))   # mehr Jahre als storage.max_partitions (4)
+TODAY = datetime.date.today()
+
+
+def _seed(db):
+    db._gs_update('transactions', pd.DataFrame([
+        {'user': 'anna', 'id': f"t{y}", 'datum': f"{y}-03-01", 'timestamp': f"{y}-03-01 10:00",
+         'typ': 'Ausgabe', 'kategorie': 'Essen', 'betrag': -float(y - 2000), 'notiz': ''}
+        for y in YEARS
+    ]))
+
+
+def _cold(db):
+    # Prozess-Neustart nachstellen: nur noch das Backend zählt
+    db._gs_invalidate(*list(db._cache))
+    db._part_lru.clear()
+
+
+def test_archive_years_keeps_all_partitions(db):
+    _seed(db)
+    assert db.archive_years()['years'] == YEARS
+    assert db.partition_years() == YEARS
+    assert len(db._part_lru) <= db.MAX_PARTITIONS
+
+    _cold(db)
+    assert db.partition_years() == YEARS
+    for y in YEARS:
+        assert list(db.user_rows(db._partition(y), 'anna')['id']) == [f"t{y}"]
+    assert db.balance_at('anna')['bank'] == -sum(y - 2000 for y in YEARS)
+
+
+def test_delete_user_transactions_across_partitions(db):
+    _seed(db)
+    db.archive_years()
+    _cold(db)
+    db.delete_user_transactions('anna')
+
+    _cold(db)
+    for y in YEARS:
+        assert db.user_rows(db._partition(y), 'anna')['deleted'].astype(bool).all()
+    assert db.balance_at('anna')['bank'] == 0
+
+
+def test_resolving_names_does_not_evict(db):
+    _seed(db)
+    db.archive_years()
+    _cold(db)
+    for y in YEARS[:db.MAX_PARTITIONS]:
+        db.user_rows(db._partition(y), 'anna')
+    loaded = [ws for ws in db._cache if ws.startswith('transactions_')]
+    db.user_version('anna')
+    db._user_sheets('')
+    assert [ws for ws in db._cache if ws.startswith('transactions_')] == loaded
+
+
+def test_sheets_without_partitions_worksheet(db, sheets):
+    db.append_rows('transactions', [{'user': 'anna', 'datum': '2024-03-01', 'typ': 'Ausgabe',
+                                     'kategorie': 'Essen', 'betrag': -5.0}])
+    assert db.partition_years() == []
+    assert 'partitions' in db.watched_sheets('anna')
+    assert db.load_user_transactions('anna')['betrag'].tolist() == [-5.0]
+    assert db.month_summary('anna', 2024, 3)['betrag'].tolist() == [-5.0]
+
+    # Der erste Umzug in eine Partition legt partitions und transactions_<jahr> an
+    _cold(db)
+    assert db.archive_years(live_years=1)['years'] == [2024]
+    assert {'partitions', 'transactions_2024'} <= {f[:-4] for f in os.listdir(sheets.path)}
+    _cold(db)
+    assert db.partition_years() == [2024]
+    assert db.load_user_transactions('anna')['betrag'].tolist() == [-5.0]
+
+
+def _archived_with_newer_booking(db):
+    _seed(db)
+    db.archive_years()
+    db.append_rows('transactions', [{'user': 'anna', 'id': 'neu', 'datum': f"{TODAY.year}-01-02",
+                                     'typ': 'Ausgabe', 'kategorie': 'Essen', 'betrag': -1.0}])
+
+
+def _ids(db):
+    return db.load_user_transactions('anna')['id'].tolist()
+
+
+def test_undo_edit_in_partition(db):
+    _archived_with_newer_booking(db)
+    assert db.update_transaction('t2015', 'anna', '2015-03-01', {'betrag': -99.0})
+    assert db.undo_last('anna') == 1
+    df = db.load_user_transactions('anna').set_index('id')
+    assert df.at['t2015', 'betrag'] == -15.0
+    assert 'neu' in df.index
+    assert db.balance_at('anna')['bank'] == -sum(y - 2000 for y in YEARS) - 1.0
+
+
+def test_undo_move_out_of_partition(db):
+    _archived_with_newer_booking(db)
+    assert db.update_transaction('t2015', 'anna', '2015-03-01', {'datum': str(TODAY)})
+    assert db.load_user_transactions('anna').set_index('id').at['t2015', 'datum'] == str(TODAY)
+    assert db.undo_last('anna') == 2
+    assert sorted(_ids(db)) == sorted([f"t{y}" for y in YEARS] + ['neu'])
+    assert db.load_user_transactions('anna').set_index('id').at['t2015', 'datum'] == '2015-03-01'
+
+    _cold(db)
+    assert sorted(_ids(db)) == sorted([f"t{y}" for y in YEARS] + ['neu'])
+    assert db.balance_at('anna')['bank'] == -sum(y - 2000 for y in YEARS) - 1.0
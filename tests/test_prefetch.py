@@ -0,0 +1,12 @@
+import logging
+
+
+def test_prefetch_loads_session_sheets_and_logs_timings(db, caplog):
+    db.append_rows('goals', [{'user': 'anna', 'sparziel': 100.0}])
+    db._gs_invalidate(*list(db._cache))
+    with caplog.at_level(logging.INFO, logger='database'):
+        result = db.prefetch(db.session_sheets('anna'))
+    assert result['sheets'] == len(db.SESSION_SHEETS)
+    assert set(db.session_sheets('anna')) <= set(db._cache)
+    assert f"Prefetch: {result['sheets']} Worksheets" in caplog.text
+    assert db.prefetch(db.session_sheets('anna'))['sheets'] == 0
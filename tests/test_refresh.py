@@ -0,0 +1,54 @@
+import pytest
+
+from storage import SQLiteBackend
+
+GOALS = [{'user': 'anna', 'sparziel': 100.0}, {'user': 'ben', 'sparziel': 200.0}, {'user': 'cara', 'sparziel': 300.0}]
+
+
+@pytest.fixture
+def other(db):
+    # Zweiter Prozess auf derselben Datenbank
+    db.append_rows('goals', GOALS)
+    db._gs_invalidate('goals')
+    db._gs_read('goals')
+    return SQLiteBackend(db._backend.path)
+
+
+def test_refresh_detects_non_tail_edit(db, other):
+    other.patch_many('goals', [([0], {'sparziel': 150.0})], ['user', 'sparziel'])
+    assert db.refresh('goals') == 'full'
+    assert db._gs_read('goals')['sparziel'].tolist() == [150.0, 200.0, 300.0]
+    assert db.refresh('goals') == 'none'
+
+
+def test_refresh_reads_only_the_tail_after_appends(db, other):
+    other.append('goals', db.backend.read('goals').iloc[[0]].assign(user='dora'))
+    assert db.refresh('goals') == 'tail'
+    assert db._gs_read('goals')['user'].tolist() == ['anna', 'ben', 'cara', 'dora']
+
+
+def test_own_writes_keep_the_marker(db, other):
+    db.patch_rows('goals', [1], {'sparziel': 250.0})
+    db.append_rows('goals', [{'user': 'dora', 'sparziel': 50.0}])
+    assert db.refresh('goals') == 'none'
+    other.patch_many('goals', [([3], {'sparziel': 75.0})], ['user', 'sparziel'])
+    assert db.refresh('goals') == 'full'
+    assert db._gs_read('goals')['sparziel'].tolist() == [100.0, 250.0, 300.0, 75.0]
+
+
+def test_backend_without_marker_reads_fully_in_intervals(db, other, monkeypatch):
+    monkeypatch.setattr(db._backend, 'marker', lambda ws: None)
+    other.patch_many('goals', [([0], {'sparziel': 150.0})], ['user', 'sparziel'])
+    assert db.refresh('goals') == 'none'
+    monkeypatch.setitem(db._full_at, 'goals', 0)
+    assert db.refresh('goals') == 'full'
+    assert db._gs_read('goals')['sparziel'].tolist()[0] == 150.0
+
+
+def test_refresh_detects_edit_of_checkpoint_sheet(db, other):
+    db.append_rows('transactions', [{'user': 'anna', 'id': 't1', 'datum': '2024-05-01', 'typ': 'Ausgabe',
+                                     'kategorie': 'Essen', 'betrag': -5.0}])
+    db.checkpoint('transactions', min_events=1)
+    other.patch_many('transactions', [([0], {'betrag': -7.0})], list(db.backend.read('transactions').columns))
+    assert db.refresh('transactions') == 'full'
+    assert db._gs_read('transactions')['betrag'].tolist() == [-7.0]
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import BackendUnavailable, Scheduler, TokenBucket
+
+
+class _ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"[{code}]")
+        self.code = code
+
+
+def _flaky(*errors, result='ok'):
+    # Wirft die Fehler der Reihe nach, danach kommt result
+    calls = []
+
+    def fn(*args):
+        calls.append(args)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+def _scheduler(**kw):
+    return Scheduler(**{'rate_per_minute': 0, 'base_delay': 0.001, 'max_delay': 0.001, **kw})
+
+
+def test_token_bucket_throttles_after_burst():
+    bucket = TokenBucket(rate_per_minute=600, burst=2)
+    assert bucket.acquire() == bucket.acquire() == 0.0
+    t0 = time.monotonic()
+    assert bucket.acquire() > 0
+    assert time.monotonic() - t0 >= 0.05
+
+
+def test_buckets_are_per_shard_and_direction():
+    s = _scheduler(rate_per_minute=60, burst=1)
+    for kind, ws in [('read', 'goals'), ('write', 'goals'), ('read', 'goals@s1')]:
+        s.call(kind, lambda ws: None, ws)
+    assert s.stats()['throttled'] == 0
+    assert len(s.buckets) == 3
+
+
+def test_singleflight_shares_one_read():
+    s, release, calls = _scheduler(), threading.Event(), []
+
+    def read(ws):
+        calls.append(ws)
+        release.wait(5)
+        return ws.upper()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(s.call('read', read, 'goals'))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 5
+    while s.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == ['goals'] and results == ['GOALS'] * 5
+    assert s.stats()['coalesced'] == 4
+    assert s.call('read', read, 'goals') == 'GOALS' and len(calls) == 2
+
+
+def test_quota_errors_are_retried():
+    s = _scheduler()
+    fn, calls = _flaky(_ApiError(429), _ApiError(429))
+    assert s.call('append', fn, 'goals') == 'ok'
+    assert len(calls) == 3 and s.stats()['retries'] == 2
+
+
+def test_server_errors_retry_only_idempotent_calls():
+    s = _scheduler(max_retries=2)
+    fn, calls = _flaky(_ApiError(503))
+    with pytest.raises(_ApiError):
+        s.call('append', fn, 'goals')
+    assert len(calls) == 1
+
+    fn, calls = _flaky(*[_ApiError(503)] * 3)
+    with pytest.raises(BackendUnavailable):
+        s.call('write', fn, 'goals')
+    assert len(calls) == 3
+    assert s.stats()['failures'] == 2
+
+
+def test_other_errors_pass_through():
+    s = _scheduler()
+    fn, calls = _flaky(KeyError('user'))
+    with pytest.raises(KeyError):
+        s.call('read', fn, 'goals')
+    assert len(calls) == 1 and s.stats()['retries'] == 0
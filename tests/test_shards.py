@@ -0,0 +1,74 @@
+import pytest
+
+
+def _signup(db, user, shard=''):
+    db.append_rows('users', [{'name': user.title(), 'username': user, 'email': f"{user}@example.org", 'shard': shard}])
+
+
+def _fill(db, user):
+    shard = db.shard_of(user)
+    db.append_rows(db._on('transactions', shard), [
+        {'user': user, 'datum': d, 'timestamp': f"{d} 10:00", 'typ': t, 'kategorie': 'x', 'betrag': b, 'notiz': ''}
+        for d, t, b in [('2019-05-01', 'Einnahme', 1000.0), ('2019-07-01', 'Depot', -300.0),
+                        (f"{db.live_since().year}-02-01", 'Ausgabe', -40.0)]])
+    db.save_topf(user, 'Urlaub', 500.0, '🏖️')
+    db.save_goal(user, 250.0)
+    db.save_user_settings(user, currency='USD')
+    db.save_custom_cat(user, 'Ausgabe', 'Kino')
+    db.archive_years(shard=shard)
+
+
+def _state(db, user):
+    return {'tx': sorted(db.load_user_transactions(user)['id']), 'pots': [p['name'] for p in db.load_toepfe(user)],
+            'goal': db.load_goal(user), 'currency': db.load_user_settings(user)['currency'],
+            'cats': db.load_custom_cats(user, 'Ausgabe'), 'balance': db.balance_at(user)}
+
+
+def _cold(db):
+    db._gs_invalidate(*list(db._cache))
+    db._part_lru.clear()
+
+
+def test_assign_shard_picks_least_loaded(db, shards):
+    assert db.assign_shard() == ''
+    _signup(db, 'anna')
+    assert db.assign_shard() == 's1'
+    _signup(db, 'ben', 's1')
+    _signup(db, 'cara', 's1')
+    assert db.shard_load() == {'': 1, 's1': 2}
+    assert db.assign_shard() == ''
+
+
+def test_move_user_keeps_data(db, shards):
+    _signup(db, 'anna')
+    _signup(db, 'ben')
+    _fill(db, 'anna')
+    _fill(db, 'ben')
+    before = _state(db, 'anna')
+    assert db.partition_years('') == [2019]
+
+    assert db.move_user('anna', 's1') > 0
+    _cold(db)
+    assert db.shard_of('anna') == 's1'
+    assert _state(db, 'anna') == before
+    assert db.partition_years('s1') == [2019]
+    for ws in db._user_sheets(''):
+        assert db.user_rows(ws, 'anna').empty, ws
+    assert len(db.load_user_transactions('ben')) == 3
+    assert db.move_user('anna', 's1') == 0
+    with pytest.raises(ValueError):
+        db.move_user('anna', 's9')
+
+
+def test_rebalance_evens_out_shards(db, shards):
+    for u in ('anna', 'ben', 'cara', 'dora'):
+        _signup(db, u)
+        _fill(db, u)
+    states = {u: _state(db, u) for u in ('anna', 'ben', 'cara', 'dora')}
+    assert db.rebalance(dry_run=True) == [('dora', '', 's1'), ('cara', '', 's1')]
+    assert db.shard_load() == {'': 4, 's1': 0}
+
+    assert len(db.rebalance()) == 2
+    _cold(db)
+    assert db.shard_load() == {'': 2, 's1': 2}
+    assert {u: _state(db, u) for u in states} == states
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from storage import SQLiteBackend
+
+pytest.importorskip('pyarrow')
+from snapshot import SnapshotStore  # noqa: E402
+
+GOALS = [{'user': 'anna', 'sparziel': 100.0}, {'user': 'ben', 'sparziel': 200.0}]
+
+
+@pytest.fixture
+def snaps(db, tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path / 'snap'), db._snapshot_entry)
+    monkeypatch.setattr(db, '_snapshots', store)
+    db.append_rows('goals', GOALS)
+    db._gs_invalidate('goals')
+    db._gs_read('goals')
+    store.flush()
+    return store
+
+
+def _restart(db):
+    # Kaltstart: Cache und Abgleich-Stand weg, der Snapshot bleibt liegen
+    with db._cache_lock:
+        for state in (db._cache, db._fetched, db._markers, db._full_at):
+            state.pop('goals', None)
+
+
+def _settle(db):
+    deadline = time.monotonic() + 5
+    while db._revalidating and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_snapshot_keeps_the_marker(db, snaps):
+    _restart(db)
+    before = db.remote_version()
+    assert db._gs_read('goals')['sparziel'].tolist() == [100.0, 200.0]
+    assert snaps.stats['hits'] == 1
+    _settle(db)
+    # Unverändert: der Abgleich kostet nur die Marken-Abfrage, kein Rerun
+    assert db.remote_version() == before
+    assert db.refresh('goals') == 'none'
+
+
+def test_snapshot_revalidation_sees_remote_edit(db, snaps):
+    _restart(db)
+    SQLiteBackend(db._backend.path).patch_many('goals', [([0], {'sparziel': 150.0})], ['user', 'sparziel'])
+    before = db.remote_version()
+    assert db._gs_read('goals')['sparziel'].tolist() == [100.0, 200.0]
+    _settle(db)
+    assert db.remote_version() == before + 1
+    assert db._gs_read('goals')['sparziel'].tolist() == [150.0, 200.0]
@@ -3,7 +3,6 @@ import datetime
 import re
 import smtplib
 import random
-import pandas as pd
 import streamlit as st
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -61,16 +60,6 @@ def format_timestamp(ts_str, datum_str):
             return str(datum_str)
 
 
-def find_row_mask(df, row):
-    return (
-        (df['user'] == row['user']) &
-        (df['datum'].astype(str) == str(row['datum'])) &
-        (pd.to_numeric(df['betrag'], errors='coerce') == pd.to_numeric(row['betrag'], errors='coerce')) &
-        (df['kategorie'] == row['kategorie']) &
-        (~df['deleted'].astype(str).str.strip().str.lower().isin(['true', '1', '1.0']))
-    )
-
-
 def send_email(to_email, subject, html_content):
     try:
         sender = st.secrets["email"]["sender"]
@@ -0,0 +1,178 @@
+"""
+Write-Ahead-Log für Backend-Schreibzugriffe.
+Jeder Flush der Datenschicht landet als ein Batch in einer lokalen SQLite-Datei
+(synchronous=FULL, also ein fsync pro Batch) und ist damit sofort dauerhaft. Ein
+Hintergrund-Thread spielt die Batches der Reihe nach ins Backend ein und löscht
+jede Operation erst nach Erfolg. Nach einem Absturz läuft das beim nächsten Start
+weiter – ein Multi-Sheet-Vorgang kommt also ganz oder (vorerst) gar nicht an.
+
+Einstellungen in .streamlit/secrets.toml:
+    [storage]
+    wal_path = ".journal/wal.db"    # '' schaltet ab (Default bei SQLite)
+"""
+import collections
+import json
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+from scheduler import BackendUnavailable, retriable
+
+
+def _plain(v):
+    # numpy-Skalare, Timestamps & Co. als JSON-Werte
+    if hasattr(v, 'item'):
+        return v.item()
+    return str(v)
+
+
+def encode(kind, args):
+    if kind == 'patch_many':
+        patches, columns = args
+        return json.dumps({'patches': [[[int(k) for k in keys], changes] for keys, changes in patches],
+                           'columns': list(columns)}, default=_plain)
+    df = args[0]
+    return json.dumps({'columns': [str(c) for c in df.columns],
+                       'rows': df.astype(object).where(df.notna(), None).values.tolist()}, default=_plain)
+
+
+def decode(kind, payload):
+    p = json.loads(payload)
+    if kind == 'patch_many':
+        return [(keys, changes) for keys, changes in p['patches']], p['columns']
+    return (pd.DataFrame(p['rows'], columns=p['columns'], dtype=object),)
+
+
+class WriteAheadLog:
+    def __init__(self, path, apply, on_dead):
+        """
+        apply(kind, ws, args, retry) schreibt eine Operation ins Backend; retry=True heißt,
+        ein früherer Versuch ist mit unklarem Ausgang abgebrochen. on_dead(ws) wird gerufen,
+        wenn eine Operation endgültig scheitert und in die Tabelle dead verschoben wurde.
+        """
+        self.path     = path
+        self.apply    = apply
+        self.on_dead  = on_dead
+        self.stats    = {'batches': 0, 'ops': 0, 'replayed': 0, 'retries': 0, 'dead': 0}
+        self._lock    = threading.Lock()
+        self._replay  = threading.Lock()
+        self._wake    = threading.Event()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        for table in ('ops', 'dead'):
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                             "batch INTEGER, kind TEXT, ws TEXT, payload TEXT, attempts INTEGER DEFAULT 0, error TEXT)")
+        self._pending = collections.Counter(
+            dict(self._db.execute("SELECT ws, COUNT(*) FROM ops GROUP BY ws").fetchall()))
+        if self._pending:
+            self._wake.set()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def recovered(self):
+        """Worksheets mit Operationen, die ein früherer Prozess nicht mehr einspielen konnte."""
+        with self._lock:
+            return set(self._pending)
+
+    def pending(self, ws=None):
+        with self._lock:
+            return self._pending[ws] if ws is not None else sum(self._pending.values())
+
+    def append(self, ops):
+        """Schreibt [(kind, ws, args)] als einen Batch (eine Transaktion, ein fsync)."""
+        rows = [(kind, ws, encode(kind, args)) for kind, ws, args in ops]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                batch = (self._db.execute("SELECT COALESCE(MAX(batch), 0) + 1 FROM ops").fetchone()[0])
+                self._db.executemany("INSERT INTO ops (batch, kind, ws, payload) VALUES (?, ?, ?, ?)",
+                                     [(batch,) + r for r in rows])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            for _, ws, _ in rows:
+                self._pending[ws] += 1
+            self.stats['batches'] += 1
+            self.stats['ops']     += len(rows)
+        self._wake.set()
+
+    def _done(self, seq, ws, dead=None):
+        with self._lock:
+            if dead is not None:
+                self._db.execute("INSERT INTO dead (batch, kind, ws, payload, attempts, error) "
+                                 "SELECT batch, kind, ws, payload, attempts, ? FROM ops WHERE seq = ?", (dead, seq))
+                self.stats['dead'] += 1
+            else:
+                self.stats['replayed'] += 1
+            self._db.execute("DELETE FROM ops WHERE seq = ?", (seq,))
+            self._pending[ws] -= 1
+            if self._pending[ws] <= 0:
+                del self._pending[ws]
+
+    def replay(self):
+        """Spielt alle offenen Batches ein. Bricht beim ersten vorübergehenden Fehler ab (raise)."""
+        with self._replay:
+            while True:
+                with self._lock:
+                    row = self._db.execute("SELECT MIN(batch) FROM ops").fetchone()
+                    if row[0] is None:
+                        return
+                    # Vor dem Call hochzählen: bricht der Prozess mitten im Call ab, ist das sichtbar
+                    self._db.execute("UPDATE ops SET attempts = attempts + 1 WHERE batch = ?", (row[0],))
+                    ops = self._db.execute("SELECT seq, kind, ws, payload, attempts FROM ops "
+                                           "WHERE batch = ? ORDER BY seq", (row[0],)).fetchall()
+                by_ws = collections.defaultdict(list)
+                for op in ops:
+                    by_ws[op[2]].append(op)
+                # Worksheets eines Batches sind unabhängig, innerhalb eines Worksheets gilt die Reihenfolge
+                errors  = []
+                threads = [threading.Thread(target=self._run, args=(group, errors)) for group in by_ws.values()]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                if errors:
+                    raise errors[0]
+
+    def _run(self, group, errors):
+        for seq, kind, ws, payload, attempts in group:
+            try:
+                self.apply(kind, ws, decode(kind, payload), attempts > 1)
+            except Exception as e:
+                if isinstance(e, BackendUnavailable) or retriable(e, True):
+                    errors.append(e)
+                    return
+                # Kein Netz-/Quota-Problem – Wiederholen hilft nicht, Operation beiseitelegen
+                self._done(seq, ws, dead=repr(e))
+                self.on_dead(ws)
+                continue
+            self._done(seq, ws)
+
+    def _worker(self):
+        delay = 1.0
+        while True:
+            self._wake.wait(timeout=delay if self.pending() else None)
+            self._wake.clear()
+            try:
+                self.replay()
+                delay = 1.0
+            except Exception:
+                with self._lock:
+                    self.stats['retries'] += 1
+                delay = min(delay * 2, 60.0)
+
+    def dead(self):
+        """Endgültig gescheiterte Operationen (zur Diagnose)."""
+        with self._lock:
+            return self._db.execute("SELECT seq, batch, kind, ws, attempts, error FROM dead ORDER BY seq").fetchall()
+
+
+def create_wal(config, apply, on_dead, default_on):
+    """Write-Ahead-Log laut storage.wal_path ('' schaltet ab)."""
+    path = config.get('wal_path', os.environ.get('BALANCELY_WAL', os.path.join('.journal', 'wal.db') if default_on else ''))
+    if not path:
+        return None
+    return WriteAheadLog(path, apply, on_dead)